@@ -0,0 +1,94 @@
+"""Local stand-in for the datamart postdb and SendMail endpoints.
+
+Every request waits --latency seconds plus a uniform random --jitter and fails
+with --error-status for the --error-rate share of requests. postdb returns a
+one page PDF. Start it and point the site to it:
+
+    python benchmarks/datamart_stub.py --port 8001 --latency 0.3 --error-rate 0.01
+    DATAMART_URL=http://127.0.0.1:8001/api/doctemplate/ python manage.py runserver
+"""
+import argparse
+import base64
+import json
+import random
+import signal
+import sys
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+PDF = (b'%PDF-1.4\n1 0 obj<</Type/Catalog/Pages 2 0 R>>endobj\n'
+       b'2 0 obj<</Type/Pages/Kids[3 0 R]/Count 1>>endobj\n'
+       b'3 0 obj<</Type/Page/Parent 2 0 R/MediaBox[0 0 595 842]>>endobj\n'
+       b'trailer<</Root 1 0 R>>\n%%EOF\n')
+
+
+class DatamartHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    options = None
+    stats = Counter()
+    lock = threading.Lock()
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get('Content-Length') or 0))
+        endpoint = self.path.rstrip('/').rsplit('/', 1)[-1]
+        time.sleep(max(0.0, self.options.latency + random.uniform(-self.options.jitter, self.options.jitter)))
+        if endpoint not in ('postdb', 'SendMail'):
+            self.respond(404, {'Error': 'Unknown endpoint'})
+        elif random.random() < self.options.error_rate:
+            self.respond(self.options.error_status, {'Error': 'Stub failure'})
+        else:
+            try:
+                json.loads(body or b'{}')
+            except ValueError:
+                self.respond(400, {'Error': 'Invalid JSON'})
+                return
+            if endpoint == 'postdb':
+                self.respond(200, {'Data': base64.b64encode(PDF).decode()})
+            else:
+                self.respond(200, {'Result': 'OK'})
+        with self.lock:
+            self.stats[endpoint, self.last_status] += 1
+
+    def respond(self, status, data):
+        content = json.dumps(data).encode()
+        self.last_status = status
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def log_message(self, format, *args):
+        if self.options.verbose:
+            super().log_message(format, *args)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8001)
+    parser.add_argument('--latency', type=float, default=0.2, help='Mean response time in seconds')
+    parser.add_argument('--jitter', type=float, default=0.05, help='Maximum deviation from --latency')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Share of failed requests, 0..1')
+    parser.add_argument('--error-status', type=int, default=503)
+    parser.add_argument('--verbose', action='store_true', help='Log every request')
+    DatamartHandler.options = parser.parse_args()
+    server = ThreadingHTTPServer((DatamartHandler.options.host, DatamartHandler.options.port), DatamartHandler)
+    server.daemon_threads = True
+    # The request counts are printed on Ctrl+C and on kill as well
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    print('Datamart stub on http://%s:%s/api/doctemplate/' % server.server_address)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        for (endpoint, status), count in sorted(DatamartHandler.stats.items()):
+            print('%s %s: %s' % (endpoint, status, count))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,187 @@
+"""Drives the whole approval flow against a running site with concurrent users.
+
+Every user logs in, then repeatedly submits a trip on the public form, finds
+it in the purchasing queue, approves it in each department of the default
+workflow and downloads both documents. The user needs the permissions of all
+departments, start the site with the datamart stub for repeatable numbers:
+
+    python benchmarks/load_test.py --url http://127.0.0.1:8000 --username admin --password admin \\
+        --users 10 --duration 60
+
+Requests per second and latency percentiles per step are printed as JSON.
+The exit status is 1 if any request failed, e.g. a download returned 500.
+"""
+import argparse
+import json
+import re
+import sys
+import threading
+import time
+from collections import defaultdict
+
+import requests
+
+LISTING_ROW = re.compile(r'data-href="/business_trips/purchasing_department/(\d+)">\s*<td>([^<]*)</td>')
+DEPUTY_GOVERNOR_OPTION = re.compile(r'<option value="(\d+)"')
+ORDER = {'full_name_genitive': 'Иванова И.И.', 'full_name': 'Иванова Ивана Ивановича',
+         'position': 'советника Губернатора Челябинской области', 'period': 'с 20 по 22 сентября 2019 года',
+         'location': 'г. Магнитогорск', 'purpose': 'проведением совещания'}
+
+
+class Stats:
+    def __init__(self):
+        self.timings = defaultdict(list)
+        self.errors = defaultdict(int)
+        self.lock = threading.Lock()
+
+    def record(self, step, elapsed, error):
+        with self.lock:
+            self.timings[step].append(elapsed)
+            self.errors[step] += int(error)
+
+    def report(self, elapsed):
+        steps = {}
+        for step, timings in sorted(self.timings.items()):
+            timings = sorted(timings)
+            steps[step] = {'count': len(timings), 'errors': self.errors[step],
+                           'p50': percentile(timings, 50), 'p90': percentile(timings, 90),
+                           'p99': percentile(timings, 99), 'max': timings[-1] * 1000}
+        total = sum(len(timings) for timings in self.timings.values())
+        return {'requests': total, 'errors': sum(self.errors.values()), 'seconds': elapsed,
+                'requests_per_second': total / elapsed if elapsed else 0, 'steps_ms': steps}
+
+
+def percentile(sorted_values, percent):
+    index = min(len(sorted_values) - 1, int(round(percent / 100 * (len(sorted_values) - 1))))
+    return sorted_values[index] * 1000
+
+
+class FlowError(Exception):
+    pass
+
+
+class User:
+    def __init__(self, number, options, stats):
+        self.number = number
+        self.options = options
+        self.stats = stats
+        self.session = requests.Session()
+        self.iteration = 0
+
+    def request(self, step, method, path, expected=(200, 302), **kwargs):
+        if method == 'POST':
+            kwargs.setdefault('data', {})['csrfmiddlewaretoken'] = self.session.cookies.get('csrftoken', '')
+        started = time.perf_counter()
+        try:
+            response = self.session.request(method, self.options.url + path, allow_redirects=False,
+                                            timeout=self.options.timeout, **kwargs)
+            error = response.status_code not in expected
+        except requests.RequestException as e:
+            self.stats.record(step, time.perf_counter() - started, True)
+            raise FlowError('%s: %r' % (step, e))
+        self.stats.record(step, time.perf_counter() - started, error)
+        if error:
+            raise FlowError('%s: HTTP %s' % (step, response.status_code))
+        return response
+
+    def login(self):
+        self.request('login_form', 'GET', '/login/')
+        self.request('login', 'POST', '/login/', data={'username': self.options.username,
+                                                      'password': self.options.password})
+
+    def submit(self):
+        self.iteration += 1
+        second_name = 'Нагрузка%s_%s' % (self.number, self.iteration)
+        self.request('form', 'GET', '/')
+        self.request('submit', 'POST', '/', data={
+            'second_name': second_name, 'first_name': 'Иван', 'patronymic': 'Иванович',
+            'position': 'советник Губернатора Челябинской области', 'location': 'г. Магнитогорск',
+            'purpose': 'проведением совещания', 'start_date': '2019-09-20', 'end_date': '2019-09-22',
+            'departure_date_limit': '10-00', 'arrival_date_limit': '14-00', 'who_pays_the_trip': 'GOVERNMENT',
+            'receiving_funds': 'SALARY_CARD', 'transport_type': 'Самолёт', 'hotel_days': '2',
+            'pd-series': '1234', 'pd-number': '123456', 'pd-issued': 'Выдан', 'pd-date': '2012-07-12',
+            'pd-code': '700'})
+        response = self.request('listing', 'GET', '/business_trips/', params={
+            'queue': 'purchasing_department', 'status': 'new', 'page_size': 100})
+        for pk, name in LISTING_ROW.findall(response.text):
+            if name.startswith(second_name + ' '):
+                return pk
+        raise FlowError('listing: the submitted trip is not in the purchasing queue')
+
+    def approve(self, pk):
+        self.request('purchasing_department', 'GET', '/business_trips/purchasing_department/%s/' % pk)
+        self.request('purchasing_department_complete', 'POST', '/business_trips/purchasing_department/%s/' % pk,
+                     data={'fare': '1000', 'daily_allowance': '200', 'hotel_cost': '400', 'action': 'complete'})
+        response = self.request('head_of_department', 'GET', '/business_trips/head_of_department/%s/' % pk)
+        deputy_governors = DEPUTY_GOVERNOR_OPTION.findall(response.text)
+        if not deputy_governors:
+            raise FlowError('head_of_department: no deputy governors')
+        self.request('head_of_department_complete', 'POST', '/business_trips/head_of_department/%s/' % pk,
+                     data={'deputy_governor': deputy_governors[0], 'action': 'complete'})
+        self.request('deputy_governor', 'GET', '/business_trips/deputy_governor/%s/' % pk)
+        self.request('deputy_governor_complete', 'POST', '/business_trips/deputy_governor/%s/' % pk,
+                     data=dict(ORDER, action='complete'))
+        self.request('personnel_department', 'GET', '/business_trips/personnel_department/%s/' % pk)
+        self.request('personnel_department_complete', 'POST', '/business_trips/personnel_department/%s/' % pk,
+                     data={'action': 'complete'}, files={'upload': ('order.pdf', b'%PDF-1.4', 'application/pdf')})
+        self.request('bookkeeping', 'GET', '/business_trips/bookkeeping/%s/' % pk)
+        self.request('bookkeeping_complete', 'POST', '/business_trips/bookkeeping/%s/' % pk,
+                     data={'action': 'complete'})
+
+    def download(self, pk):
+        for document_type in ('order', 'funding_application'):
+            self.request('download_%s' % document_type, 'GET', '/download/%s/%s/' % (pk, document_type),
+                         expected=(200,))
+
+    def run(self, deadline, iterations):
+        try:
+            self.login()
+        except FlowError as e:
+            print('user %s: %s' % (self.number, e))
+            return
+        while time.monotonic() < deadline and (not iterations or self.iteration < iterations):
+            try:
+                pk = self.submit()
+                self.approve(pk)
+                self.download(pk)
+            except FlowError as e:
+                if self.options.verbose:
+                    print('user %s: %s' % (self.number, e))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--url', default='http://127.0.0.1:8000')
+    parser.add_argument('--username', required=True)
+    parser.add_argument('--password', required=True)
+    parser.add_argument('--users', type=int, default=10)
+    parser.add_argument('--duration', type=float, default=60, help='Seconds to run')
+    parser.add_argument('--iterations', type=int, default=0, help='Flows per user, 0 runs until --duration')
+    parser.add_argument('--timeout', type=float, default=60, help='Seconds per request')
+    parser.add_argument('--output', help='JSON file, printed to stdout by default')
+    parser.add_argument('--verbose', action='store_true', help='Print failed flows')
+    options = parser.parse_args()
+    options.url = options.url.rstrip('/')
+
+    stats = Stats()
+    started = time.monotonic()
+    deadline = started + options.duration
+    threads = [threading.Thread(target=User(number, options, stats).run, args=(deadline, options.iterations))
+               for number in range(options.users)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    report = stats.report(time.monotonic() - started)
+    output = json.dumps(report, indent=2, ensure_ascii=False)
+    if options.output:
+        with open(options.output, 'w') as f:
+            f.write(output)
+    else:
+        print(output)
+    if report['errors']:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,92 @@
+"""Compares the lazy and the preloaded pymorphy2 analyzer.
+
+For every mode a fresh master process imports business_trip.wsgi, then forks
+workers which inflect one word each, like the first request would. The
+script reports the master startup time and the memory of every worker
+(Linux only, read from /proc/<pid>/smaps_rollup):
+
+    python benchmarks/morphology_startup.py --workers 4
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def read_memory(pid):
+    memory = {}
+    with open('/proc/%s/smaps_rollup' % pid) as f:
+        for line in f:
+            parts = line.split()
+            if parts[0] in ('Rss:', 'Pss:', 'Private_Clean:', 'Private_Dirty:'):
+                memory[parts[0][:-1].lower()] = int(parts[1])
+    memory['private'] = memory.pop('private_clean') + memory.pop('private_dirty')
+    return memory
+
+
+def run_master(workers):
+    """Body of the master process, the mode is set through the environment."""
+    started = time.perf_counter()
+    import business_trip.wsgi  # noqa: F401
+    startup = time.perf_counter() - started
+
+    from core.morphology import get_morphed_word
+    results = []
+    for _ in range(workers):
+        read_fd, write_fd = os.pipe()
+        pid = os.fork()
+        if pid == 0:
+            os.close(read_fd)
+            started = time.perf_counter()
+            get_morphed_word('сентябрь', 'gent')
+            first_call = time.perf_counter() - started
+            memory = read_memory(os.getpid())
+            memory['first_call'] = first_call
+            os.write(write_fd, json.dumps(memory).encode())
+            os._exit(0)
+        os.close(write_fd)
+        with os.fdopen(read_fd) as f:
+            results.append(json.loads(f.read()))
+        os.waitpid(pid, 0)
+    print(json.dumps({'startup': startup, 'master': read_memory(os.getpid()), 'workers': results}))
+
+
+def run_mode(preload, workers):
+    env = dict(os.environ, DJANGO_SETTINGS_MODULE='business_trip.settings',
+               MORPHOLOGY_BENCHMARK_PRELOAD='1' if preload else '')
+    output = subprocess.check_output([sys.executable, __file__, '--master', '--workers', str(workers)],
+                                     cwd=BASE_DIR, env=env)
+    return json.loads(output.decode().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--master', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.master:
+        sys.path.insert(0, BASE_DIR)
+        from django.conf import settings
+        import django
+        django.setup()
+        settings.MORPHOLOGY_PRELOAD = bool(os.environ.get('MORPHOLOGY_BENCHMARK_PRELOAD'))
+        run_master(args.workers)
+        return
+
+    for mode, preload in (('lazy', False), ('preload', True)):
+        result = run_mode(preload, args.workers)
+        workers = result['workers']
+        print('%-8s startup %.3fs, master rss %d kB, first call %.3fs, worker pss %d kB, private %d kB' % (
+            mode, result['startup'], result['master']['rss'],
+            sum(w['first_call'] for w in workers) / len(workers),
+            sum(w['pss'] for w in workers) / len(workers),
+            sum(w['private'] for w in workers) / len(workers)))
+
+
+if __name__ == '__main__':
+    main()
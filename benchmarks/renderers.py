@@ -0,0 +1,111 @@
+"""Compares the throughput of the document renderers.
+
+Every renderer renders --count distinct order and funding application
+payloads on --threads threads, the document cache is not involved. The
+datamart renderer talks to DATAMART_URL, start the stub for repeatable
+numbers; the local one needs reportlab:
+
+    python benchmarks/datamart_stub.py --latency 0.3 &
+    DATAMART_URL=http://127.0.0.1:8001/api/doctemplate/ python benchmarks/renderers.py --count 200 --threads 1 4
+
+Documents per second, latency percentiles in milliseconds and the mean
+document size are printed as JSON.
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RENDERERS = ['core.renderers.DatamartRenderer', 'core.renderers.LocalPdfRenderer']
+
+
+def get_payloads(count):
+    payloads = []
+    for number in range(count):
+        if number % 2:
+            payloads.append({
+                'BlankTarget': 'Распоряжение', 'Adresat': '', 'Theme': 'О командировании Иванова И.И. %s' % number,
+                'DocContent': 'Командировать Иванова Ивана Ивановича, советника Губернатора Челябинской области, '
+                              'с 20 по 22 сентября 2019 года в г. Магнитогорск в связи с проведением совещания',
+                'AuthorPost': 'Первый заместитель Губернатора Челябинской области', 'Author': 'В.В. Мамин'})
+        else:
+            payloads.append({
+                'BlankTarget': 'Заявка', 'Adresat': 'Первому заместителю Губернатора<br/>В.В. Мамину',
+                'Theme': 'Заявка на финансирование командировки',
+                'DocContent': 'Для командировки в г. Магнитогорск с 20 по 22 сентября 2019 года прошу выдать '
+                              'денежные средства в размере:\n 1. Транспортные расходы - %s руб.\n'
+                              '2. Проживание в гостинице - 4000 руб.\n3. Суточные - 2 суток - 400 руб.\n' % number,
+                'AuthorPost': 'советник Губернатора Челябинской области', 'Author': 'Иванов И.И.'})
+    return payloads
+
+
+def percentile(sorted_values, percent):
+    return sorted_values[min(len(sorted_values) - 1, int(round(percent / 100 * (len(sorted_values) - 1))))] * 1000
+
+
+def run(renderer, payloads, threads):
+    def render(data):
+        started = time.perf_counter()
+        try:
+            size = len(renderer.render(data))
+        except Exception:
+            return time.perf_counter() - started, None
+        return time.perf_counter() - started, size
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        results = list(executor.map(render, payloads))
+    elapsed = time.perf_counter() - started
+    timings = sorted(timing for timing, size in results)
+    sizes = [size for timing, size in results if size is not None]
+    return {'documents': len(sizes), 'errors': len(results) - len(sizes), 'seconds': elapsed,
+            'documents_per_second': len(sizes) / elapsed, 'p50': percentile(timings, 50),
+            'p95': percentile(timings, 95), 'max': timings[-1] * 1000,
+            'mean_size': statistics.mean(sizes) if sizes else 0}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--count', type=int, default=100, help='Documents per run')
+    parser.add_argument('--threads', type=int, nargs='+', default=[1, 4])
+    parser.add_argument('--renderers', nargs='+', default=RENDERERS, help='Dotted paths of the renderer classes')
+    parser.add_argument('--output', help='JSON file, printed to stdout by default')
+    args = parser.parse_args()
+
+    sys.path.insert(0, BASE_DIR)
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'business_trip.settings')
+    import django
+    django.setup()
+    from django.core.exceptions import ImproperlyConfigured
+    from django.utils.module_loading import import_string
+
+    payloads = get_payloads(args.count)
+    results = {}
+    for path in args.renderers:
+        try:
+            renderer = import_string(path)()
+        except ImproperlyConfigured as e:
+            print('%s skipped: %s' % (path, e), file=sys.stderr)
+            continue
+        # The first document loads fonts and opens connections, it is not measured
+        try:
+            renderer.render(payloads[0])
+        except Exception as e:
+            print('%s skipped: %r' % (path, e), file=sys.stderr)
+            continue
+        results[renderer.name] = {str(threads): run(renderer, payloads, threads) for threads in args.threads}
+
+    report = json.dumps(results, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(report)
+    else:
+        print(report)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,134 @@
+"""Times the hot paths on generated data of growing size.
+
+The trips are generated by core.generator into a separate SQLite database,
+which grows from one size to the next. Every case runs --repeat times and
+its min, median and p95 wall time in milliseconds are written as JSON
+together with the commit, so runs on different commits can be compared:
+
+    python benchmarks/suite.py --sizes 10000 100000 1000000 --output benchmark.json
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+WORDS = ['сентябрь', 'советник', 'Губернатор', 'Челябинская', 'область', 'Иванов', 'Иван', 'Иванович']
+
+
+def measure(func, repeat):
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        timings.append((time.perf_counter() - started) * 1000)
+    timings.sort()
+    return {'min': timings[0], 'median': statistics.median(timings),
+            'p95': timings[min(len(timings) - 1, int(len(timings) * 0.95))]}
+
+
+def get(client, url):
+    def request():
+        response = client.get(url)
+        assert response.status_code == 200, (url, response.status_code)
+    return request
+
+
+def get_cases(client):
+    from core.documents import fill_order_template, fill_funding_application_template
+    from core.models import Departments, BusinessTrip, BusinessTripState, Order, ApplicationFunding
+    from core.morphology import get_morphed_word, inflection_cache
+    from core.pagination import KeysetPaginator
+
+    cases = {}
+    for department in ['all'] + [department.lower() for department in Departments.get_departments()]:
+        cases['management:%s' % department] = get(client, '/business_trips/?queue=%s' % department)
+    ids = BusinessTrip.objects.order_by('id').values_list('id', flat=True)
+    middle = ids[ids.count() // 2]
+    cursor = KeysetPaginator.encode_cursor(KeysetPaginator.NEXT, middle)
+    cases['management:all:middle_page'] = get(client, '/business_trips/?cursor=%s' % cursor)
+    for department in Departments.get_departments():
+        state = BusinessTripState.objects.filter(queues__contains=department).order_by('-business_trip').first()
+        if state is not None:
+            url = '/business_trips/%s/%s/' % (department.lower(), state.business_trip_id)
+            cases['department:%s' % department.lower()] = get(client, url)
+
+    def morphology_cold():
+        inflection_cache.clear()
+        for word in WORDS:
+            get_morphed_word(word, 'gent')
+
+    def morphology_warm():
+        for word in WORDS:
+            get_morphed_word(word, 'gent')
+
+    cases['morphology:cold'] = morphology_cold
+    cases['morphology:warm'] = morphology_warm
+    order = Order.objects.select_related('business_trip').last()
+    funding = ApplicationFunding.objects.select_related('business_trip').last()
+    if order is not None:
+        cases['documents:order'] = lambda: fill_order_template(order)
+    if funding is not None:
+        cases['documents:funding_application'] = lambda: fill_funding_application_template(funding)
+    return cases
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10000, 100000, 1000000])
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--database', default=os.path.join(BASE_DIR, 'benchmarks', 'benchmark.sqlite3'))
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--output', help='JSON file, printed to stdout by default')
+    args = parser.parse_args()
+
+    sys.path.insert(0, BASE_DIR)
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'business_trip.settings')
+    from django.conf import settings
+    settings.DATABASES['default']['NAME'] = args.database
+    import django
+    django.setup()
+    from django.contrib.auth.models import User
+    from django.core.management import call_command
+    from django.test import Client
+    from django.test.utils import setup_test_environment
+    from core.generator import generate_business_trips
+    from core.models import BusinessTrip
+
+    setup_test_environment()
+    if os.path.exists(args.database):
+        os.remove(args.database)
+    call_command('migrate', run_syncdb=True, verbosity=0)
+    user = User.objects.create_superuser('benchmark', 'benchmark@example.com', 'benchmark')
+    client = Client()
+    client.force_login(user)
+
+    results = {}
+    for size in sorted(args.sizes):
+        started = time.perf_counter()
+        generate_business_trips(size - BusinessTrip.objects.count(), seed=args.seed + size)
+        generation = time.perf_counter() - started
+        cases = get_cases(client)
+        results[str(size)] = {'generation_seconds': generation,
+                              'cases': {name: measure(case, args.repeat) for name, case in cases.items()}}
+        print('%s trips measured' % size, file=sys.stderr)
+
+    try:
+        commit = subprocess.check_output(['git', 'rev-parse', 'HEAD'], cwd=BASE_DIR).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    report = json.dumps({'commit': commit, 'python': platform.python_version(), 'repeat': args.repeat,
+                         'sizes': results}, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(report)
+    else:
+        print(report)
+
+
+if __name__ == '__main__':
+    main()
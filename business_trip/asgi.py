@@ -0,0 +1,24 @@
+"""
+ASGI config for business_trip project.
+
+Django 2.2 has no async views, so document downloads are served by
+core.asgi.DownloadApplication, which renders them on the event loop. The
+other requests are passed to the WSGI application through asgiref's
+WsgiToAsgi when asgiref is installed. WsgiToAsgi runs them in one thread,
+so in production route /download/ to this application and the rest to the
+WSGI server:
+
+    uvicorn business_trip.asgi:application --workers 2
+"""
+
+from business_trip.wsgi import application as wsgi_application
+from core.asgi import DownloadApplication
+
+try:
+    from asgiref.wsgi import WsgiToAsgi
+except ImportError:
+    fallback = None
+else:
+    fallback = WsgiToAsgi(wsgi_application)
+
+application = DownloadApplication(fallback)
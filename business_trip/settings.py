@@ -43,6 +43,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'core.middleware.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -132,3 +133,193 @@ MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
 
 MESSAGE_STORAGE = 'django.contrib.messages.storage.session.SessionStorage'
+
+
+# Morphology
+# The pymorphy2 analyzer is loaded on first use. With MORPHOLOGY_PRELOAD it is
+# loaded by business_trip.wsgi instead, so forked workers share it.
+# Inflections are cached in memory, MORPHOLOGY_CACHE_FILE (if set) is loaded
+# at worker start and stored back on exit, e.g. os.path.join(BASE_DIR, 'inflection_cache.json')
+
+MORPHOLOGY_PRELOAD = False
+
+MORPHOLOGY_CACHE_SIZE = 10000
+
+MORPHOLOGY_CACHE_FILE = None
+
+
+# Rendered documents cache, keyed by the hash of the template data
+
+DOCUMENT_CACHE_DIR = os.path.join(BASE_DIR, 'cache', 'documents')
+
+DOCUMENT_CACHE_MAX_SIZE = 500 * 1024 * 1024
+
+DOCUMENT_CACHE_MAX_AGE = 30 * 24 * 60 * 60
+
+
+# Document rendering backend (core.renderers). DatamartRenderer uses the datamart
+# postdb service, LocalPdfRenderer renders in process with reportlab and needs
+# a TrueType font with Cyrillic glyphs.
+
+DOCUMENT_RENDERER = 'core.renderers.DatamartRenderer'
+
+DOCUMENT_FONT_PATH = '/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf'
+
+DOCUMENT_FONT_SIZE = 12
+
+
+# Background document rendering (manage.py render_documents), delays in seconds.
+# A failed job is retried after RENDER_JOB_RETRY_DELAY * 2 ** (attempts - 1).
+
+RENDER_JOB_MAX_ATTEMPTS = 5
+
+RENDER_JOB_RETRY_DELAY = 30
+
+RENDER_JOB_MAX_RETRY_DELAY = 60 * 60
+
+RENDER_JOB_TIMEOUT = 5 * 60
+
+
+# Datamart HTTP client (core.utilities), timeouts in seconds.
+# The circuit opens after DATAMART_CIRCUIT_FAILURES consecutive failures
+# and lets a trial request through after DATAMART_CIRCUIT_RESET seconds.
+# The DATAMART_URL environment variable points the site to another service,
+# e.g. benchmarks/datamart_stub.py for load tests.
+
+DATAMART_URL = os.environ.get('DATAMART_URL', 'http://datamart.gov74.ru/api/doctemplate/')
+
+DATAMART_CONNECT_TIMEOUT = 3.05
+
+DATAMART_READ_TIMEOUT = 30
+
+DATAMART_RETRIES = 2
+
+DATAMART_RETRY_BACKOFF = 0.5
+
+DATAMART_POOL_SIZE = 10
+
+DATAMART_CIRCUIT_FAILURES = 5
+
+DATAMART_CIRCUIT_RESET = 30
+
+
+# ASGI document downloads (business_trip.asgi). At most ASYNC_RENDER_CONCURRENCY
+# documents are rendered at a time per process, the database work runs on
+# ASGI_DB_WORKERS threads.
+
+ASYNC_RENDER_CONCURRENCY = 50
+
+ASGI_DB_WORKERS = 10
+
+
+# Autocomplete endpoints (core.autocomplete). The index of every process adds
+# the rows saved by other processes every AUTOCOMPLETE_REFRESH_INTERVAL seconds
+# and is rebuilt in the background every AUTOCOMPLETE_REBUILD_INTERVAL seconds
+# to drop edited and deleted ones. Browsers cache the results for
+# AUTOCOMPLETE_MAX_AGE seconds. Location, purpose and transport suggestions
+# keep at most AUTOCOMPLETE_MAX_ENTRIES values per field, a use counts half
+# as much after AUTOCOMPLETE_HALF_LIFE days. Anonymous users of the public form
+# only get the values of at least AUTOCOMPLETE_PUBLIC_MIN_TRIPS trips, so a
+# value typed by one applicant is not shown to others.
+
+AUTOCOMPLETE_REFRESH_INTERVAL = 10
+
+AUTOCOMPLETE_REBUILD_INTERVAL = 10 * 60
+
+AUTOCOMPLETE_MAX_AGE = 5 * 60
+
+AUTOCOMPLETE_LIMIT = 10
+
+AUTOCOMPLETE_MAX_LIMIT = 50
+
+AUTOCOMPLETE_MAX_ENTRIES = 5000
+
+AUTOCOMPLETE_HALF_LIFE = 180
+
+AUTOCOMPLETE_PUBLIC_MIN_TRIPS = 3
+
+
+# Email outbox (manage.py deliver_emails), delays in seconds
+
+EMAIL_OUTBOX_WORKERS = 4
+
+EMAIL_OUTBOX_MAX_ATTEMPTS = 5
+
+EMAIL_OUTBOX_RETRY_DELAY = 60
+
+EMAIL_OUTBOX_MAX_RETRY_DELAY = 60 * 60
+
+EMAIL_OUTBOX_LEASE = 5 * 60
+
+# Trips listed in one digest, the rest are sent in the next one
+
+DIGEST_MAX_EVENTS = 200
+
+
+# Business trips management table.
+# Trips are counted up to BUSINESS_TRIPS_COUNT_LIMIT, None disables the count.
+
+BUSINESS_TRIPS_PAGE_SIZE = 5
+
+BUSINESS_TRIPS_MAX_PAGE_SIZE = 100
+
+BUSINESS_TRIPS_COUNT_LIMIT = 1000
+
+
+# Approval workflow: the department receiving new requests and the departments
+# each one passes them to. A department listing several next departments starts
+# them in parallel, a department with several predecessors waits for all of
+# them, e.g. 'DEPUTY_GOVERNOR': ['PERSONNEL_DEPARTMENT', 'BOOKKEEPING'].
+# The graph must not contain cycles.
+
+WORKFLOW = {
+    'INITIAL_DEPARTMENT': 'PURCHASING_DEPARTMENT',
+    'TRANSITIONS': {
+        'PURCHASING_DEPARTMENT': ['HEAD_OF_DEPARTMENT'],
+        'HEAD_OF_DEPARTMENT': ['DEPUTY_GOVERNOR'],
+        'DEPUTY_GOVERNOR': ['PERSONNEL_DEPARTMENT'],
+        'PERSONNEL_DEPARTMENT': ['BOOKKEEPING'],
+        'BOOKKEEPING': [],
+    },
+}
+
+
+# Keep the department permissions of the user in the session. They are
+# invalidated through the cache (CACHES) when groups or permissions change,
+# which only reaches the other processes through a shared cache. None turns
+# it on unless the default cache is local to the process (locmem, dummy).
+
+PERMISSIONS_SESSION_CACHE = None
+
+
+# Request metrics in the Prometheus text format at /metrics/, available to
+# staff users and to scrapers sending "Authorization: Bearer <METRICS_TOKEN>".
+
+METRICS_TOKEN = None
+
+
+# Request profiling. Staff users profile a request with ?profile=1 or the
+# "X-Profile: 1" header (cProfile), "sample" selects the sampling profiler.
+# PROFILE_SAMPLE_RATE is the share of all requests profiled by the sampler.
+
+PROFILE_SAMPLE_RATE = 0
+
+PROFILE_SAMPLE_INTERVAL = 0.005
+
+PROFILE_KEEP = 500
+
+
+# Bulk import of business trips (import_trips command and /business_trips/import/).
+# The upload page shows the first IMPORT_REPORTED_ERRORS errors.
+
+IMPORT_BATCH_SIZE = 500
+
+IMPORT_REPORTED_ERRORS = 100
+
+
+# Batch download of documents as a ZIP archive (/download/batch/). Missing
+# documents are rendered on BATCH_DOWNLOAD_WORKERS threads.
+
+BATCH_DOWNLOAD_WORKERS = 4
+
+BATCH_DOWNLOAD_MAX_TRIPS = 500
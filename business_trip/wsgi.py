@@ -9,8 +9,15 @@ https://docs.djangoproject.com/en/2.2/howto/deployment/wsgi/
 
 import os
 
+from django.conf import settings
 from django.core.wsgi import get_wsgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'business_trip.settings')
 
 application = get_wsgi_application()
+
+if settings.MORPHOLOGY_PRELOAD:
+    # Run the server with app preloading (e.g. gunicorn --preload) so this
+    # happens once in the master and the workers share the dictionaries.
+    from core.morphology import preload
+    preload()
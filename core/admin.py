@@ -1,7 +1,44 @@
 from django.contrib import admin
+from django.http import HttpResponse, Http404
+from django.shortcuts import get_object_or_404
+from django.urls import path, reverse
+from django.utils.html import format_html
 from .models import BusinessTrip, BusinessTripQueue,\
     DeputyGovernor, EmailSending, Order, ApplicationFunding,\
-    ActiveSetting, PassportData
+    ActiveSetting, PassportData, RenderJob, EmailOutbox,\
+    BusinessTripState, RequestProfile, Position
+
+
+class RequestProfileAdmin(admin.ModelAdmin):
+    list_display = ('date_added', 'view', 'path', 'mode', 'duration', 'user', 'download')
+    list_filter = ('view', 'mode')
+    exclude = ('stats',)
+    readonly_fields = ('user', 'view', 'path', 'mode', 'duration', 'stacks', 'date_added')
+
+    def has_add_permission(self, request):
+        return False
+
+    def get_urls(self):
+        return [path('<int:pk>/download/', self.admin_site.admin_view(self.download_view),
+                     name='core_requestprofile_download')] + super().get_urls()
+
+    def download(self, obj):
+        url = reverse('admin:core_requestprofile_download', args=[obj.pk])
+        return format_html('<a href="{}">{}</a>', url, 'pstats' if obj.mode == RequestProfile.CPROFILE else 'flamegraph')
+    download.short_description = 'Файл'
+
+    def download_view(self, request, pk):
+        obj = get_object_or_404(RequestProfile, pk=pk)
+        if not self.has_view_permission(request, obj):
+            raise Http404
+        if obj.mode == RequestProfile.CPROFILE:
+            response = HttpResponse(bytes(obj.stats), content_type='application/octet-stream')
+            filename = 'profile-%s.pstats' % obj.pk
+        else:
+            response = HttpResponse(obj.stacks, content_type='text/plain; charset=utf-8')
+            filename = 'profile-%s.folded' % obj.pk
+        response['Content-Disposition'] = 'attachment; filename="%s"' % filename
+        return response
 
 
 admin.site.register(BusinessTrip)
@@ -12,3 +49,8 @@ admin.site.register(Order)
 admin.site.register(ApplicationFunding)
 admin.site.register(ActiveSetting)
 admin.site.register(PassportData)
+admin.site.register(RenderJob)
+admin.site.register(EmailOutbox)
+admin.site.register(BusinessTripState)
+admin.site.register(RequestProfile, RequestProfileAdmin)
+admin.site.register(Position)
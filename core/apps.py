@@ -3,3 +3,9 @@ from django.apps import AppConfig
 
 class CoreConfig(AppConfig):
     name = 'core'
+
+    def ready(self):
+        from . import permissions  # noqa: F401, connects the invalidation signals
+        from . import autocomplete  # noqa: F401, connects the index signals
+        from .morphology import load_inflection_cache
+        load_inflection_cache()
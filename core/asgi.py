@@ -0,0 +1,142 @@
+import asyncio
+import logging
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import close_old_connections
+from django.http import Http404
+from django.urls import Resolver404, resolve
+from django.utils.http import parse_etags
+
+from .documents import get_document_key, open_document_async
+from .metrics import DURATION_BUCKETS, registry
+from .views import DOWNLOAD_HEADERS, get_download_data
+
+logger = logging.getLogger('django.request')
+
+
+def load_download_data(pk, document_type):
+    # Runs on the executor threads, which Django does not manage like request threads
+    close_old_connections()
+    try:
+        return get_download_data(pk, document_type)
+    finally:
+        close_old_connections()
+
+
+def strip_weak(etag):
+    return etag[2:] if etag.startswith('W/') else etag
+
+
+def etag_matches(if_none_match, etag):
+    etags = parse_etags(if_none_match)
+    return '*' in etags or strip_weak(etag) in [strip_weak(value) for value in etags]
+
+
+def read_chunk(file, chunk_size=64 * 1024):
+    return file.read(chunk_size)
+
+
+def get_size(file):
+    size = file.seek(0, os.SEEK_END)
+    file.seek(0)
+    return size
+
+
+class DownloadApplication:
+    """ASGI application serving GET requests of the download_link URL on the event loop.
+
+    A download waiting for datamart holds a slot of the ``concurrency``
+    semaphore instead of a thread, so many renders share one loop. Loading the
+    trip and filling the template run on ``db_workers`` threads. The response
+    has the headers of views.download_link. Other requests go to the
+    ``fallback`` ASGI application or get a 404 without one.
+    """
+
+    def __init__(self, fallback=None, concurrency=None, db_workers=None):
+        self.fallback = fallback
+        self.concurrency = concurrency or settings.ASYNC_RENDER_CONCURRENCY
+        self.executor = ThreadPoolExecutor(max_workers=db_workers or settings.ASGI_DB_WORKERS)
+        # Created on the first request so that it belongs to the server's event loop
+        self.semaphore = None
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self.lifespan(receive, send)
+            return
+        if scope['type'] == 'http' and scope['method'] == 'GET':
+            try:
+                match = resolve(scope['path'])
+            except Resolver404:
+                match = None
+            if match is not None and match.url_name == 'download_link':
+                await self.download(scope, send, **match.kwargs)
+                return
+        if self.fallback is not None:
+            await self.fallback(scope, receive, send)
+        elif scope['type'] == 'http':
+            await self.respond(send, 404, b'Not Found')
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                self.executor.shutdown(wait=False)
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    async def respond(self, send, status, body=b'', headers=()):
+        headers = [(name.lower().encode('latin-1'), value.encode('latin-1')) for name, value in headers]
+        if body:
+            headers.append((b'content-type', b'text/plain; charset=utf-8'))
+        await send({'type': 'http.response.start', 'status': status, 'headers': headers})
+        await send({'type': 'http.response.body', 'body': body})
+
+    async def download(self, scope, send, pk, document_type):
+        """Send the document, the duration metric covers the whole response including the body."""
+        started = time.perf_counter()
+        try:
+            await self.send_document(scope, send, pk, document_type)
+        finally:
+            registry.observe('business_trip_request_duration_seconds', 'Wall time of the request.',
+                             DURATION_BUCKETS, 'download_link_asgi', time.perf_counter() - started)
+
+    async def send_document(self, scope, send, pk, document_type):
+        loop = asyncio.get_running_loop()
+        if self.semaphore is None:
+            self.semaphore = asyncio.Semaphore(self.concurrency)
+        try:
+            try:
+                data = await loop.run_in_executor(self.executor, load_download_data, pk, document_type)
+            except Http404:
+                await self.respond(send, 404, b'Not Found')
+                return
+            etag = '"%s"' % get_document_key(data)
+            headers = [('ETag', etag)] + list(DOWNLOAD_HEADERS.items())
+            request_headers = dict(scope['headers'])
+            if_none_match = request_headers.get(b'if-none-match', b'').decode('latin-1')
+            if if_none_match and etag_matches(if_none_match, etag):
+                await self.respond(send, 304, headers=headers)
+                return
+            async with self.semaphore:
+                file = (await open_document_async(data))[1]
+        except Exception:
+            logger.exception('Internal Server Error: %s', scope['path'])
+            await self.respond(send, 500, b'Internal Server Error')
+            return
+        try:
+            headers.append(('Content-Length', str(get_size(file))))
+            await send({'type': 'http.response.start', 'status': 200,
+                        'headers': [(name.lower().encode('latin-1'), value.encode('latin-1'))
+                                    for name, value in headers]})
+            while True:
+                chunk = await loop.run_in_executor(self.executor, read_chunk, file)
+                await send({'type': 'http.response.body', 'body': chunk, 'more_body': bool(chunk)})
+                if not chunk:
+                    break
+        finally:
+            file.close()
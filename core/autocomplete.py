@@ -0,0 +1,277 @@
+import bisect
+import datetime
+import functools
+import heapq
+import logging
+import re
+import threading
+import time
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Count, Max
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+
+from .models import BusinessTrip, Position
+
+logger = logging.getLogger(__name__)
+
+
+WORD = re.compile(r'\w+')
+
+SUGGESTION_FIELDS = ('location', 'purpose', 'transport_type')
+
+EPOCH = datetime.date(2019, 1, 1)
+
+
+def get_words(text):
+    return WORD.findall(text.lower().replace('ё', 'е'))
+
+
+class PrefixIndex:
+    """Strings with a weight and a use count, found by case-insensitive prefixes of their words.
+
+    Every word maps to the strings containing it and the distinct words are
+    kept sorted, so the words with a given prefix are found by bisection. A
+    query matches a string when each query word is a prefix of one of its
+    words. Strings starting with the query come first, then the heavier ones.
+    ``min_count`` leaves out the strings used fewer times.
+
+    With ``max_entries`` the lightest strings are dropped once the index grows
+    a tenth over it.
+    """
+
+    def __init__(self, max_entries=None):
+        self.max_entries = max_entries
+        self._words = []
+        self._postings = {}
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def add(self, text, weight=1, count=1):
+        text = ' '.join(text.split())
+        if not text:
+            return
+        key = text.lower()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                entry[1] += weight
+                entry[2] += count
+                return
+            self._entries[key] = [text, weight, count]
+            for word in set(get_words(text)):
+                if word not in self._postings:
+                    self._postings[word] = set()
+                    bisect.insort(self._words, word)
+                self._postings[word].add(key)
+            if self.max_entries is not None and len(self._entries) > self.max_entries + self.max_entries // 10:
+                self._trim()
+
+    def trim(self):
+        with self._lock:
+            self._trim()
+
+    def _trim(self):
+        if self.max_entries is None or len(self._entries) <= self.max_entries:
+            return
+        lightest = heapq.nsmallest(len(self._entries) - self.max_entries, self._entries,
+                                   key=lambda key: self._entries[key][1])
+        for key in lightest:
+            del self._entries[key]
+            for word in set(get_words(key)):
+                keys = self._postings[word]
+                keys.discard(key)
+                if not keys:
+                    del self._postings[word]
+                    del self._words[bisect.bisect_left(self._words, word)]
+
+    def _find_prefix(self, prefix):
+        index = bisect.bisect_left(self._words, prefix)
+        postings = []
+        while index < len(self._words) and self._words[index].startswith(prefix):
+            postings.append(self._postings[self._words[index]])
+            index += 1
+        return postings
+
+    def search(self, query, limit=10, min_count=0):
+        prefixes = set(get_words(query))
+        if not prefixes:
+            return []
+        query = ' '.join(query.split()).lower()
+        with self._lock:
+            # Sets of the most selective prefixes first, so the intersection shrinks fast
+            matches = None
+            for postings in sorted((self._find_prefix(prefix) for prefix in prefixes),
+                                   key=lambda postings: sum(len(keys) for keys in postings)):
+                keys = set().union(*postings)
+                matches = keys if matches is None else matches & keys
+                if not matches:
+                    return []
+            if min_count:
+                matches = [key for key in matches if self._entries[key][2] >= min_count]
+            ranked = heapq.nsmallest(limit, matches, key=lambda key: (not key.startswith(query),
+                                                                      -self._entries[key][1], key))
+            return [self._entries[key][0] for key in ranked]
+
+
+class LiveIndex:
+    """A PrefixIndex of table rows kept current without rescanning the tables.
+
+    ``fill(index, after, upto)`` adds the rows of the ``models`` with ids
+    after the ``after`` ones up to the ``upto`` ones, both dicts by model.
+    The first use fills the index up to the last ids. A save in this process
+    marks it stale, so do AUTOCOMPLETE_REFRESH_INTERVAL seconds for the saves
+    of other processes, and the next request adds only the newer rows.
+    Edited and deleted rows are picked up by a full rebuild every
+    AUTOCOMPLETE_REBUILD_INTERVAL seconds on a background thread, the
+    requests keep using the old index until it is swapped in.
+    """
+
+    def __init__(self, models, fill, max_entries=False):
+        self.models = models
+        self.fill = fill
+        # True bounds the index by AUTOCOMPLETE_MAX_ENTRIES
+        self.max_entries = max_entries
+        self._index = None
+        self._last_ids = None
+        self._stale = False
+        self._refreshed = 0
+        self._built = 0
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def get_last_ids(self):
+        return {model: model.objects.aggregate(last_id=Max('id'))['last_id'] or 0 for model in self.models}
+
+    def build(self):
+        last_ids = self.get_last_ids()
+        index = PrefixIndex(max_entries=settings.AUTOCOMPLETE_MAX_ENTRIES if self.max_entries else None)
+        self.fill(index, {model: 0 for model in self.models}, last_ids)
+        index.trim()
+        return index, last_ids
+
+    def get(self):
+        if self._index is None:
+            with self._lock:
+                if self._index is None:
+                    self._stale = False
+                    self._index, self._last_ids = self.build()
+                    self._refreshed = self._built = time.monotonic()
+            return self._index
+        now = time.monotonic()
+        if (self._stale or now - self._refreshed > settings.AUTOCOMPLETE_REFRESH_INTERVAL) \
+                and self._lock.acquire(blocking=False):
+            # A request finding another one refreshing uses the index as it is
+            try:
+                self._stale = False
+                self._refreshed = now
+                self._last_ids = self.update(self._index, self._last_ids)
+            finally:
+                self._lock.release()
+        if now - self._built > settings.AUTOCOMPLETE_REBUILD_INTERVAL and self._thread is None:
+            self._thread = threading.Thread(target=self.rebuild, daemon=True)
+            self._thread.start()
+        return self._index
+
+    def update(self, index, last_ids):
+        upto = self.get_last_ids()
+        if upto != last_ids:
+            self.fill(index, last_ids, upto)
+        return upto
+
+    def rebuild(self):
+        try:
+            index, last_ids = self.build()
+            with self._lock:
+                self._last_ids = self.update(index, last_ids)
+                self._index = index
+                self._refreshed = time.monotonic()
+        except Exception:
+            logger.exception('Autocomplete index rebuild failed')
+        finally:
+            self._built = time.monotonic()
+            self._thread = None
+            connection.close()
+
+    def mark_stale(self):
+        self._stale = True
+
+    def clear(self):
+        self._index = None
+
+
+def fill_position_index(index, after, upto, trips=True):
+    """Add the positions of the table and, with ``trips``, of the past trips, weighted by the number of trips."""
+    names = Position.objects.filter(id__gt=after[Position], id__lte=upto[Position]).values_list('name', flat=True)
+    for name in names.iterator():
+        index.add(name, 0, 0)
+    if trips:
+        rows = BusinessTrip.objects.filter(id__gt=after[BusinessTrip], id__lte=upto[BusinessTrip])\
+            .order_by().values_list('position').annotate(count=Count('id'))
+        for position, count in rows:
+            index.add(position, count, count)
+
+
+def get_recency_weight(date):
+    """Weight of a use on the date, it doubles every AUTOCOMPLETE_HALF_LIFE days.
+
+    A sum of these weights ranks like a use count where the older uses fade
+    away, and it is updated by adding the weight of every new use.
+    """
+    return 2 ** ((date - EPOCH).days / settings.AUTOCOMPLETE_HALF_LIFE)
+
+
+def fill_suggestion_index(field, index, after, upto):
+    """Add the values of the trip field, weighted by the number of trips and their recency.
+
+    The rows of a value come together, so it is added once with its whole
+    weight and trip count and the index is trimmed while it is filled.
+    """
+    rows = BusinessTrip.objects.filter(id__gt=after[BusinessTrip], id__lte=upto[BusinessTrip])\
+        .order_by(field).values_list(field, 'date_added').annotate(count=Count('id'))
+    value, weight, trips = None, 0, 0
+    for row_value, date, count in rows.iterator():
+        if row_value != value:
+            if value is not None:
+                index.add(value, weight, trips)
+            value, weight, trips = row_value, 0, 0
+        weight += count * get_recency_weight(date)
+        trips += count
+    if value is not None:
+        index.add(value, weight, trips)
+
+
+positions = LiveIndex([Position, BusinessTrip], fill_position_index)
+
+listed_positions = LiveIndex([Position], functools.partial(fill_position_index, trips=False))
+
+suggestions = {field: LiveIndex([BusinessTrip], functools.partial(fill_suggestion_index, field), max_entries=True)
+               for field in SUGGESTION_FIELDS}
+
+
+def add_business_trips(business_trips):
+    """Have the indexes add the trips once the transaction commits, bulk_create sends no post_save."""
+    def mark_stale():
+        positions.mark_stale()
+        for index in suggestions.values():
+            index.mark_stale()
+    transaction.on_commit(mark_stale)
+
+
+@receiver(post_save, sender=Position)
+def position_saved(sender, instance, **kwargs):
+    def mark_stale():
+        positions.mark_stale()
+        listed_positions.mark_stale()
+    transaction.on_commit(mark_stale)
+
+
+@receiver(post_save, sender=BusinessTrip)
+def business_trip_saved(sender, instance, created, **kwargs):
+    if created:
+        add_business_trips([instance])
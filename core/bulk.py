@@ -0,0 +1,32 @@
+from django.db import connections, router, transaction
+from django.db.models import AutoField
+
+
+def bulk_create_with_ids(model, objs, batch_size=None):
+    """bulk_create that sets the primary keys of the objects on every backend.
+
+    SQLite gets the ids back by reading the last inserted ones: the insert
+    takes the database write lock, which is held until the transaction ends,
+    so no other insert can come in between. Other backends which cannot return
+    ids from a bulk insert (MySQL) insert the objects one by one, without
+    post_save like bulk_create.
+    """
+    if not objs:
+        return objs
+    db = router.db_for_write(model)
+    connection = connections[db]
+    if connection.features.can_return_ids_from_bulk_insert:
+        return model.objects.using(db).bulk_create(objs, batch_size=batch_size)
+    with transaction.atomic(using=db):
+        if connection.vendor != 'sqlite':
+            fields = [field for field in model._meta.concrete_fields if not isinstance(field, AutoField)]
+            for obj in objs:
+                obj.pk = model._base_manager.using(db)._insert([obj], fields=fields, return_id=True, using=db)
+                obj._state.adding = False
+                obj._state.db = db
+            return objs
+        model.objects.using(db).bulk_create(objs, batch_size=batch_size)
+        pks = model.objects.using(db).order_by('-pk').values_list('pk', flat=True)[:len(objs)]
+        for obj, pk in zip(objs, reversed(pks)):
+            obj.pk = pk
+    return objs
@@ -0,0 +1,127 @@
+import hashlib
+import json
+import os
+import time
+import uuid
+
+from django.conf import settings
+
+
+class DocumentCache:
+    """Rendered documents stored on disk under the hash of their template payload.
+
+    The same payload always renders to the same document, so the key doubles as
+    an ETag. Entries older than ``max_age`` seconds are dropped and the least
+    recently used ones are removed while the total size exceeds ``max_size`` bytes.
+
+    Eviction walks the whole directory, so a process runs it only after writing
+    a tenth of ``max_size`` or ``evict_interval`` seconds after the last one.
+    Another process may evict a file at any time, read it through open().
+    """
+
+    def __init__(self, directory, max_size=None, max_age=None, extension='.pdf', evict_interval=300):
+        self.directory = directory
+        self.max_size = max_size
+        self.max_age = max_age
+        self.extension = extension
+        self.evict_interval = evict_interval
+        self._written = 0
+        self._evicted = time.monotonic()
+
+    @staticmethod
+    def key(data, namespace=''):
+        payload = json.dumps(data, sort_keys=True, ensure_ascii=False)
+        if namespace:
+            payload = namespace + ':' + payload
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def path(self, key):
+        return os.path.join(self.directory, key[:2], key + self.extension)
+
+    def _expired(self, mtime, now):
+        return self.max_age is not None and now - mtime > self.max_age
+
+    def get(self, key):
+        """Return the path of a cached document or None."""
+        path = self.path(key)
+        try:
+            mtime = os.stat(path).st_mtime
+        except FileNotFoundError:
+            return None
+        if self._expired(mtime, time.time()):
+            self._remove(path)
+            return None
+        # The modification time is the last access time for eviction.
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        return path
+
+    def open(self, key):
+        """Return the cached document opened for reading or None, the open file outlives its eviction."""
+        path = self.get(key)
+        if path is None:
+            return None
+        try:
+            return open(path, 'rb')
+        except FileNotFoundError:
+            return None
+
+    def set(self, key, content):
+        path = self.path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = '%s.%s.tmp' % (path, uuid.uuid4().hex)
+        with open(tmp_path, 'wb') as f:
+            f.write(content)
+        os.replace(tmp_path, path)
+        self._written += len(content)
+        if self._eviction_due():
+            self.evict()
+        return path
+
+    def _eviction_due(self):
+        if self.max_size is not None and self._written >= self.max_size // 10:
+            return True
+        return time.monotonic() - self._evicted >= self.evict_interval
+
+    def evict(self):
+        self._written = 0
+        self._evicted = time.monotonic()
+        if self.max_size is None and self.max_age is None:
+            return
+        now = time.time()
+        entries = []
+        for root, dirs, files in os.walk(self.directory):
+            for name in files:
+                if not name.endswith(self.extension):
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                if self._expired(stat.st_mtime, now):
+                    self._remove(path)
+                else:
+                    entries.append((stat.st_mtime, stat.st_size, path))
+        if self.max_size is None:
+            return
+        total_size = sum(size for mtime, size, path in entries)
+        for mtime, size, path in sorted(entries):
+            if total_size <= self.max_size:
+                break
+            self._remove(path)
+            total_size -= size
+
+    @staticmethod
+    def _remove(path):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
+document_cache = DocumentCache(settings.DOCUMENT_CACHE_DIR,
+                               max_size=settings.DOCUMENT_CACHE_MAX_SIZE,
+                               max_age=settings.DOCUMENT_CACHE_MAX_AGE)
@@ -0,0 +1,333 @@
+import asyncio
+import datetime
+from io import BytesIO
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, as_completed, wait
+
+from django.conf import settings
+from django.db.models import F, Prefetch
+from django.utils import timezone
+
+from .document_cache import document_cache
+from .models import BusinessTrip, Document, Order, ApplicationFunding, RenderJob, Departments
+from .morphology import get_morphed_word
+from .renderers import get_renderer
+from .streaming import stream_zip
+
+
+# Documents are rendered ahead of time once the queue that fixes their content is completed,
+# the funding application is addressed to the deputy governor chosen by the head of department
+PRERENDER_ON_COMPLETE = {
+    Departments.HEAD_OF_DEPARTMENT[0]: Document.FUNDING_APPLICATION,
+    Departments.DEPUTY_GOVERNOR[0]: Document.ORDER,
+}
+
+
+class IncompleteDocumentError(ValueError):
+    """The document can not be filled yet, rendering it again will not help."""
+
+
+def convert_month(month):
+    months = {'01': 'январь',
+              '02': 'февраль',
+              '03': 'март',
+              '04': 'апрель',
+              '05': 'май',
+              '06': 'июнь',
+              '07': 'июль',
+              '08': 'август',
+              '09': 'сентябрь',
+              '10': 'октябрь',
+              '11': 'ноябрь',
+              '12': 'декабрь'}
+    return months[month]
+
+
+def get_cleaned_day(day):
+    if day.startswith('0'):
+        return day.strip('0')
+    return day
+
+
+# TODO : Add decorator for date conversion
+def get_period(start_date, end_date):
+    start_date = start_date.strftime("%Y-%m-%d")
+    end_date = end_date.strftime("%Y-%m-%d")
+    start_day = get_cleaned_day(start_date.split('-')[2])
+    end_day = get_cleaned_day(end_date.split('-')[2])
+    if start_date == end_date:
+        period = start_day \
+                 + ' ' + convert_month(start_date.split('-')[1]) + ' ' \
+                 + start_date.split('-')[0] \
+                 + ' года'
+        return period
+    if start_date.split('-')[0] == end_date.split('-')[0]:
+        if start_date.split('-')[1] == end_date.split('-')[1]:
+            period = 'с ' + start_day \
+                     + ' по ' \
+                     + end_day \
+                     + ' ' + convert_month(end_date.split('-')[1]) + ' ' \
+                     + end_date.split('-')[0] \
+                     + ' года'
+            return period
+        period = 'с ' + start_day \
+                 + ' ' + convert_month(start_date.split('-')[1]) + ' ' \
+                 + ' по ' \
+                 + end_day \
+                 + ' ' + convert_month(end_date.split('-')[1]) + ' ' \
+                 + end_date.split('-')[0] \
+                 + ' года'
+        return period
+    period = 'с ' + start_day \
+             + ' ' + convert_month(start_date.split('-')[1]) + ' ' \
+             + start_date.split('-')[0] \
+             + ' года по ' \
+             + end_day \
+             + ' ' + convert_month(end_date.split('-')[1]) + ' ' \
+             + end_date.split('-')[0] \
+             + ' года'
+    return period
+
+
+def fill_funding_application_template(funding_application):
+    if not funding_application.deputy_governor or not funding_application.deputy_governor_position:
+        raise IncompleteDocumentError('Заместитель губернатора не выбран')
+    data = {"BlankTarget": "", "Adresat": "", "Theme": "",
+            "DocContent": "", "AuthorPost": "", "Author": ""}
+    hotel_days_total = int(funding_application.business_trip.hotel_days) * 200
+    data['BlankTarget'] = "Заявка"
+    data['Adresat'] = funding_application.deputy_governor_position + '<br/>' + funding_application.deputy_governor
+    data['Theme'] = "Заявка на финансирование командировки"
+    data['DocContent'] = "Для командировки в {0}".format(funding_application.business_trip.location)
+    period = get_period(funding_application.business_trip.start_date, funding_application.business_trip.end_date)
+    morphed_period = ' '.join([get_morphed_word(word, 'gent') for word in period.split()])
+    data['DocContent'] += " {0} ".format(morphed_period)
+    data['DocContent'] += "прошу выдать денежные средства" \
+                          " в размере:\n 1. Транспортные расходы - {0} руб.\n" \
+                          "2. Проживание в гостинице - {1} руб.\n" \
+                          "3. Суточные - {2} суток - {3} руб.\n".format(funding_application.fare,
+                                                                        funding_application.hotel_cost,
+                                                                        funding_application.business_trip.hotel_days,
+                                                                        hotel_days_total)
+    data['Author'] = funding_application.business_trip.full_name_short()
+    data['AuthorPost'] = funding_application.business_trip.position
+    return data
+
+
+def fill_order_template(order):
+    data = dict(BlankTarget="", Adresat="", Theme="", DocContent="", AuthorPost="", Author="")
+    data['BlankTarget'] = "Распоряжение"
+    data['Theme'] = "О командировании %s" % order.full_name_genitive
+    data['DocContent'] = "Командировать {0}, {1},".format(order.full_name, order.position)
+    morphed_period = ' '.join([get_morphed_word(word, 'gent') for word in order.period.split()])
+    data['DocContent'] += " {0} ".format(morphed_period)
+    data['DocContent'] += "в {0} в связи ".format(order.location)
+    if order.purpose.lower().startswith('с'):
+        data['DocContent'] += "со {0}".format(order.purpose)
+    else:
+        data['DocContent'] += "с {0}".format(order.purpose)
+    data['Author'] = order.deputy_governor
+    data['AuthorPost'] = order.deputy_governor_position
+    return data
+
+
+def get_document_rows(model):
+    """Order or ApplicationFunding rows, the current one of a trip first.
+
+    A trip may have several rows, the newest one is edited by the departments
+    and rendered, so every reader takes its rows from here.
+    """
+    return model.objects.order_by('-id')
+
+
+def get_document(business_trip, document_type):
+    """Return the current Order or ApplicationFunding of the trip, raises DoesNotExist."""
+    model = Order if document_type.upper() == Document.ORDER else ApplicationFunding
+    obj = get_document_rows(model).filter(business_trip=business_trip).first()
+    if obj is None:
+        raise model.DoesNotExist
+    return obj
+
+
+def fill_document_template(document_type, obj):
+    if document_type.upper() == Document.ORDER:
+        return fill_order_template(obj)
+    return fill_funding_application_template(obj)
+
+
+def get_document_key(data):
+    return document_cache.key(data, get_renderer().name)
+
+
+def render_document(data):
+    """Return the cache key and the path of the rendered document, rendering it if needed."""
+    key = get_document_key(data)
+    path = document_cache.get(key)
+    if path is None:
+        path = document_cache.set(key, get_renderer().render(data))
+    return key, path
+
+
+def open_document(data):
+    """Return the cache key and the rendered document opened for reading, rendering it if needed.
+
+    A freshly rendered document is read from memory, the cached file may be
+    evicted by another process before it is opened.
+    """
+    key = get_document_key(data)
+    file = document_cache.open(key)
+    if file is None:
+        content = get_renderer().render(data)
+        document_cache.set(key, content)
+        file = BytesIO(content)
+    return key, file
+
+
+async def open_document_async(data):
+    """open_document for the event loop, the renderer and the file system calls leave the loop."""
+    loop = asyncio.get_running_loop()
+    key = get_document_key(data)
+    file = await loop.run_in_executor(None, document_cache.open, key)
+    if file is None:
+        content = await get_renderer().render_async(data)
+        await loop.run_in_executor(None, document_cache.set, key, content)
+        file = BytesIO(content)
+    return key, file
+
+
+def enqueue_render_job(business_trip, queue):
+    document_type = PRERENDER_ON_COMPLETE.get(queue)
+    if document_type is None:
+        return None
+    job, created = RenderJob.objects.update_or_create(
+        business_trip=business_trip, document_type=document_type,
+        defaults={'status': RenderJob.PENDING, 'attempts': 0, 'error': '', 'next_attempt': timezone.now()})
+    return job
+
+
+def get_retry_delay(attempts):
+    delay = settings.RENDER_JOB_RETRY_DELAY * 2 ** (attempts - 1)
+    return datetime.timedelta(seconds=min(delay, settings.RENDER_JOB_MAX_RETRY_DELAY))
+
+
+def claim_render_job(job):
+    """Lease the job to this worker, RUNNING jobs whose lease expired are claimed again."""
+    claimed = RenderJob.objects.filter(pk=job.pk, status=job.status, next_attempt=job.next_attempt).update(
+        status=RenderJob.RUNNING, attempts=F('attempts') + 1,
+        next_attempt=timezone.now() + datetime.timedelta(seconds=settings.RENDER_JOB_TIMEOUT))
+    if claimed:
+        job.refresh_from_db()
+    return bool(claimed)
+
+
+def run_render_job(job):
+    try:
+        obj = get_document(job.business_trip, job.document_type)
+        render_document(fill_document_template(job.document_type, obj))
+    except Exception as e:
+        job.error = repr(e)
+        if isinstance(e, IncompleteDocumentError) or job.attempts >= settings.RENDER_JOB_MAX_ATTEMPTS:
+            job.status = RenderJob.FAILED
+        else:
+            job.status = RenderJob.PENDING
+            job.next_attempt = timezone.now() + get_retry_delay(job.attempts)
+    else:
+        job.status = RenderJob.DONE
+        job.error = ''
+    job.save()
+    return job.status == RenderJob.DONE
+
+
+def process_render_jobs(limit=10):
+    """Run due render jobs and return the number of processed ones."""
+    jobs = RenderJob.objects.filter(status__in=[RenderJob.PENDING, RenderJob.RUNNING],
+                                    next_attempt__lte=timezone.now())\
+        .select_related('business_trip').order_by('next_attempt')[:limit]
+    processed = 0
+    for job in jobs:
+        if claim_render_job(job):
+            run_render_job(job)
+            processed += 1
+    return processed
+
+
+def get_batch_payloads(business_trip_ids, document_types, chunk_size=100):
+    """Yield (file name, template data, error) for the documents of the trips.
+
+    The trips are loaded ``chunk_size`` at a time with their latest orders and
+    funding applications.
+    """
+    for start in range(0, len(business_trip_ids), chunk_size):
+        business_trips = BusinessTrip.objects.filter(id__in=business_trip_ids[start:start + chunk_size])\
+            .order_by('id').prefetch_related(Prefetch('order_set', queryset=get_document_rows(Order)),
+                                             Prefetch('applicationfunding_set',
+                                                      queryset=get_document_rows(ApplicationFunding)))
+        for business_trip in business_trips:
+            for document_type in document_types:
+                name = '%s_%s.pdf' % (business_trip.id, document_type.lower())
+                if document_type == Document.ORDER:
+                    objs = business_trip.order_set.all()
+                else:
+                    objs = business_trip.applicationfunding_set.all()
+                if not objs:
+                    yield name, None, 'Документ не заполнен'
+                    continue
+                try:
+                    yield name, fill_document_template(document_type, objs[0]), None
+                except IncompleteDocumentError as e:
+                    yield name, None, str(e)
+                except Exception as e:
+                    yield name, None, repr(e)
+
+
+def _render_result(name, future):
+    try:
+        return name, future.result()[1], None
+    except Exception as e:
+        return name, None, repr(e)
+
+
+def render_batch(payloads, workers):
+    """Yield (file name, open document, error) for the payloads in the order they are ready.
+
+    Cached documents are returned at once, the others are rendered on a pool of
+    ``workers`` threads. At most twice as many renders wait at a time, so the
+    payloads are consumed only as fast as they are rendered.
+    """
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        pending = {}
+        for name, data, error in payloads:
+            if error is not None:
+                yield name, None, error
+                continue
+            file = document_cache.open(get_document_key(data))
+            if file is not None:
+                yield name, file, None
+                continue
+            pending[executor.submit(open_document, data)] = name
+            if len(pending) >= workers * 2:
+                done, not_done = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    yield _render_result(pending.pop(future), future)
+        for future in as_completed(list(pending)):
+            yield _render_result(pending.pop(future), future)
+
+
+def read_file(file, chunk_size=64 * 1024):
+    with file:
+        for chunk in iter(lambda: file.read(chunk_size), b''):
+            yield chunk
+
+
+def stream_documents_zip(business_trip_ids, document_types, workers=None):
+    """Yield a ZIP archive of the documents, errors.txt lists the ones which could not be rendered."""
+    def entries():
+        errors = []
+        for name, file, error in render_batch(get_batch_payloads(business_trip_ids, document_types),
+                                              workers or settings.BATCH_DOWNLOAD_WORKERS):
+            if error is None:
+                yield name, read_file(file)
+            else:
+                errors.append('%s: %s' % (name, error))
+        if errors:
+            yield 'errors.txt', ['\n'.join(errors).encode()]
+    return stream_zip(entries())
@@ -0,0 +1,92 @@
+import csv
+
+from django.conf import settings
+from django.db.models import OuterRef, Subquery
+from django.utils import timezone
+
+from .models import BusinessTrip, BusinessTripQueue, Departments, ApplicationFunding, Order
+from .streaming import escape_formula, stream_xlsx
+
+
+HEADER = ['№', 'Фамилия', 'Имя', 'Отчество', 'Должность', 'Место командировки', 'Цель командировки',
+          'Дата начала', 'Дата окончания', 'Вид транспорта', 'Кто оплачивает', 'Заместитель губернатора',
+          'Транспортные расходы', 'Проживание в гостинице', 'Суточные', 'Распоряжение: ФИО',
+          'Распоряжение: период', 'Текущие очереди', 'Статус', 'Дата последнего перехода', 'Дата создания']
+
+WHO_PAYS_THE_TRIP = dict(BusinessTrip.WHO_PAYS_THE_TRIP_CHOICES)
+STATUSES = dict(BusinessTripQueue.STATUS_CHOICES)
+DEPARTMENTS = dict(Departments.get_choices())
+
+
+def get_export_queryset(queryset):
+    """Return the export rows of the trips as one query, the latest funding and order come from subqueries."""
+    funding = ApplicationFunding.objects.filter(business_trip=OuterRef('pk')).order_by('-id')
+    orders = Order.objects.filter(business_trip=OuterRef('pk')).order_by('-id')
+    return queryset.order_by('-id').annotate(
+        funding_fare=Subquery(funding.values('fare')[:1]),
+        funding_hotel_cost=Subquery(funding.values('hotel_cost')[:1]),
+        funding_daily_allowance=Subquery(funding.values('daily_allowance')[:1]),
+        order_full_name=Subquery(orders.values('full_name')[:1]),
+        order_period=Subquery(orders.values('period')[:1]),
+    ).values_list('id', 'second_name', 'first_name', 'patronymic', 'position', 'location', 'purpose',
+                  'start_date', 'end_date', 'transport_type', 'who_pays_the_trip', 'deputy_governor__full_name',
+                  'funding_fare', 'funding_hotel_cost', 'funding_daily_allowance', 'order_full_name',
+                  'order_period', 'state__queues', 'state__status', 'state__date_modified', 'date_added')
+
+
+def to_number(value):
+    """Amounts are stored as text, numbers are exported as numbers so that they can be summed."""
+    if value is None:
+        return None
+    try:
+        return int(value)
+    except ValueError:
+        try:
+            return float(value.replace(',', '.'))
+        except ValueError:
+            return value
+
+
+def format_row(row):
+    row = list(row)
+    row[7] = row[7].strftime(settings.DATE_FORMAT)
+    row[8] = row[8].strftime(settings.DATE_FORMAT)
+    row[10] = WHO_PAYS_THE_TRIP.get(row[10], row[10])
+    row[12:15] = [to_number(value) for value in row[12:15]]
+    queues = row[17].split(',') if row[17] else []
+    row[17] = ', '.join(DEPARTMENTS.get(queue, queue) for queue in queues)
+    row[18] = STATUSES.get(row[18], row[18])
+    if row[19] is not None:
+        row[19] = timezone.localtime(row[19]).strftime(settings.DATE_FORMAT + ' %H:%M')
+    row[20] = row[20].strftime(settings.DATE_FORMAT)
+    return row
+
+
+def get_export_rows(queryset, chunk_size=2000):
+    for row in get_export_queryset(queryset).iterator(chunk_size=chunk_size):
+        yield format_row(row)
+
+
+class Echo:
+    """File-like object returning what is written, lets csv.writer produce lines for a streaming response."""
+
+    def write(self, value):
+        return value
+
+
+def stream_csv(header, rows):
+    """Yield the CSV lines, the text cells come from the public form and are escaped against formulas."""
+    writer = csv.writer(Echo())
+    # The BOM makes Excel read the file as UTF-8
+    yield '\ufeff' + writer.writerow(header)
+    for row in rows:
+        yield writer.writerow([escape_formula(value) for value in row])
+
+
+def export_business_trips(queryset, file_format):
+    """Return (content type, iterable of the file chunks)."""
+    rows = get_export_rows(queryset)
+    if file_format == 'xlsx':
+        return ('application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+                stream_xlsx(HEADER, rows, sheet_name='Командировки'))
+    return 'text/csv; charset=utf-8', stream_csv(HEADER, rows)
@@ -1,14 +1,23 @@
 from django import forms
+from django.urls import reverse_lazy
 from .models import BusinessTrip, DeputyGovernor, Order, ApplicationFunding, PassportData
 
 
+def autocomplete_input(url_name, **kwargs):
+    return forms.TextInput(attrs={'class': "autocomplete",
+                                  'data-autocomplete-url': reverse_lazy(url_name, kwargs=kwargs)})
+
+
 class BusinessTripForm(forms.ModelForm):
     class Meta:
         model = BusinessTrip
         fields = '__all__'
         exclude = ('deputy_governor',)
         widgets = {
-            'position': forms.TextInput(attrs={'class': "autocomplete"}),
+            'position': autocomplete_input('position_autocomplete'),
+            'location': autocomplete_input('suggestion_autocomplete', field='location'),
+            'purpose': autocomplete_input('suggestion_autocomplete', field='purpose'),
+            'transport_type': autocomplete_input('suggestion_autocomplete', field='transport_type'),
         }
 
     def disable_fields(self):
@@ -0,0 +1,159 @@
+import datetime
+import random
+
+from django.db import transaction
+
+from .autocomplete import add_business_trips
+from .bulk import bulk_create_with_ids
+from .documents import PRERENDER_ON_COMPLETE
+from .models import BusinessTrip, BusinessTripQueue, BusinessTripState, PassportData, Order, ApplicationFunding,\
+    DeputyGovernor, Document, Departments
+from .trip_state import get_state
+from .workflow import WorkFlow
+
+
+SECOND_NAMES = ['Иванов', 'Петров', 'Смирнов', 'Кузнецов', 'Попов', 'Васильев', 'Соколов', 'Михайлов', 'Новиков',
+                'Фёдоров', 'Морозов', 'Волков', 'Алексеев', 'Лебедев', 'Семёнов', 'Егоров', 'Павлов', 'Козлов']
+FIRST_NAMES = ['Александр', 'Сергей', 'Дмитрий', 'Андрей', 'Алексей', 'Максим', 'Евгений', 'Иван', 'Михаил',
+               'Николай', 'Владимир', 'Олег', 'Павел', 'Юрий', 'Игорь', 'Виктор']
+PATRONYMICS = ['Александрович', 'Сергеевич', 'Дмитриевич', 'Андреевич', 'Алексеевич', 'Иванович', 'Михайлович',
+               'Николаевич', 'Владимирович', 'Олегович', 'Павлович', 'Юрьевич', 'Викторович']
+POSITIONS = ['советник Губернатора Челябинской области',
+             'пресс-секретарь Губернатора Челябинской области Управления пресс-службы и информации'
+             ' Правительства Челябинской области',
+             'начальник отдела организационной работы Управления делами Губернатора',
+             'консультант отдела информационных технологий Правительства Челябинской области',
+             'главный специалист отдела кадров Правительства Челябинской области',
+             'заместитель начальника Управления делами Губернатора и Правительства Челябинской области',
+             'ведущий специалист отдела бухгалтерского учета и отчетности']
+LOCATIONS = ['г. Москва', 'г. Магнитогорск', 'г. Екатеринбург', 'г. Санкт-Петербург', 'г. Златоуст', 'г. Миасс',
+             'г. Копейск', 'г. Троицк', 'Уйский муниципальный район и г. Магнитогорск Челябинской области']
+PURPOSES = ['проведением совещания', 'участием в форуме', 'информационным сопровождением Губернатора'
+            ' Челябинской области', 'проведением проверки', 'участием в заседании рабочей группы',
+            'прохождением обучения', 'подготовкой визита делегации']
+TRANSPORT_TYPES = ['Самолёт', 'Поезд', 'Служебный автомобиль', 'Автобус']
+DEPUTY_GOVERNORS = [('В.В. Мамин', 'Первый заместитель Губернатора Челябинской области',
+                     'В.В. Мамина', 'Первого заместителя Губернатора Челябинской области'),
+                    ('Е.В. Редин', 'Заместитель Губернатора Челябинской области',
+                     'Е.В. Редина', 'Заместителя Губернатора Челябинской области')]
+
+
+def get_department_order():
+    """Return the departments reachable from the initial one in a topological order of the workflow graph."""
+    order = []
+    waiting = {department: set(predecessors) for department, predecessors in WorkFlow.PREDECESSORS.items()}
+    ready = [WorkFlow.INITIAL_DEPARTMENT]
+    while ready:
+        department = ready.pop(0)
+        order.append(department)
+        for next_department in WorkFlow.SUCCESSORS.get(department, []):
+            waiting[next_department].discard(department)
+            if not waiting[next_department]:
+                ready.append(next_department)
+    return order
+
+
+def get_stages():
+    """Return (completed, current) department lists for every stage of the workflow.
+
+    A trip has completed a prefix of the topological order, the departments
+    whose predecessors are all completed are the current ones.
+    """
+    order = get_department_order()
+    stages = []
+    for i in range(len(order) + 1):
+        completed = order[:i]
+        stages.append((completed, [d for d in order[i:] if WorkFlow.PREDECESSORS[d] <= set(completed)]))
+    return stages
+
+
+def make_business_trip(rng, deputy_governors):
+    start_date = datetime.date.today() - datetime.timedelta(days=rng.randint(-60, 730))
+    return BusinessTrip(second_name=rng.choice(SECOND_NAMES), first_name=rng.choice(FIRST_NAMES),
+                        patronymic=rng.choice(PATRONYMICS), position=rng.choice(POSITIONS),
+                        location=rng.choice(LOCATIONS), purpose=rng.choice(PURPOSES),
+                        start_date=start_date, end_date=start_date + datetime.timedelta(days=rng.randint(0, 7)),
+                        departure_date_limit='%02d-00' % rng.randint(6, 20),
+                        arrival_date_limit='%02d-00' % rng.randint(6, 20),
+                        who_pays_the_trip=rng.choice(BusinessTrip.WHO_PAYS_THE_TRIP_CHOICES)[0],
+                        receiving_funds=rng.choice(BusinessTrip.RECEIVING_FUNDS_CHOICES)[0],
+                        transport_type=rng.choice(TRANSPORT_TYPES), hotel_days=str(rng.randint(0, 7)),
+                        deputy_governor=rng.choice(deputy_governors))
+
+
+def make_application_funding(business_trip, addressed):
+    """``addressed`` tells whether the head of department has chosen the deputy governor yet."""
+    deputy_governor = business_trip.deputy_governor if addressed else None
+    days = (business_trip.end_date - business_trip.start_date).days + 1
+    return ApplicationFunding(business_trip=business_trip,
+                              deputy_governor=deputy_governor.full_name_document if deputy_governor else None,
+                              deputy_governor_position=deputy_governor.position_document if deputy_governor else None,
+                              fare='12000', hotel_cost=str(int(business_trip.hotel_days) * 3500),
+                              daily_allowance=str(days * 700))
+
+
+def make_order(business_trip):
+    deputy_governor = business_trip.deputy_governor
+    full_name = str(business_trip)
+    return Order(business_trip=business_trip, full_name_genitive=full_name, full_name=full_name,
+                 position=business_trip.position,
+                 period='с %s по %s' % (business_trip.start_date, business_trip.end_date),
+                 location=business_trip.location, purpose=business_trip.purpose,
+                 deputy_governor=deputy_governor.full_name if deputy_governor else None,
+                 deputy_governor_position=deputy_governor.position if deputy_governor else None)
+
+
+def generate_business_trips(count, batch_size=1000, seed=None, rejected_share=0.1):
+    """Insert ``count`` random trips with passports, documents, queues and states spread over every workflow stage.
+
+    ``rejected_share`` of the trips are rejected by their current department.
+    Everything is written with bulk_create, one transaction per batch.
+    """
+    rng = random.Random(seed)
+    stages = get_stages()
+    deputy_governors = list(DeputyGovernor.objects.all()) or bulk_create_with_ids(
+        DeputyGovernor, [DeputyGovernor(full_name=full_name, position=position, full_name_document=full_name_document,
+                                        position_document=position_document)
+                         for full_name, position, full_name_document, position_document in DEPUTY_GOVERNORS])
+    created = 0
+    while created < count:
+        size = min(batch_size, count - created)
+        with transaction.atomic():
+            trips = bulk_create_with_ids(BusinessTrip, [make_business_trip(rng, deputy_governors)
+                                                        for _ in range(size)])
+            passports = []
+            queues = []
+            states = []
+            funding = []
+            orders = []
+            for business_trip in trips:
+                completed, new = rng.choice(stages)
+                rejected = []
+                if new and rng.random() < rejected_share:
+                    new, rejected = new[1:], new[:1]
+                passports.append(PassportData(business_trip=business_trip, series='%04d' % rng.randint(0, 9999),
+                                              number='%06d' % rng.randint(0, 999999), issued='ОУФМС России',
+                                              date='2015-06-01', code='740-001'))
+                statuses = [(queue, BusinessTripQueue.COMPLETED) for queue in completed] +\
+                    [(queue, BusinessTripQueue.NEW) for queue in new] +\
+                    [(queue, BusinessTripQueue.REJECTED) for queue in rejected]
+                queues.extend(BusinessTripQueue(business_trip=business_trip, queue=queue, status=status)
+                              for queue, status in statuses)
+                current, status = get_state(statuses)
+                states.append(BusinessTripState(business_trip=business_trip, queues=current, status=status))
+                # Documents exist once the department preparing them has completed the trip, the purchasing
+                # department fills in the amounts of the funding application and the head of department its addressee
+                document_types = {PRERENDER_ON_COMPLETE.get(queue) for queue in completed}
+                if Departments.PURCHASING_DEPARTMENT[0] in completed:
+                    funding.append(make_application_funding(business_trip,
+                                                            Document.FUNDING_APPLICATION in document_types))
+                if Document.ORDER in document_types:
+                    orders.append(make_order(business_trip))
+            PassportData.objects.bulk_create(passports)
+            BusinessTripQueue.objects.bulk_create(queues)
+            BusinessTripState.objects.bulk_create(states)
+            add_business_trips(trips)
+            ApplicationFunding.objects.bulk_create(funding)
+            Order.objects.bulk_create(orders)
+        created += size
+    return created
@@ -0,0 +1,227 @@
+import asyncio
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+try:
+    import httpx
+except ImportError:
+    httpx = None
+
+from .metrics import track
+
+
+class CircuitOpenError(requests.RequestException):
+    """Raised without calling the service while the circuit breaker is open."""
+
+
+class CircuitBreaker:
+    """Opens after ``failure_threshold`` consecutive failures.
+
+    While open every call fails fast. After ``reset_timeout`` seconds one trial
+    call is let through, its success closes the circuit and its failure opens
+    it again. A call ending with neither must release() the trial slot.
+    """
+
+    def __init__(self, failure_threshold=5, reset_timeout=30):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self._trial_running = False
+        self._lock = threading.Lock()
+
+    @property
+    def is_open(self):
+        return self.opened_at is not None
+
+    def allow(self):
+        with self._lock:
+            if self.opened_at is None:
+                return True
+            if self._trial_running or time.monotonic() - self.opened_at < self.reset_timeout:
+                return False
+            self._trial_running = True
+            return True
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._trial_running = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self._trial_running or self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+            self._trial_running = False
+
+    def release(self):
+        with self._lock:
+            self._trial_running = False
+
+
+class LatencyMetrics:
+    """Call count, error count, total and max latency per endpoint."""
+
+    def __init__(self):
+        self._endpoints = {}
+        self._lock = threading.Lock()
+
+    def record(self, endpoint, elapsed, error=False):
+        with self._lock:
+            metrics = self._endpoints.setdefault(endpoint, {'count': 0, 'errors': 0, 'total': 0.0, 'max': 0.0})
+            metrics['count'] += 1
+            metrics['errors'] += int(error)
+            metrics['total'] += elapsed
+            metrics['max'] = max(metrics['max'], elapsed)
+
+    def snapshot(self):
+        with self._lock:
+            return {endpoint: dict(metrics, average=metrics['total'] / metrics['count'])
+                    for endpoint, metrics in self._endpoints.items()}
+
+
+class HttpClient:
+    """Pooled keep-alive client for one service with timeouts, retries and a circuit breaker.
+
+    Idempotent requests are retried on connection errors, timeouts and 502/503/504
+    responses. Other requests are retried only when the connection could not be
+    established, so the service never receives them twice.
+    """
+    RETRY_STATUSES = (502, 503, 504)
+
+    def __init__(self, base_url, connect_timeout=3.05, read_timeout=30, retries=2, backoff_factor=0.5,
+                 pool_size=10, failure_threshold=5, reset_timeout=30):
+        self.base_url = base_url.rstrip('/') + '/'
+        self.timeout = (connect_timeout, read_timeout)
+        self.retries = retries
+        self.backoff_factor = backoff_factor
+        self.breaker = CircuitBreaker(failure_threshold, reset_timeout)
+        self.metrics = LatencyMetrics()
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    def post(self, endpoint, idempotent=True, **kwargs):
+        return self.request('POST', endpoint, idempotent=idempotent, **kwargs)
+
+    def request(self, method, endpoint, idempotent=True, **kwargs):
+        with track('outbound'):
+            return self._request(method, endpoint, idempotent, **kwargs)
+
+    def _request(self, method, endpoint, idempotent, **kwargs):
+        if not self.breaker.allow():
+            raise CircuitOpenError('%s is unavailable' % self.base_url)
+        retry_on = (requests.ConnectionError, requests.Timeout) if idempotent else (requests.ConnectTimeout,)
+        kwargs.setdefault('timeout', self.timeout)
+        attempt = 0
+        recorded = False
+        try:
+            while True:
+                started = time.perf_counter()
+                try:
+                    response = self.session.request(method, self.base_url + endpoint, **kwargs)
+                    response.raise_for_status()
+                except requests.RequestException as e:
+                    self.metrics.record(endpoint, time.perf_counter() - started, error=True)
+                    retry_status = (idempotent and e.response is not None
+                                    and e.response.status_code in self.RETRY_STATUSES)
+                    retry = attempt < self.retries and (isinstance(e, retry_on) or retry_status)
+                    if not retry:
+                        recorded = True
+                        if e.response is None or e.response.status_code >= 500:
+                            self.breaker.record_failure()
+                        else:
+                            self.breaker.record_success()
+                        raise
+                    attempt += 1
+                    time.sleep(self.backoff_factor * 2 ** (attempt - 1))
+                    continue
+                self.metrics.record(endpoint, time.perf_counter() - started)
+                recorded = True
+                self.breaker.record_success()
+                return response
+        finally:
+            # Any other exception says nothing about the service, the next call may be the trial
+            if not recorded:
+                self.breaker.release()
+
+
+class AsyncHttpClient:
+    """HttpClient for asyncio code, the same timeouts, retries and circuit breaker on top of httpx.
+
+    Pass the breaker and the metrics of the HttpClient of the same service to
+    share them. httpx is optional, ``available`` tells whether it is installed.
+    The httpx client is created on the first request, inside the event loop.
+    """
+    RETRY_STATUSES = HttpClient.RETRY_STATUSES
+    available = httpx is not None
+
+    def __init__(self, base_url, connect_timeout=3.05, read_timeout=30, retries=2, backoff_factor=0.5,
+                 pool_size=10, failure_threshold=5, reset_timeout=30, breaker=None, metrics=None):
+        self.base_url = base_url.rstrip('/') + '/'
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.retries = retries
+        self.backoff_factor = backoff_factor
+        self.pool_size = pool_size
+        self.breaker = breaker or CircuitBreaker(failure_threshold, reset_timeout)
+        self.metrics = metrics or LatencyMetrics()
+        self._client = None
+
+    @property
+    def client(self):
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                timeout=httpx.Timeout(self.read_timeout, connect=self.connect_timeout),
+                limits=httpx.Limits(max_connections=self.pool_size, max_keepalive_connections=self.pool_size))
+        return self._client
+
+    async def post(self, endpoint, idempotent=True, **kwargs):
+        return await self.request('POST', endpoint, idempotent=idempotent, **kwargs)
+
+    async def request(self, method, endpoint, idempotent=True, **kwargs):
+        if not self.breaker.allow():
+            raise CircuitOpenError('%s is unavailable' % self.base_url)
+        retry_on = (httpx.TransportError,) if idempotent else (httpx.ConnectTimeout,)
+        attempt = 0
+        recorded = False
+        try:
+            while True:
+                started = time.perf_counter()
+                try:
+                    response = await self.client.request(method, self.base_url + endpoint, **kwargs)
+                    response.raise_for_status()
+                except httpx.HTTPError as e:
+                    self.metrics.record(endpoint, time.perf_counter() - started, error=True)
+                    status = e.response.status_code if isinstance(e, httpx.HTTPStatusError) else None
+                    retry_status = idempotent and status in self.RETRY_STATUSES
+                    retry = attempt < self.retries and (isinstance(e, retry_on) or retry_status)
+                    if not retry:
+                        recorded = True
+                        if status is None or status >= 500:
+                            self.breaker.record_failure()
+                        else:
+                            self.breaker.record_success()
+                        raise
+                    attempt += 1
+                    await asyncio.sleep(self.backoff_factor * 2 ** (attempt - 1))
+                    continue
+                self.metrics.record(endpoint, time.perf_counter() - started)
+                recorded = True
+                self.breaker.record_success()
+                return response
+        finally:
+            # Cancellation or another exception says nothing about the service, the next call may be the trial
+            if not recorded:
+                self.breaker.release()
+
+    async def close(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
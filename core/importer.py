@@ -0,0 +1,117 @@
+import codecs
+import csv
+import json
+
+from django.db import transaction
+
+from .autocomplete import add_business_trips
+from .bulk import bulk_create_with_ids
+from .forms import BusinessTripForm, PassportDataForm
+from .models import BusinessTrip, BusinessTripQueue, BusinessTripState, PassportData
+from .notifications import send_email_by_queue, add_digest_events
+from .trip_state import get_state
+from .workflow import WorkFlow
+
+
+CSV = 'csv'
+JSONL = 'jsonl'
+FORMATS = (CSV, JSONL)
+
+
+class ImportResult:
+    def __init__(self):
+        self.imported = 0
+        self.failed = 0
+
+
+def get_format(filename):
+    extension = filename.rsplit('.', 1)[-1].lower()
+    return JSONL if extension in ('jsonl', 'json', 'ndjson') else CSV
+
+
+def read_rows(file, file_format):
+    """Yield (line number, row dict) from a binary CSV or JSONL file without loading it whole.
+
+    CSV columns and JSON keys are the field names of BusinessTripForm and PassportDataForm.
+    A JSONL line which is not valid JSON is yielded as the ValueError instead of the row.
+    """
+    lines = codecs.iterdecode(file, 'utf-8-sig')
+    if file_format == CSV:
+        reader = csv.DictReader(lines)
+        for row in reader:
+            yield reader.line_num, row
+        return
+    for line_number, line in enumerate(lines, 1):
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError as e:
+            yield line_number, e
+            continue
+        yield line_number, row
+
+
+def validate_row(row):
+    """Return (trip, passport data, errors), the objects are unsaved and None if the row is invalid."""
+    if not isinstance(row, dict):
+        return None, None, {'__all__': [str(row) if isinstance(row, Exception) else 'Ожидается объект']}
+    business_trip_form = BusinessTripForm(row)
+    passport_data_form = PassportDataForm(row)
+    if business_trip_form.is_valid() and passport_data_form.is_valid():
+        return business_trip_form.save(commit=False), passport_data_form.save(commit=False), None
+    errors = dict(business_trip_form.errors)
+    errors.update(passport_data_form.errors)
+    return None, None, errors
+
+
+def save_batch(batch):
+    """Insert the trips with their passport data, initial queue rows and states, one query per table."""
+    with transaction.atomic():
+        business_trips = bulk_create_with_ids(BusinessTrip, [business_trip for business_trip, _ in batch])
+        queues, status = get_state([(WorkFlow.INITIAL_DEPARTMENT, BusinessTripQueue.NEW)])
+        passports = []
+        queue_rows = []
+        states = []
+        for business_trip, (_, passport_data) in zip(business_trips, batch):
+            passport_data.business_trip = business_trip
+            passports.append(passport_data)
+            queue_rows.append(BusinessTripQueue(business_trip=business_trip, queue=WorkFlow.INITIAL_DEPARTMENT))
+            states.append(BusinessTripState(business_trip=business_trip, queues=queues, status=status))
+        PassportData.objects.bulk_create(passports)
+        BusinessTripQueue.objects.bulk_create(queue_rows)
+        BusinessTripState.objects.bulk_create(states)
+        add_digest_events(WorkFlow.INITIAL_DEPARTMENT, business_trips)
+        add_business_trips(business_trips)
+
+
+def import_business_trips(rows, batch_size=500, on_error=None):
+    """Validate (line number, row) pairs and insert the valid ones in batches of ``batch_size``.
+
+    Only one batch is kept in memory. ``on_error(line number, field, message)``
+    is called for every error of an invalid row. The subscribers of the
+    initial department get one notification per import, those in digest mode
+    get the imported trips in their next summary instead.
+    """
+    result = ImportResult()
+    batch = []
+    for line_number, row in rows:
+        business_trip, passport_data, errors = validate_row(row)
+        if errors:
+            result.failed += 1
+            if on_error is not None:
+                for field, messages in errors.items():
+                    for message in messages:
+                        on_error(line_number, field, message)
+            continue
+        batch.append((business_trip, passport_data))
+        if len(batch) >= batch_size:
+            save_batch(batch)
+            result.imported += len(batch)
+            batch = []
+    if batch:
+        save_batch(batch)
+        result.imported += len(batch)
+    if result.imported:
+        send_email_by_queue(queue=WorkFlow.INITIAL_DEPARTMENT)
+    return result
@@ -0,0 +1,28 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from core.notifications import deliver_pending_emails, flush_digests
+
+
+class Command(BaseCommand):
+    help = 'Delivers notifications from the email outbox'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='Deliver due messages and exit')
+        parser.add_argument('--batch', type=int, default=100, help='Messages claimed per iteration')
+        parser.add_argument('--workers', type=int, default=settings.EMAIL_OUTBOX_WORKERS,
+                            help='Messages sent concurrently')
+        parser.add_argument('--sleep', type=float, default=5, help='Seconds to wait when the outbox is empty')
+
+    def handle(self, *args, **options):
+        while True:
+            flush_digests()
+            delivered = deliver_pending_emails(options['batch'], options['workers'])
+            if delivered:
+                self.stdout.write('Processed %s messages' % delivered)
+            if options['once'] and not delivered:
+                break
+            if not delivered:
+                time.sleep(options['sleep'])
@@ -0,0 +1,19 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from core.generator import generate_business_trips
+
+
+class Command(BaseCommand):
+    help = 'Inserts random business trips in every workflow state for load testing'
+
+    def add_arguments(self, parser):
+        parser.add_argument('count', type=int)
+        parser.add_argument('--batch', type=int, default=1000, help='Trips inserted per transaction')
+        parser.add_argument('--seed', type=int, default=None)
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        count = generate_business_trips(options['count'], options['batch'], options['seed'])
+        self.stdout.write('Generated %s business trips in %.1f s' % (count, time.perf_counter() - started))
@@ -0,0 +1,31 @@
+import csv
+import sys
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from core.importer import FORMATS, get_format, read_rows, import_business_trips
+
+
+class Command(BaseCommand):
+    help = 'Imports business trips from a CSV or JSONL file into the initial department queue'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--format', choices=FORMATS, help='Guessed from the file extension by default')
+        parser.add_argument('--batch', type=int, default=settings.IMPORT_BATCH_SIZE, help='Trips inserted per transaction')
+        parser.add_argument('--errors', help='CSV report of invalid rows, written to stderr by default')
+
+    def handle(self, *args, **options):
+        file_format = options['format'] or get_format(options['path'])
+        report = open(options['errors'], 'w', newline='', encoding='utf-8') if options['errors'] else sys.stderr
+        try:
+            writer = csv.writer(report)
+            writer.writerow(['line', 'field', 'error'])
+            with open(options['path'], 'rb') as f:
+                result = import_business_trips(read_rows(f, file_format), options['batch'],
+                                               on_error=lambda *error: writer.writerow(error))
+        finally:
+            if report is not sys.stderr:
+                report.close()
+        self.stdout.write('Imported %s business trips, %s rows are invalid' % (result.imported, result.failed))
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from core.trip_state import rebuild_business_trip_states
+
+
+class Command(BaseCommand):
+    help = 'Regenerates the workflow state of every business trip from the queue history'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch', type=int, default=1000, help='States inserted per query')
+
+    def handle(self, *args, **options):
+        count = rebuild_business_trip_states(options['batch'])
+        self.stdout.write('Rebuilt %s business trip states' % count)
@@ -0,0 +1,24 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from core.documents import process_render_jobs
+
+
+class Command(BaseCommand):
+    help = 'Renders Orders and funding applications queued on workflow transitions'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='Process due jobs and exit')
+        parser.add_argument('--batch', type=int, default=10, help='Jobs fetched per iteration')
+        parser.add_argument('--sleep', type=float, default=5, help='Seconds to wait when there are no due jobs')
+
+    def handle(self, *args, **options):
+        while True:
+            processed = process_render_jobs(options['batch'])
+            if processed:
+                self.stdout.write('Processed %s render jobs' % processed)
+            if options['once'] and not processed:
+                break
+            if not processed:
+                time.sleep(options['sleep'])
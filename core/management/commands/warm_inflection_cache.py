@@ -0,0 +1,27 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from core.models import BusinessTrip
+from core.morphology import inflection_cache, get_morphed_word
+
+
+class Command(BaseCommand):
+    help = 'Inflects names and positions of existing business trips and stores the inflection cache on disk'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--path', default=getattr(settings, 'MORPHOLOGY_CACHE_FILE', None),
+                            help='Cache file, MORPHOLOGY_CACHE_FILE by default')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        if not path:
+            raise CommandError('Set MORPHOLOGY_CACHE_FILE or pass --path')
+        fields = ('second_name', 'first_name', 'patronymic', 'position')
+        for values in BusinessTrip.objects.values_list(*fields).iterator():
+            for word in values[:3]:
+                for case in ('accs', 'gent'):
+                    get_morphed_word(word, case)
+            for word in values[3].split():
+                get_morphed_word(word, 'gent')
+        count = inflection_cache.dump(path)
+        self.stdout.write('Stored %s inflections to %s (%s)' % (count, path, inflection_cache.stats()))
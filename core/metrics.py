@@ -0,0 +1,131 @@
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500)
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative_counts(self):
+        total = 0
+        for bound, count in zip(self.buckets + ('+Inf',), self.counts):
+            total += count
+            yield bound, total
+
+
+class MetricsRegistry:
+    """Histograms per metric and view name of this process, rendered in the Prometheus text format."""
+
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def observe(self, name, help_text, buckets, view, value):
+        with self._lock:
+            histograms = self._metrics.setdefault(name, (help_text, {}))[1]
+            if view not in histograms:
+                histograms[view] = Histogram(buckets)
+            histograms[view].observe(value)
+
+    def clear(self):
+        with self._lock:
+            self._metrics.clear()
+
+    def render(self):
+        lines = []
+        with self._lock:
+            for name, (help_text, histograms) in sorted(self._metrics.items()):
+                lines.append('# HELP %s %s' % (name, help_text))
+                lines.append('# TYPE %s histogram' % name)
+                for view, histogram in sorted(histograms.items()):
+                    label = escape_label(view)
+                    for bound, count in histogram.cumulative_counts():
+                        lines.append('%s_bucket{view="%s",le="%s"} %s' % (name, label, bound, count))
+                    lines.append('%s_sum{view="%s"} %s' % (name, label, histogram.sum))
+                    lines.append('%s_count{view="%s"} %s' % (name, label, histogram.count))
+        return '\n'.join(lines) + '\n'
+
+
+def escape_label(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+registry = MetricsRegistry()
+
+_local = threading.local()
+
+
+class RequestStats:
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.sql_count = 0
+        self.sql_time = 0.0
+        self.outbound_time = 0.0
+        self.morphology_time = 0.0
+
+
+def start_request():
+    _local.stats = RequestStats()
+    return _local.stats
+
+
+def get_request_stats():
+    return getattr(_local, 'stats', None)
+
+
+def finish_request(view):
+    stats = get_request_stats()
+    if stats is None:
+        return
+    _local.stats = None
+    registry.observe('business_trip_request_duration_seconds', 'Wall time of the request.',
+                     DURATION_BUCKETS, view, time.perf_counter() - stats.started)
+    registry.observe('business_trip_request_sql_queries', 'SQL queries per request.',
+                     COUNT_BUCKETS, view, stats.sql_count)
+    registry.observe('business_trip_request_sql_duration_seconds', 'Time spent in SQL queries.',
+                     DURATION_BUCKETS, view, stats.sql_time)
+    registry.observe('business_trip_request_outbound_duration_seconds', 'Time spent in calls to datamart.',
+                     DURATION_BUCKETS, view, stats.outbound_time)
+    registry.observe('business_trip_request_morphology_duration_seconds', 'Time spent in pymorphy2.',
+                     DURATION_BUCKETS, view, stats.morphology_time)
+
+
+@contextmanager
+def track(kind):
+    """Add the time spent in the block to ``<kind>_time`` of the current request, if any."""
+    stats = get_request_stats()
+    if stats is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        attribute = kind + '_time'
+        setattr(stats, attribute, getattr(stats, attribute) + time.perf_counter() - started)
+
+
+def sql_wrapper(execute, sql, params, many, context):
+    """Database execute wrapper counting queries of the current request."""
+    stats = get_request_stats()
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        if stats is not None:
+            stats.sql_count += 1
+            stats.sql_time += time.perf_counter() - started
@@ -0,0 +1,29 @@
+from django.db import connection
+
+from . import metrics
+
+
+class MetricsMiddleware:
+    """Record wall time, SQL queries and time spent in datamart and pymorphy2 per URL name.
+
+    Put it first in MIDDLEWARE so the timings cover the other middleware too.
+    The registry belongs to the process, scrape every worker or run one.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        metrics.start_request()
+        try:
+            with connection.execute_wrapper(metrics.sql_wrapper):
+                return self.get_response(request)
+        finally:
+            metrics.finish_request(get_view_name(request))
+
+
+def get_view_name(request):
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return 'unresolved'
+    return match.url_name or match.view_name
@@ -1,5 +1,6 @@
 from django.db import models
 from django.contrib.auth.models import User
+from django.utils import timezone
 
 
 class Departments:
@@ -11,7 +12,16 @@ class Departments:
 
     @staticmethod
     def get_departments():
-        return [k for k in Departments.__dict__.keys() if not k.startswith('_') and k != 'get_departments']
+        return DEPARTMENTS
+
+    @staticmethod
+    def get_choices():
+        return DEPARTMENT_CHOICES
+
+
+# Collected once at import instead of scanning Departments.__dict__ on every call
+DEPARTMENT_CHOICES = [value for key, value in vars(Departments).items() if isinstance(value, tuple)]
+DEPARTMENTS = tuple(code for code, name in DEPARTMENT_CHOICES)
 
 
 class DeputyGovernor(models.Model):
@@ -145,11 +155,12 @@ class Document:
 
 
 class EmailSending(models.Model):
-    QUEUE = [(Departments().__getattribute__(d)[0], Departments().__getattribute__(d)[1])
-             for d in Departments.get_departments()]
+    QUEUE = Departments.get_choices()
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     queue = models.CharField(max_length=255, verbose_name='Очередь', choices=QUEUE)
     active = models.BooleanField(default=True)
+    digest = models.BooleanField(default=False, verbose_name='Присылать сводку')
+    digest_window = models.PositiveIntegerField(default=60, verbose_name='Период сводки (мин.)')
     date_added = models.DateField(auto_now_add=True)
     date_modified = models.DateField(auto_now=True)
 
@@ -166,10 +177,124 @@ class BusinessTripQueue(models.Model):
         (COMPLETED, 'Выполненные'),
         (REJECTED, 'Отклоненные'),
     ]
-    QUEUE = [(Departments().__getattribute__(d)[0], Departments().__getattribute__(d)[1])
-             for d in Departments.get_departments()]
+    QUEUE = Departments.get_choices()
     queue = models.CharField(max_length=255, verbose_name='Очередь', choices=QUEUE)
     business_trip = models.ForeignKey(BusinessTrip, on_delete=models.CASCADE)
     status = models.CharField(max_length=255, verbose_name='Статус', default=NEW)
     date_added = models.DateField(auto_now_add=True)
     date_modified = models.DateField(auto_now=True)
+
+    class Meta:
+        indexes = [models.Index(fields=['queue', 'status', 'business_trip'])]
+
+
+class RenderJob(models.Model):
+    PENDING = 'PENDING'
+    RUNNING = 'RUNNING'
+    DONE = 'DONE'
+    FAILED = 'FAILED'
+    STATUS_CHOICES = [
+        (PENDING, 'Ожидает'),
+        (RUNNING, 'Выполняется'),
+        (DONE, 'Готово'),
+        (FAILED, 'Ошибка'),
+    ]
+    business_trip = models.ForeignKey(BusinessTrip, on_delete=models.CASCADE)
+    document_type = models.CharField(max_length=255, verbose_name='Документ', choices=Document.DOCUMENT_CHOICES)
+    status = models.CharField(max_length=255, verbose_name='Статус', choices=STATUS_CHOICES, default=PENDING)
+    attempts = models.PositiveIntegerField(default=0, verbose_name='Попытки')
+    next_attempt = models.DateTimeField(verbose_name='Следующая попытка')
+    error = models.TextField(blank=True, verbose_name='Ошибка')
+    date_added = models.DateTimeField(auto_now_add=True)
+    date_modified = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = ('business_trip', 'document_type')
+        indexes = [models.Index(fields=['status', 'next_attempt'])]
+
+    def __str__(self):
+        return '%s %s %s' % (self.business_trip_id, self.document_type, self.status)
+
+
+class EmailOutbox(models.Model):
+    PENDING = 'PENDING'
+    SENDING = 'SENDING'
+    SENT = 'SENT'
+    FAILED = 'FAILED'
+    STATUS_CHOICES = [
+        (PENDING, 'Ожидает'),
+        (SENDING, 'Отправляется'),
+        (SENT, 'Отправлено'),
+        (FAILED, 'Ошибка'),
+    ]
+    address = models.CharField(max_length=255, verbose_name='Адрес')
+    sender_name = models.CharField(max_length=255, verbose_name='Отправитель')
+    subject = models.CharField(max_length=255, verbose_name='Тема')
+    body = models.TextField(verbose_name='Текст')
+    status = models.CharField(max_length=255, verbose_name='Статус', choices=STATUS_CHOICES, default=PENDING)
+    attempts = models.PositiveIntegerField(default=0, verbose_name='Попытки')
+    next_attempt = models.DateTimeField(default=timezone.now, verbose_name='Следующая попытка')
+    error = models.TextField(blank=True, verbose_name='Ошибка')
+    sent_at = models.DateTimeField(null=True, blank=True, verbose_name='Отправлено')
+    date_added = models.DateTimeField(auto_now_add=True)
+    date_modified = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [models.Index(fields=['status', 'next_attempt'])]
+
+    def __str__(self):
+        return '%s %s %s' % (self.address, self.subject, self.status)
+
+
+class DigestEvent(models.Model):
+    email_sending = models.ForeignKey(EmailSending, on_delete=models.CASCADE)
+    business_trip = models.ForeignKey(BusinessTrip, on_delete=models.CASCADE)
+    date_added = models.DateTimeField(auto_now_add=True)
+
+
+class BusinessTripState(models.Model):
+    """Current workflow state of a trip, maintained from its BusinessTripQueue rows."""
+    business_trip = models.OneToOneField(BusinessTrip, on_delete=models.CASCADE, related_name='state')
+    queues = models.CharField(max_length=255, blank=True, verbose_name='Текущие очереди')
+    status = models.CharField(max_length=255, verbose_name='Статус', choices=BusinessTripQueue.STATUS_CHOICES,
+                              default=BusinessTripQueue.NEW)
+    date_modified = models.DateTimeField(auto_now=True, verbose_name='Дата последнего перехода')
+
+    class Meta:
+        indexes = [models.Index(fields=['status', 'business_trip'])]
+
+    def __str__(self):
+        return '%s %s %s' % (self.business_trip_id, self.queues, self.status)
+
+    def get_queues(self):
+        return self.queues.split(',') if self.queues else []
+
+
+class RequestProfile(models.Model):
+    CPROFILE = 'CPROFILE'
+    SAMPLING = 'SAMPLING'
+    MODE_CHOICES = [
+        (CPROFILE, 'cProfile'),
+        (SAMPLING, 'Сэмплирование'),
+    ]
+    user = models.ForeignKey(User, null=True, blank=True, on_delete=models.SET_NULL)
+    view = models.CharField(max_length=255, verbose_name='Представление')
+    path = models.TextField(verbose_name='Адрес')
+    mode = models.CharField(max_length=255, verbose_name='Профилировщик', choices=MODE_CHOICES)
+    duration = models.FloatField(verbose_name='Длительность, с')
+    stats = models.BinaryField(null=True, verbose_name='pstats')
+    stacks = models.TextField(blank=True, verbose_name='Стеки')
+    date_added = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return '%s %s %.3f' % (self.view, self.mode, self.duration)
+
+
+class Position(models.Model):
+    name = models.CharField(max_length=255, unique=True, verbose_name='Должность')
+
+    class Meta:
+        ordering = ['name']
+
+    def __str__(self):
+        return self.name
@@ -0,0 +1,144 @@
+import atexit
+import gc
+import json
+import os
+import threading
+from collections import OrderedDict
+
+from django.conf import settings
+
+from .metrics import track
+
+
+_analyzer = None
+_analyzer_lock = threading.Lock()
+
+
+def get_analyzer():
+    """Return the shared pymorphy2 analyzer, loading the dictionaries on first use."""
+    global _analyzer
+    if _analyzer is None:
+        with _analyzer_lock:
+            if _analyzer is None:
+                import pymorphy2
+                _analyzer = pymorphy2.MorphAnalyzer()
+    return _analyzer
+
+
+def preload():
+    """Load the analyzer in the WSGI master process before workers are forked.
+
+    Objects allocated so far are moved to the permanent GC generation, so the
+    collector in the workers does not touch them and the dictionary pages stay
+    shared copy-on-write.
+    """
+    analyzer = get_analyzer()
+    gc.collect()
+    gc.freeze()
+    return analyzer
+
+
+class InflectionCache:
+    """Bounded LRU cache of (word, case) -> inflected form with hit/miss counters.
+
+    Words are stored lower-cased, capitalization is restored by the caller.
+    A ``None`` value means pymorphy2 could not inflect the word.
+    """
+
+    def __init__(self, max_size=10000):
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._data)
+
+    def __contains__(self, key):
+        return key in self._data
+
+    def get(self, word, case, default=None):
+        key = (word, case)
+        with self._lock:
+            if key in self._data:
+                self._data.move_to_end(key)
+                self.hits += 1
+                return self._data[key]
+            self.misses += 1
+        return default
+
+    def set(self, word, case, value):
+        key = (word, case)
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self):
+        return {'hits': self.hits,
+                'misses': self.misses,
+                'size': len(self._data),
+                'max_size': self.max_size}
+
+    def load(self, path):
+        """Load entries stored by ``dump``, a missing file is not an error."""
+        if not path or not os.path.exists(path):
+            return 0
+        with open(path, encoding='utf-8') as f:
+            entries = json.load(f)
+        for word, case, value in entries:
+            self.set(word, case, value)
+        return len(entries)
+
+    def dump(self, path):
+        """Write entries from the least to the most recently used one."""
+        with self._lock:
+            entries = [[word, case, value] for (word, case), value in self._data.items()]
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(entries, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+        return len(entries)
+
+
+inflection_cache = InflectionCache(getattr(settings, 'MORPHOLOGY_CACHE_SIZE', 10000))
+
+
+def inflect(word, case):
+    """Return the lower-cased inflected form of the word or None."""
+    key = word.lower()
+    missing = object()
+    inflected = inflection_cache.get(key, case, missing)
+    if inflected is missing:
+        with track('morphology'):
+            morphed = get_analyzer().parse(word)[0].inflect({case})
+        inflected = morphed.word if morphed else None
+        inflection_cache.set(key, case, inflected)
+    return inflected
+
+
+def get_morphed_word(word, case):
+    morphed = inflect(word, case)
+    if morphed:
+        if word[0].isupper():
+            return morphed.capitalize()
+        else:
+            return morphed
+    return word
+
+
+def load_inflection_cache():
+    """Warm the cache from MORPHOLOGY_CACHE_FILE and store it back on exit."""
+    path = getattr(settings, 'MORPHOLOGY_CACHE_FILE', None)
+    if not path:
+        return
+    inflection_cache.load(path)
+    atexit.register(inflection_cache.dump, path)
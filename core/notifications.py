@@ -0,0 +1,173 @@
+import datetime
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Min
+from django.utils import timezone
+from urllib3.exceptions import NewConnectionError
+
+from .models import Departments, EmailSending, EmailOutbox, DigestEvent
+from .utilities import send_email
+
+
+SENDER_NAME = 'noreply'
+SUBJECT = 'Заявка на командировку'
+
+
+def send_email_by_queue(queue, business_trip=None):
+    """Put notifications for the queue subscribers into the outbox.
+
+    Call it inside the transaction that changes the queue, the messages are
+    delivered by the deliver_emails command once the transaction is committed.
+    Subscribers in digest mode get the trip recorded for their next summary,
+    a notification without a trip is not sent to them, see add_digest_events.
+    """
+    email_sending = EmailSending.objects.filter(queue=queue.upper(),
+                                                active=True).select_related('user')
+    messages = []
+    events = []
+    for obj in email_sending:
+        if obj.digest:
+            if business_trip is not None:
+                events.append(DigestEvent(email_sending=obj, business_trip=business_trip))
+            continue
+        body = 'В очереди "%s" новая заявка' % getattr(Departments, obj.queue)[1]
+        messages.append(EmailOutbox(address=obj.user.email, sender_name=SENDER_NAME, subject=SUBJECT, body=body))
+    EmailOutbox.objects.bulk_create(messages)
+    DigestEvent.objects.bulk_create(events)
+
+
+def add_digest_events(queue, business_trips):
+    """Record the trips for the next summary of the queue subscribers in digest mode."""
+    email_sendings = EmailSending.objects.filter(queue=queue.upper(), active=True, digest=True)
+    DigestEvent.objects.bulk_create([DigestEvent(email_sending=email_sending, business_trip=business_trip)
+                                     for email_sending in email_sendings for business_trip in business_trips])
+
+
+def get_digest_body(email_sending, business_trips):
+    lines = ['В очереди "%s" новые заявки (%s):' % (getattr(Departments, email_sending.queue)[1],
+                                                     len(business_trips))]
+    for business_trip in business_trips:
+        lines.append('№%s %s, %s' % (business_trip.id, business_trip, business_trip.location))
+    return '\n'.join(lines)
+
+
+def get_due_digests(now, limit):
+    """Return up to ``limit`` subscribers whose digest window has passed, the longest waiting first.
+
+    The window starts with the oldest pending event of the subscriber, one row
+    per subscriber is read instead of the events.
+    """
+    email_sendings = EmailSending.objects.annotate(oldest=Min('digestevent__date_added'))\
+        .filter(oldest__isnull=False).select_related('user').order_by('oldest')
+    due = []
+    for email_sending in email_sendings.iterator():
+        if email_sending.oldest <= now - datetime.timedelta(minutes=email_sending.digest_window):
+            due.append(email_sending)
+            if len(due) >= limit:
+                break
+    return due
+
+
+def flush_digests(limit=100):
+    """Turn the events of up to ``limit`` subscribers whose digest window has passed into one message each.
+
+    A summary takes at most DIGEST_MAX_EVENTS events, the rest go into the
+    next one. Returns the number of queued summaries.
+    """
+    now = timezone.now()
+    flushed = 0
+    for email_sending in get_due_digests(now, limit):
+        subscriber_events = list(DigestEvent.objects.filter(email_sending=email_sending)
+                                 .select_related('business_trip').order_by('id')[:settings.DIGEST_MAX_EVENTS])
+        if not subscriber_events:
+            continue
+        business_trips = list({event.business_trip_id: event.business_trip for event in subscriber_events}.values())
+        with transaction.atomic():
+            deleted, _ = DigestEvent.objects.filter(id__in=[event.id for event in subscriber_events]).delete()
+            # Another worker has already flushed these events
+            if deleted != len(subscriber_events):
+                transaction.set_rollback(True)
+                continue
+            EmailOutbox.objects.create(address=email_sending.user.email, sender_name=SENDER_NAME, subject=SUBJECT,
+                                       body=get_digest_body(email_sending, business_trips))
+        flushed += 1
+    return flushed
+
+
+def get_retry_delay(attempts):
+    delay = settings.EMAIL_OUTBOX_RETRY_DELAY * 2 ** (attempts - 1)
+    return datetime.timedelta(seconds=min(delay, settings.EMAIL_OUTBOX_MAX_RETRY_DELAY))
+
+
+def claim_emails(limit):
+    """Lease due messages to this worker.
+
+    A message is claimed by a conditional update, so concurrent workers never
+    get the same one. SENDING messages are claimed again only when the worker
+    holding them did not finish within EMAIL_OUTBOX_LEASE.
+    """
+    now = timezone.now()
+    lease = now + datetime.timedelta(seconds=settings.EMAIL_OUTBOX_LEASE)
+    emails = EmailOutbox.objects.filter(status__in=[EmailOutbox.PENDING, EmailOutbox.SENDING],
+                                        next_attempt__lte=now).order_by('next_attempt')[:limit]
+    claimed = []
+    for email in emails:
+        if EmailOutbox.objects.filter(pk=email.pk, status=email.status, next_attempt=email.next_attempt)\
+                .update(status=EmailOutbox.SENDING, attempts=F('attempts') + 1, next_attempt=lease):
+            email.attempts += 1
+            claimed.append(email)
+    return claimed
+
+
+def deliver(email):
+    send_email(email.address, email.sender_name, email.subject, email.body)
+
+
+def may_have_been_sent(error):
+    """Whether datamart may have got the message before the request failed.
+
+    Errors while connecting are raised before the body is written. A read
+    timeout or a connection dropped or reset later leaves it unknown.
+    """
+    if isinstance(error, (requests.ConnectTimeout, requests.exceptions.SSLError, requests.exceptions.ProxyError)):
+        return False
+    if isinstance(error, requests.ConnectionError):
+        reason = error.args[0] if error.args else None
+        # A refused or unresolved connection comes as MaxRetryError with NewConnectionError as the reason
+        return not isinstance(getattr(reason, 'reason', reason), NewConnectionError)
+    return isinstance(error, requests.Timeout)
+
+
+def mark_delivered(email, error):
+    if error is None:
+        email.status = EmailOutbox.SENT
+        email.sent_at = timezone.now()
+        email.error = ''
+    else:
+        email.error = repr(error)
+        # A message that may have been sent is not retried to avoid a duplicate
+        if may_have_been_sent(error) or email.attempts >= settings.EMAIL_OUTBOX_MAX_ATTEMPTS:
+            email.status = EmailOutbox.FAILED
+        else:
+            email.status = EmailOutbox.PENDING
+            email.next_attempt = timezone.now() + get_retry_delay(email.attempts)
+    email.save(update_fields=['status', 'sent_at', 'error', 'next_attempt', 'date_modified'])
+
+
+def deliver_pending_emails(limit=100, workers=None):
+    """Send due outbox messages on a bounded thread pool and return their number.
+
+    Only the HTTP calls run in the pool, the outbox rows are updated from the
+    calling thread.
+    """
+    emails = claim_emails(limit)
+    if not emails:
+        return 0
+    with ThreadPoolExecutor(max_workers=workers or settings.EMAIL_OUTBOX_WORKERS) as executor:
+        futures = [(email, executor.submit(deliver, email)) for email in emails]
+        for email, future in futures:
+            mark_delivered(email, future.exception())
+    return len(emails)
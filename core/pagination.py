@@ -0,0 +1,88 @@
+import base64
+import binascii
+
+
+class KeysetPage:
+    def __init__(self, object_list, next_cursor=None, previous_cursor=None, total=None, total_exceeded=False):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+        self.total = total
+        self.total_exceeded = total_exceeded
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+
+class KeysetPaginator:
+    """Pages a queryset by ``-id`` with opaque next/previous cursors.
+
+    Every page is fetched with ``id < cursor`` or ``id > cursor`` and a LIMIT, so
+    its cost does not depend on how deep it is, unlike COUNT(*) and OFFSET.
+    The total is counted up to ``count_limit`` rows only, ``None`` disables it.
+    """
+    NEXT = 'n'
+    PREVIOUS = 'p'
+
+    def __init__(self, queryset, per_page, count_limit=None):
+        self.queryset = queryset
+        self.per_page = per_page
+        self.count_limit = count_limit
+
+    @staticmethod
+    def encode_cursor(direction, pk):
+        return base64.urlsafe_b64encode(('%s%s' % (direction, pk)).encode()).decode().rstrip('=')
+
+    @classmethod
+    def decode_cursor(cls, cursor):
+        """Return (direction, id), an invalid cursor points to the first page."""
+        if not cursor:
+            return None, None
+        try:
+            value = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode()
+            direction, pk = value[0], int(value[1:])
+        except (binascii.Error, UnicodeDecodeError, ValueError, IndexError):
+            return None, None
+        if direction not in (cls.NEXT, cls.PREVIOUS):
+            return None, None
+        return direction, pk
+
+    def get_page(self, cursor=None):
+        direction, pk = self.decode_cursor(cursor)
+        if direction == self.PREVIOUS:
+            queryset = self.queryset.filter(id__gt=pk).order_by('id')
+        elif direction == self.NEXT:
+            queryset = self.queryset.filter(id__lt=pk).order_by('-id')
+        else:
+            queryset = self.queryset.order_by('-id')
+        object_list = list(queryset[:self.per_page + 1])
+        has_more = len(object_list) > self.per_page
+        object_list = object_list[:self.per_page]
+        if direction == self.PREVIOUS:
+            object_list.reverse()
+            has_next, has_previous = True, has_more
+        else:
+            has_next, has_previous = has_more, direction == self.NEXT
+        page = KeysetPage(object_list)
+        if object_list:
+            if has_next:
+                page.next_cursor = self.encode_cursor(self.NEXT, object_list[-1].id)
+            if has_previous:
+                page.previous_cursor = self.encode_cursor(self.PREVIOUS, object_list[0].id)
+        if self.count_limit is not None:
+            page.total = self.queryset[:self.count_limit + 1].count()
+            page.total_exceeded = page.total > self.count_limit
+            page.total = min(page.total, self.count_limit)
+        return page
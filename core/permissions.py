@@ -0,0 +1,104 @@
+import uuid
+from functools import wraps
+
+from django.conf import settings
+from django.contrib.auth.models import User, Group
+from django.core.cache import cache
+from django.core.exceptions import PermissionDenied
+from django.db.models.signals import m2m_changed, post_save, post_delete
+from django.dispatch import receiver
+
+from .models import Departments
+
+
+SESSION_KEY = '_department_permissions'
+VERSION_CACHE_KEY = 'core:department_permissions_version'
+
+LOCAL_CACHE_BACKENDS = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+
+
+def get_user_permissions(user):
+    permissions = []
+    for department in Departments.get_departments():
+        if user.has_perm('core.' + department):
+            permissions.append(department)
+    return permissions
+
+
+def get_permissions_version():
+    version = cache.get(VERSION_CACHE_KEY)
+    if version is None:
+        version = uuid.uuid4().hex
+        if not cache.add(VERSION_CACHE_KEY, version, None):
+            version = cache.get(VERSION_CACHE_KEY)
+    return version
+
+
+def use_session_cache():
+    """PERMISSIONS_SESSION_CACHE, None means on when the default cache is shared by the processes."""
+    if settings.PERMISSIONS_SESSION_CACHE is not None:
+        return settings.PERMISSIONS_SESSION_CACHE
+    return settings.CACHES['default']['BACKEND'] not in LOCAL_CACHE_BACKENDS
+
+
+def get_request_permissions(request):
+    """Return the departments of the request user, resolved once per request.
+
+    With the session cache the set is also kept in the session until group or
+    permission membership changes. The version key lives in the Django cache,
+    a per-process cache would keep revoked permissions in the other workers.
+    """
+    if not hasattr(request, '_department_permissions'):
+        request._department_permissions = frozenset(_get_permissions(request))
+    return request._department_permissions
+
+
+def _get_permissions(request):
+    user = request.user
+    if not user.is_authenticated:
+        return []
+    if not use_session_cache():
+        return get_user_permissions(user)
+    version = get_permissions_version()
+    cached = request.session.get(SESSION_KEY)
+    if cached and cached['user'] == user.pk and cached['version'] == version:
+        return cached['permissions']
+    permissions = get_user_permissions(user)
+    request.session[SESSION_KEY] = {'user': user.pk, 'version': version, 'permissions': permissions}
+    return permissions
+
+
+def invalidate_permissions():
+    cache.set(VERSION_CACHE_KEY, uuid.uuid4().hex, None)
+
+
+@receiver(m2m_changed, sender=User.groups.through)
+@receiver(m2m_changed, sender=User.user_permissions.through)
+@receiver(m2m_changed, sender=Group.permissions.through)
+def permissions_changed(sender, action, **kwargs):
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        invalidate_permissions()
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=Group)
+def user_or_group_changed(sender, update_fields=None, **kwargs):
+    # is_superuser and is_active also change the result of has_perm, login only updates last_login
+    if update_fields is not None and set(update_fields) <= {'last_login'}:
+        return
+    invalidate_permissions()
+
+
+def department_required(department):
+    """Allow the view only to users with the department permission, checked through the request cache."""
+    def decorator(view):
+        @wraps(view)
+        def wrapped_view(request, *args, **kwargs):
+            if department not in get_request_permissions(request):
+                raise PermissionDenied
+            return view(request, *args, **kwargs)
+        return wrapped_view
+    return decorator
@@ -0,0 +1,113 @@
+import cProfile
+import logging
+import marshal
+import os
+import pstats
+import random
+import sys
+import threading
+import time
+from collections import Counter
+from functools import wraps
+
+from django.conf import settings
+from django.db import transaction
+
+from .middleware import get_view_name
+from .models import RequestProfile
+
+
+PARAMETER = 'profile'
+HEADER = 'HTTP_X_PROFILE'
+
+logger = logging.getLogger(__name__)
+
+
+class Sampler:
+    """Collect the stack of one thread every ``interval`` seconds from a background thread.
+
+    The stacks are kept in the collapsed format read by flamegraph.pl and speedscope.
+    ``enable`` and ``disable`` mirror cProfile.Profile.
+    """
+
+    def __init__(self, interval, thread_id=None):
+        self.interval = interval
+        self.thread_id = thread_id or threading.get_ident()
+        self.stacks = Counter()
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def enable(self):
+        self._thread.start()
+
+    def disable(self):
+        self._stopped.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stopped.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append('%s (%s:%s)' % (code.co_name, os.path.basename(code.co_filename), code.co_firstlineno))
+                frame = frame.f_back
+            if stack:
+                self.stacks[';'.join(reversed(stack))] += 1
+
+    def collapsed(self):
+        return '\n'.join('%s %s' % (stack, count) for stack, count in self.stacks.most_common())
+
+
+def get_profile_mode(request):
+    """Return the profiler requested by a staff user, else the sampler for PROFILE_SAMPLE_RATE of requests."""
+    value = request.GET.get(PARAMETER) or request.META.get(HEADER)
+    if value and request.user.is_staff:
+        return RequestProfile.SAMPLING if value.lower() == 'sample' else RequestProfile.CPROFILE
+    if settings.PROFILE_SAMPLE_RATE and random.random() < settings.PROFILE_SAMPLE_RATE:
+        return RequestProfile.SAMPLING
+    return None
+
+
+def save_profile(request, mode, duration, stats=None, stacks=''):
+    # A savepoint, so that a failure leaves the transaction of the request usable
+    with transaction.atomic():
+        RequestProfile.objects.create(user=request.user if request.user.is_authenticated else None,
+                                      view=get_view_name(request), path=request.get_full_path(), mode=mode,
+                                      duration=duration, stats=stats, stacks=stacks)
+        expired = RequestProfile.objects.order_by('-id').values_list('id', flat=True)[settings.PROFILE_KEEP:]
+        RequestProfile.objects.filter(id__in=list(expired)).delete()
+
+
+def profiled(view):
+    """Run the view under cProfile or the sampler when ``get_profile_mode`` asks for it and store the result."""
+    @wraps(view)
+    def wrapped_view(request, *args, **kwargs):
+        mode = get_profile_mode(request)
+        if mode is None:
+            return view(request, *args, **kwargs)
+        if mode == RequestProfile.CPROFILE:
+            profiler = cProfile.Profile()
+        else:
+            profiler = Sampler(settings.PROFILE_SAMPLE_INTERVAL)
+        started = time.perf_counter()
+        profiler.enable()
+        try:
+            response = view(request, *args, **kwargs)
+            # A TemplateResponse is rendered after the view returns, render it here to profile the template too
+            if callable(getattr(response, 'render', None)):
+                response = response.render()
+            return response
+        finally:
+            profiler.disable()
+            duration = time.perf_counter() - started
+            # A failure to store the profile must not replace the response or the error of the view
+            try:
+                if mode == RequestProfile.CPROFILE:
+                    # The same format as pstats.Stats.dump_stats, readable by pstats, snakeviz and gprof2dot
+                    save_profile(request, mode, duration, stats=marshal.dumps(pstats.Stats(profiler).stats))
+                else:
+                    save_profile(request, mode, duration, stacks=profiler.collapsed())
+            except Exception:
+                logger.exception('Could not save the profile of %s', request.get_full_path())
+    return wrapped_view
@@ -0,0 +1,130 @@
+import asyncio
+import functools
+from io import BytesIO
+from xml.sax.saxutils import escape
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.utils.module_loading import import_string
+
+from .utilities import get_file_stream, get_file_stream_async, async_datamart
+
+
+class Renderer:
+    """Turns the data of fill_order_template and fill_funding_application_template into a PDF.
+
+    ``name`` is part of the document cache key, so the documents of different
+    renderers are cached apart.
+    """
+    name = None
+
+    def render(self, data):
+        raise NotImplementedError
+
+    async def render_async(self, data):
+        """Render without blocking the event loop, on the default executor unless overridden."""
+        return await asyncio.get_running_loop().run_in_executor(None, self.render, data)
+
+
+class DatamartRenderer(Renderer):
+    """Renders the documents on the official letterhead with the datamart postdb service."""
+    name = 'datamart'
+
+    def render(self, data):
+        return get_file_stream(data)
+
+    async def render_async(self, data):
+        if not async_datamart.available:
+            return await super().render_async(data)
+        return await get_file_stream_async(data)
+
+
+class LocalPdfRenderer(Renderer):
+    """Renders the documents in process with reportlab, works while datamart is down.
+
+    The layout follows the datamart template: the addressee on the right, the
+    document kind and the theme centered, the content and the author's
+    position and name at the bottom. The font has to contain Cyrillic glyphs.
+    """
+    name = 'local'
+    font_name = 'DocumentFont'
+
+    def __init__(self, font_path=None, font_size=None):
+        try:
+            from reportlab.pdfbase import pdfmetrics
+            from reportlab.pdfbase.ttfonts import TTFont
+        except ImportError:
+            raise ImproperlyConfigured('LocalPdfRenderer requires reportlab: pip install reportlab')
+        font_path = font_path or settings.DOCUMENT_FONT_PATH
+        try:
+            pdfmetrics.registerFont(TTFont(self.font_name, font_path))
+        except Exception as e:
+            raise ImproperlyConfigured('Can not load the document font %s: %s' % (font_path, e))
+        self.font_size = font_size or settings.DOCUMENT_FONT_SIZE
+        self.styles = self.get_styles()
+
+    def get_styles(self):
+        from reportlab.lib.enums import TA_CENTER, TA_JUSTIFY, TA_RIGHT
+        from reportlab.lib.styles import ParagraphStyle
+
+        base = ParagraphStyle('base', fontName=self.font_name, fontSize=self.font_size,
+                              leading=self.font_size * 1.3)
+        return {
+            'addressee': ParagraphStyle('addressee', base, leftIndent=260, spaceAfter=36),
+            'kind': ParagraphStyle('kind', base, fontSize=self.font_size + 4, leading=(self.font_size + 4) * 1.3,
+                                   alignment=TA_CENTER, spaceAfter=12),
+            'theme': ParagraphStyle('theme', base, alignment=TA_CENTER, spaceAfter=24),
+            'content': ParagraphStyle('content', base, alignment=TA_JUSTIFY, firstLineIndent=36),
+            'author': ParagraphStyle('author', base),
+            'author_name': ParagraphStyle('author_name', base, alignment=TA_RIGHT),
+        }
+
+    @staticmethod
+    def markup(text):
+        # The addressee separates the position from the name with <br/>, everything else is plain text
+        return escape(text or '').replace('&lt;br/&gt;', '<br/>').replace('\n', '<br/>')
+
+    def get_flowables(self, data):
+        from reportlab.platypus import Paragraph, Spacer, Table, TableStyle
+
+        styles = self.styles
+        flowables = []
+        if data.get('Adresat'):
+            flowables.append(Paragraph(self.markup(data['Adresat']), styles['addressee']))
+        flowables.append(Paragraph(self.markup(data.get('BlankTarget')), styles['kind']))
+        flowables.append(Paragraph(self.markup(data.get('Theme')), styles['theme']))
+        for line in (data.get('DocContent') or '').split('\n'):
+            if line.strip():
+                flowables.append(Paragraph(self.markup(line.strip()), styles['content']))
+        flowables.append(Spacer(0, 48))
+        signature = Table([[Paragraph(self.markup(data.get('AuthorPost')), styles['author']),
+                            Paragraph(self.markup(data.get('Author')), styles['author_name'])]],
+                          colWidths=['60%', '40%'])
+        signature.setStyle(TableStyle([('VALIGN', (0, 0), (-1, -1), 'BOTTOM'),
+                                       ('LEFTPADDING', (0, 0), (-1, -1), 0),
+                                       ('RIGHTPADDING', (0, 0), (-1, -1), 0)]))
+        flowables.append(signature)
+        return flowables
+
+    def render(self, data):
+        from reportlab.lib.pagesizes import A4
+        from reportlab.lib.units import mm
+        from reportlab.platypus import SimpleDocTemplate
+
+        output = BytesIO()
+        # invariant leaves out the creation date, the same data always gives the same bytes
+        document = SimpleDocTemplate(output, pagesize=A4, leftMargin=30 * mm, rightMargin=15 * mm,
+                                     topMargin=20 * mm, bottomMargin=20 * mm, title=data.get('Theme') or '',
+                                     invariant=True)
+        document.build(self.get_flowables(data))
+        return output.getvalue()
+
+
+@functools.lru_cache(maxsize=None)
+def load_renderer(path):
+    return import_string(path)()
+
+
+def get_renderer():
+    """Return the renderer selected by settings.DOCUMENT_RENDERER, one instance per class."""
+    return load_renderer(settings.DOCUMENT_RENDERER)
@@ -0,0 +1,127 @@
+import itertools
+import re
+import time
+import zipfile
+from xml.sax.saxutils import escape
+
+
+class _Buffer:
+    """Write-only file for zipfile, the written bytes are taken out with ``pop``."""
+
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def pop(self):
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def stream_zip(entries, compression=zipfile.ZIP_DEFLATED, force_zip64=False):
+    """Yield a ZIP archive of (name, iterable of bytes) entries while they are produced.
+
+    Neither the archive nor an entry is held in memory, only the chunk being
+    compressed. The entries are consumed lazily, so a generator can yield them
+    as they become ready. The size of an entry is not known in advance, pass
+    ``force_zip64`` if one can exceed 2 GB.
+    """
+    buffer = _Buffer()
+    archive = zipfile.ZipFile(buffer, 'w', compression)
+    for name, chunks in entries:
+        info = zipfile.ZipInfo(name, time.localtime()[:6])
+        info.compress_type = compression
+        with archive.open(info, 'w', force_zip64=force_zip64) as entry:
+            for chunk in chunks:
+                entry.write(chunk)
+                data = buffer.pop()
+                if data:
+                    yield data
+        yield buffer.pop()
+    archive.close()
+    yield buffer.pop()
+
+
+# Control characters other than tab and line breaks are not allowed in XML
+_INVALID_XML_CHARS = re.compile('[\x00-\x08\x0b\x0c\x0e-\x1f]')
+
+# Spreadsheets take text starting with these for a formula
+FORMULA_PREFIXES = ('=', '+', '-', '@', '\t', '\r')
+
+
+def escape_formula(value):
+    """Prefix text a spreadsheet would run as a formula with a quote, other values are returned as they are."""
+    if isinstance(value, str) and value.startswith(FORMULA_PREFIXES):
+        return "'" + value
+    return value
+
+
+_XLSX_PARTS = {
+    '[Content_Types].xml':
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+        '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+        '<Default Extension="xml" ContentType="application/xml"/>'
+        '<Override PartName="/xl/workbook.xml"'
+        ' ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+        '<Override PartName="/xl/worksheets/sheet1.xml"'
+        ' ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+        '</Types>',
+    '_rels/.rels':
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" Target="xl/workbook.xml"'
+        ' Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument"/>'
+        '</Relationships>',
+    'xl/_rels/workbook.xml.rels':
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" Target="worksheets/sheet1.xml"'
+        ' Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet"/>'
+        '</Relationships>',
+}
+
+
+def _xlsx_cell(value):
+    if value is None:
+        return '<c/>'
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return '<c t="n"><v>%s</v></c>' % value
+    text = escape(_INVALID_XML_CHARS.sub('', escape_formula(str(value))))
+    return '<c t="inlineStr"><is><t xml:space="preserve">%s</t></is></c>' % text
+
+
+def _xlsx_sheet(header, rows, rows_per_chunk):
+    yield ('<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+           '<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"><sheetData>').encode()
+    chunk = []
+    for row in itertools.chain([header], rows):
+        chunk.append('<row>%s</row>' % ''.join(_xlsx_cell(value) for value in row))
+        if len(chunk) >= rows_per_chunk:
+            yield ''.join(chunk).encode()
+            chunk = []
+    chunk.append('</sheetData></worksheet>')
+    yield ''.join(chunk).encode()
+
+
+def stream_xlsx(header, rows, sheet_name='Sheet1', rows_per_chunk=500):
+    """Yield an XLSX workbook with one sheet of inline string and number cells.
+
+    The rows are written as they are read, so an iterator over a query keeps
+    the memory use constant.
+    """
+    workbook = ('<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+                '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"'
+                ' xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+                '<sheets><sheet name="%s" sheetId="1" r:id="rId1"/></sheets></workbook>'
+                % escape(sheet_name, {'"': '&quot;'}))
+    entries = [(name, [content.encode()]) for name, content in _XLSX_PARTS.items()]
+    entries.append(('xl/workbook.xml', [workbook.encode()]))
+    entries.append(('xl/worksheets/sheet1.xml', _xlsx_sheet(header, rows, rows_per_chunk)))
+    return stream_zip(entries)
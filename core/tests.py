@@ -1,5 +1,62 @@
-from django.test import TestCase, Client
-from django.contrib.auth.models import User
+import asyncio
+import csv
+import datetime
+import http.client
+import importlib.util
+import json
+import marshal
+import os
+import pstats
+import tempfile
+import time
+import unittest
+import zipfile
+from io import BytesIO, StringIO
+from unittest import mock
+
+import requests
+from urllib3.exceptions import MaxRetryError, NewConnectionError, ProtocolError
+
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, SimpleTestCase, TransactionTestCase, Client, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.contrib.auth.models import User, Permission
+from django.core.exceptions import ImproperlyConfigured
+
+from .models import BusinessTrip, BusinessTripQueue, Departments, Document, Order, RenderJob, EmailSending, EmailOutbox,\
+    DigestEvent, BusinessTripState, DeputyGovernor, PassportData, ApplicationFunding, RequestProfile, Position
+from .morphology import InflectionCache
+from .document_cache import DocumentCache, document_cache
+from .documents import process_render_jobs, fill_order_template, enqueue_render_job, get_document
+from .asgi import DownloadApplication
+from .autocomplete import PrefixIndex, positions, listed_positions, suggestions, get_recency_weight
+from .http_client import HttpClient, AsyncHttpClient, CircuitOpenError, httpx
+from .notifications import send_email_by_queue, deliver_pending_emails, flush_digests, may_have_been_sent
+from .workflow import WorkFlow, compile_workflow, validate_workflow
+from . import views
+from .utilities import async_datamart
+from .trip_state import rebuild_business_trip_states, get_state
+from .generator import generate_business_trips
+from .importer import import_business_trips, read_rows
+from .metrics import registry
+from .permissions import use_session_cache
+from .profiling import Sampler
+from .renderers import Renderer, LocalPdfRenderer
+
+
+def create_business_trip(**kwargs):
+    fields = dict(second_name='Иванов', first_name='Иван', patronymic='Иванович',
+                  position='советник Губернатора Челябинской области',
+                  location='г. Магнитогорск', purpose='проведением совещания',
+                  start_date=datetime.date(2019, 9, 20), end_date=datetime.date(2019, 9, 22),
+                  departure_date_limit='10-00', arrival_date_limit='14-00',
+                  who_pays_the_trip=BusinessTrip.WHO_PAYS_THE_TRIP_CHOICES[0][0],
+                  receiving_funds=BusinessTrip.RECEIVING_FUNDS_CHOICES[0][0],
+                  transport_type='Самолёт', hotel_days='2')
+    fields.update(kwargs)
+    return BusinessTrip.objects.create(**fields)
 
 
 class AccessTestCase(TestCase):
@@ -13,3 +70,927 @@ class AccessTestCase(TestCase):
         c = Client()
         response = c.post('/login/',  self.user, follow=True)
         self.assertTrue(response.context['user'].is_active)
+
+
+class InflectionCacheTestCase(SimpleTestCase):
+    def test_lru_eviction_and_counters(self):
+        cache = InflectionCache(max_size=2)
+        cache.set('май', 'gent', 'мая')
+        cache.set('июнь', 'gent', 'июня')
+        self.assertEqual(cache.get('май', 'gent'), 'мая')
+        cache.set('июль', 'gent', 'июля')
+        self.assertIsNone(cache.get('июнь', 'gent'))
+        self.assertEqual(cache.stats(), {'hits': 1, 'misses': 1, 'size': 2, 'max_size': 2})
+
+    def test_dump_and_load(self):
+        cache = InflectionCache()
+        cache.set('март', 'gent', 'марта')
+        cache.set('xyz', 'gent', None)
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, 'cache.json')
+            cache.dump(path)
+            loaded = InflectionCache()
+            self.assertEqual(loaded.load(path), 2)
+        self.assertEqual(loaded.get('март', 'gent'), 'марта')
+        self.assertIn(('xyz', 'gent'), loaded)
+
+
+class DocumentCacheTestCase(SimpleTestCase):
+    def test_eviction_by_size(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            cache = DocumentCache(tmp_dir, max_size=10)
+            first = cache.set(cache.key({'n': 1}), b'123456')
+            os.utime(first, (time.time() - 60, time.time() - 60))
+            cache.set(cache.key({'n': 2}), b'123456')
+            self.assertIsNone(cache.get(cache.key({'n': 1})))
+            self.assertIsNotNone(cache.get(cache.key({'n': 2})))
+
+    def test_eviction_by_age(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            cache = DocumentCache(tmp_dir, max_age=30)
+            path = cache.set(cache.key({'n': 1}), b'pdf')
+            os.utime(path, (time.time() - 60, time.time() - 60))
+            self.assertIsNone(cache.get(cache.key({'n': 1})))
+            self.assertFalse(os.path.exists(path))
+
+    def test_eviction_is_batched(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            cache = DocumentCache(tmp_dir, max_size=100)
+            with mock.patch.object(cache, 'evict', wraps=cache.evict) as evict:
+                for number in range(10):
+                    cache.set(cache.key({'n': number}), b'12345')
+                self.assertEqual(evict.call_count, 5)
+
+    def test_open_outlives_eviction(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            cache = DocumentCache(tmp_dir)
+            key = cache.key({'n': 1})
+            cache.set(key, b'pdf')
+            with cache.open(key) as f:
+                os.remove(cache.path(key))
+                self.assertEqual(f.read(), b'pdf')
+            self.assertIsNone(cache.open(key))
+
+
+@mock.patch('core.documents.get_morphed_word', lambda word, case: word)
+class DownloadLinkTestCase(TestCase):
+    def setUp(self):
+        self.business_trip = create_business_trip()
+        Order.objects.create(business_trip=self.business_trip, full_name_genitive='Иванова И.И.',
+                             full_name='Иванова Ивана Ивановича', position='советника',
+                             period='с 20 по 22 сентября 2019 года', location='г. Магнитогорск',
+                             purpose='проведением совещания', deputy_governor='В.В. Мамин',
+                             deputy_governor_position='Первый заместитель Губернатора')
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp_dir.cleanup)
+        patcher = mock.patch.object(document_cache, 'directory', self.tmp_dir.name)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    @mock.patch('core.renderers.get_file_stream', return_value=b'%PDF-1.4')
+    def test_rendered_once_and_not_modified(self, get_file_stream):
+        url = '/download/%s/order/' % self.business_trip.id
+        response = self.client.get(url)
+        self.assertEqual(b''.join(response.streaming_content), b'%PDF-1.4')
+        etag = response['ETag']
+        response.close()
+        response = self.client.get(url)
+        response.close()
+        self.assertEqual(get_file_stream.call_count, 1)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+    @mock.patch('core.renderers.get_file_stream', return_value=b'%PDF-1.4')
+    def test_rendered_again_when_evicted(self, get_file_stream):
+        url = '/download/%s/order/' % self.business_trip.id
+        # Another process evicts the document between the cache lookup and the open
+        with mock.patch.object(document_cache, 'get', return_value=os.path.join(self.tmp_dir.name, 'gone.pdf')):
+            response = self.client.get(url)
+            self.assertEqual(b''.join(response.streaming_content), b'%PDF-1.4')
+            response.close()
+        self.assertEqual(get_file_stream.call_count, 1)
+
+    @mock.patch('core.renderers.get_file_stream', side_effect=[ConnectionError, b'%PDF-1.4'])
+    def test_prerender_on_transition(self, get_file_stream):
+        queue = BusinessTripQueue.objects.create(business_trip=self.business_trip,
+                                                 queue=Departments.DEPUTY_GOVERNOR[0])
+        WorkFlow(self.business_trip, queue).compete_work()
+        job = RenderJob.objects.get(business_trip=self.business_trip)
+        self.assertEqual(process_render_jobs(), 1)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), (RenderJob.PENDING, 1))
+        RenderJob.objects.filter(pk=job.pk).update(next_attempt=job.date_added)
+        self.assertEqual(process_render_jobs(), 1)
+        job.refresh_from_db()
+        self.assertEqual(job.status, RenderJob.DONE)
+        response = self.client.get('/download/%s/order/' % self.business_trip.id)
+        self.assertEqual(b''.join(response.streaming_content), b'%PDF-1.4')
+        response.close()
+        self.assertEqual(get_file_stream.call_count, 2)
+
+    @mock.patch('core.renderers.get_file_stream', return_value=b'%PDF-1.4')
+    def test_funding_application_prerendered_once_addressed(self, get_file_stream):
+        user = User.objects.create_user('manager')
+        user.user_permissions.set(Permission.objects.filter(codename__in=Departments.get_departments()))
+        self.client.force_login(user)
+        funding = ApplicationFunding.objects.create(business_trip=self.business_trip, fare='1000',
+                                                    hotel_cost='400', daily_allowance='200')
+        queue = BusinessTripQueue.objects.create(business_trip=self.business_trip,
+                                                 queue=Departments.PURCHASING_DEPARTMENT[0])
+        WorkFlow(self.business_trip, queue).compete_work()
+        self.assertFalse(RenderJob.objects.exists())
+        url = '/download/%s/funding_application/' % self.business_trip.id
+        self.assertEqual(self.client.get(url).status_code, 404)
+        deputy_governor = DeputyGovernor.objects.create(full_name='Мамин Виктор Викторович', position='Заместитель',
+                                                        full_name_document='В.В. Мамину',
+                                                        position_document='Заместителю')
+        self.client.post('/business_trips/head_of_department/%s/' % self.business_trip.id,
+                         {'action': 'complete', 'deputy_governor': deputy_governor.id})
+        funding.refresh_from_db()
+        self.assertEqual((funding.deputy_governor, funding.deputy_governor_position), ('В.В. Мамину', 'Заместителю'))
+        job = RenderJob.objects.get(business_trip=self.business_trip)
+        self.assertEqual(process_render_jobs(), 1)
+        job.refresh_from_db()
+        self.assertEqual((job.document_type, job.status, job.attempts),
+                         (Document.FUNDING_APPLICATION, RenderJob.DONE, 1))
+        response = self.client.get(url)
+        self.assertEqual(b''.join(response.streaming_content), b'%PDF-1.4')
+        response.close()
+        self.assertEqual(get_file_stream.call_count, 1)
+
+    def test_newest_order_is_current(self):
+        order = Order.objects.get(business_trip=self.business_trip)
+        order.pk = None
+        order.full_name = 'Петрова Петра Петровича'
+        order.save()
+        self.assertEqual(get_document(self.business_trip, Document.ORDER), order)
+        self.assertIn('Петрова Петра Петровича', views.get_download_data(self.business_trip.id, 'order')['DocContent'])
+
+    def test_incomplete_funding_application_job_fails_at_once(self):
+        ApplicationFunding.objects.create(business_trip=self.business_trip)
+        job = enqueue_render_job(self.business_trip, Departments.HEAD_OF_DEPARTMENT[0])
+        self.assertEqual(process_render_jobs(), 1)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), (RenderJob.FAILED, 1))
+        self.assertIn('IncompleteDocumentError', job.error)
+
+    @override_settings(DOCUMENT_RENDERER='core.tests.StaticRenderer')
+    def test_selected_renderer(self):
+        data = fill_order_template(Order.objects.get(business_trip=self.business_trip))
+        response = self.client.get('/download/%s/order/' % self.business_trip.id)
+        self.assertEqual(b''.join(response.streaming_content), b'%PDF-1.4 static')
+        response.close()
+        self.assertEqual(response['ETag'], '"%s"' % document_cache.key(data, 'static'))
+        self.assertNotEqual(response['ETag'], '"%s"' % document_cache.key(data, 'datamart'))
+
+    @unittest.skipIf(importlib.util.find_spec('reportlab') is None, 'reportlab is not installed')
+    def test_local_pdf_renderer(self):
+        data = fill_order_template(Order.objects.get(business_trip=self.business_trip))
+        renderer = LocalPdfRenderer()
+        pdf = renderer.render(data)
+        self.assertTrue(pdf.startswith(b'%PDF'))
+        self.assertEqual(renderer.render(data), pdf)
+
+
+class StaticRenderer(Renderer):
+    name = 'static'
+
+    def render(self, data):
+        return b'%PDF-1.4 static'
+
+
+@mock.patch('core.documents.get_morphed_word', lambda word, case: word)
+class BatchDownloadTestCase(TestCase):
+    def setUp(self):
+        self.client.force_login(User.objects.create_user('manager'))
+        self.business_trips = [create_business_trip(second_name=name) for name in ('Иванов', 'Петров', 'Сидоров')]
+        for business_trip in self.business_trips[:2]:
+            Order.objects.create(business_trip=business_trip, full_name_genitive=business_trip.second_name,
+                                 full_name='', position='', period='', location='', purpose='')
+        # Without the deputy governor the funding application template can not be filled
+        ApplicationFunding.objects.create(business_trip=self.business_trips[0])
+        tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp_dir.cleanup)
+        patcher = mock.patch.object(document_cache, 'directory', tmp_dir.name)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_archive_reports_failed_documents(self):
+        def get_file_stream(data):
+            if 'Петров' in data['Theme']:
+                raise requests.ConnectionError
+            return b'%PDF-1.4 ' + data['Theme'].encode()
+
+        ids = ','.join(str(business_trip.id) for business_trip in self.business_trips)
+        with mock.patch('core.renderers.get_file_stream', side_effect=get_file_stream) as render:
+            response = self.client.get('/download/batch/', {'ids': ids})
+            archive = zipfile.ZipFile(BytesIO(b''.join(response.streaming_content)))
+        first, second, third = [business_trip.id for business_trip in self.business_trips]
+        self.assertEqual(archive.namelist(), ['%s_order.pdf' % first, 'errors.txt'])
+        self.assertEqual(archive.read('%s_order.pdf' % first).decode(), '%PDF-1.4 О командировании Иванов')
+        errors = archive.read('errors.txt').decode()
+        for name in ('%s_funding_application' % first, '%s_order' % second, '%s_order' % third):
+            self.assertIn(name, errors)
+        self.assertEqual(render.call_count, 2)
+
+    def test_too_many_trips(self):
+        with mock.patch.object(views.settings, 'BATCH_DOWNLOAD_MAX_TRIPS', 2):
+            response = self.client.get('/download/batch/', {'ids': '1,2,3'})
+        self.assertEqual(response.status_code, 400)
+
+
+@mock.patch('core.documents.get_morphed_word', lambda word, case: word)
+class AsgiDownloadTestCase(TransactionTestCase):
+    def setUp(self):
+        self.business_trip = create_business_trip()
+        Order.objects.create(business_trip=self.business_trip, full_name_genitive='Иванова И.И.',
+                             full_name='Иванова Ивана Ивановича', position='советника',
+                             period='с 20 по 22 сентября 2019 года', location='г. Магнитогорск',
+                             purpose='проведением совещания')
+        tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp_dir.cleanup)
+        patcher = mock.patch.object(document_cache, 'directory', tmp_dir.name)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.application = DownloadApplication(concurrency=2, db_workers=2)
+        self.addCleanup(self.application.executor.shutdown)
+
+    def get(self, path, headers=()):
+        messages = []
+
+        async def receive():
+            return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+        async def send(message):
+            messages.append(message)
+
+        scope = {'type': 'http', 'method': 'GET', 'path': path, 'query_string': b'',
+                 'headers': [(name.lower().encode(), value.encode()) for name, value in headers]}
+        asyncio.run(self.application(scope, receive, send))
+        headers = {name.decode(): value.decode() for name, value in messages[0]['headers']}
+        return messages[0]['status'], headers, b''.join(message.get('body', b'') for message in messages[1:])
+
+    def test_download(self):
+        async def get_file_stream_async(data):
+            return b'%PDF-1.4 async'
+
+        url = '/download/%s/order/' % self.business_trip.id
+        with mock.patch.object(async_datamart, 'available', True), \
+                mock.patch('core.renderers.get_file_stream_async', side_effect=get_file_stream_async) as render:
+            status, headers, body = self.get(url)
+            self.assertEqual((status, body), (200, b'%PDF-1.4 async'))
+            self.assertEqual(self.get(url, [('If-None-Match', headers['etag'])])[0], 304)
+            self.assertEqual(self.get(url, [('If-None-Match', 'W/' + headers['etag'])])[0], 304)
+            self.assertEqual(self.get(url, [('If-None-Match', '"W/%s"' % headers['etag'][1:])])[0], 200)
+            self.assertEqual(self.get(url)[2], b'%PDF-1.4 async')
+        self.assertEqual(render.call_count, 1)
+        response = self.client.get(url)
+        response.close()
+        for header in ('ETag', 'Content-Type', 'Content-disposition'):
+            self.assertEqual(headers[header.lower()], response[header])
+
+    def test_not_found(self):
+        self.assertEqual(self.get('/download/%s/unknown/' % self.business_trip.id)[0], 404)
+        self.assertEqual(self.get('/download/0/order/')[0], 404)
+        self.assertEqual(self.get('/business_trips/')[0], 404)
+
+
+class HttpClientTestCase(SimpleTestCase):
+    def setUp(self):
+        self.http = HttpClient('http://datamart.test/api/', retries=2, backoff_factor=0,
+                               failure_threshold=2, reset_timeout=60)
+        self.ok = mock.Mock(status_code=200)
+
+    def test_idempotent_request_is_retried(self):
+        with mock.patch.object(self.http.session, 'request',
+                               side_effect=[requests.ReadTimeout, self.ok]) as request:
+            self.assertIs(self.http.post('postdb', json={}), self.ok)
+        self.assertEqual(request.call_count, 2)
+        self.assertEqual(request.call_args[1]['timeout'], self.http.timeout)
+        self.assertEqual(self.http.metrics.snapshot()['postdb']['errors'], 1)
+
+    def test_non_idempotent_request_is_not_repeated_after_sending(self):
+        with mock.patch.object(self.http.session, 'request', side_effect=requests.ReadTimeout) as request:
+            with self.assertRaises(requests.ReadTimeout):
+                self.http.post('SendMail', json={}, idempotent=False)
+        self.assertEqual(request.call_count, 1)
+
+    def test_circuit_opens_after_failures(self):
+        with mock.patch.object(self.http.session, 'request', side_effect=requests.ConnectionError) as request:
+            for _ in range(2):
+                with self.assertRaises(requests.ConnectionError):
+                    self.http.post('postdb')
+            with self.assertRaises(CircuitOpenError):
+                self.http.post('postdb')
+        self.assertEqual(request.call_count, 6)
+
+    def test_trial_slot_is_released_on_other_errors(self):
+        with mock.patch.object(self.http.session, 'request', side_effect=requests.ConnectionError):
+            for _ in range(2):
+                with self.assertRaises(requests.ConnectionError):
+                    self.http.post('postdb')
+        self.http.breaker.opened_at -= 60
+        with mock.patch.object(self.http.session, 'request', side_effect=[ValueError, self.ok]):
+            with self.assertRaises(ValueError):
+                self.http.post('postdb')
+            self.assertIs(self.http.post('postdb'), self.ok)
+        self.assertFalse(self.http.breaker.is_open)
+
+    @unittest.skipIf(httpx is None, 'httpx is not installed')
+    def test_async_client_shares_the_circuit(self):
+        client = AsyncHttpClient('http://datamart.test/api/', retries=1, backoff_factor=0,
+                                 breaker=self.http.breaker, metrics=self.http.metrics)
+        statuses = [503, 503, 200]
+        client._client = httpx.AsyncClient(transport=httpx.MockTransport(
+            lambda request: httpx.Response(statuses.pop(0), json={})))
+
+        async def post():
+            with self.assertRaises(httpx.HTTPStatusError):
+                await client.post('postdb', json={})
+            await client.close()
+
+        asyncio.run(post())
+        self.assertEqual(statuses, [200])
+        self.assertEqual(self.http.breaker.failures, 1)
+        self.assertEqual(self.http.metrics.snapshot()['postdb']['errors'], 2)
+
+
+class MetricsTestCase(TestCase):
+    def setUp(self):
+        registry.clear()
+        self.user = User.objects.create_user('manager')
+        self.client.force_login(self.user)
+
+    @mock.patch.object(views.settings, 'METRICS_TOKEN', 'secret')
+    def test_request_metrics(self):
+        self.client.get('/business_trips/')
+        self.assertEqual(self.client.get('/metrics/').status_code, 403)
+        response = self.client.get('/metrics/', HTTP_AUTHORIZATION='Bearer secret')
+        content = response.content.decode()
+        self.assertIn('# TYPE business_trip_request_duration_seconds histogram', content)
+        self.assertIn('business_trip_request_duration_seconds_count{view="business_trip_management"} 1', content)
+        self.assertIn('business_trip_request_sql_queries_bucket{view="business_trip_management",le="+Inf"} 1',
+                      content)
+        self.assertNotIn('business_trip_request_sql_queries_sum{view="business_trip_management"} 0', content)
+
+
+class ProfilingTestCase(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_superuser('admin', 'admin@example.com', 'admin')
+        self.client.force_login(self.user)
+
+    def test_cprofile_on_demand(self):
+        self.client.get('/business_trips/?profile=1')
+        profile = RequestProfile.objects.get()
+        self.assertEqual((profile.view, profile.mode), ('business_trip_management', RequestProfile.CPROFILE))
+        response = self.client.get('/admin/core/requestprofile/%s/download/' % profile.pk)
+        with tempfile.NamedTemporaryFile() as f:
+            f.write(response.content)
+            f.flush()
+            self.assertTrue(pstats.Stats(f.name).total_calls)
+
+    def test_template_rendering_is_profiled(self):
+        self.client.get('/business_trips/?profile=1')
+        profile = RequestProfile.objects.get()
+        stats = marshal.loads(profile.stats)
+        self.assertTrue(any(filename.endswith(os.path.join('template', 'base.py')) for filename, _, _ in stats))
+
+    @mock.patch('core.profiling.RequestProfile.objects.create', side_effect=RuntimeError('disk full'))
+    def test_failed_save_keeps_the_response(self, create):
+        with self.assertLogs('core.profiling', 'ERROR'):
+            response = self.client.get('/business_trips/?profile=1')
+        self.assertEqual(response.status_code, 200)
+
+    def test_only_staff_can_profile(self):
+        self.user.is_staff = self.user.is_superuser = False
+        self.user.save()
+        self.client.get('/business_trips/', HTTP_X_PROFILE='1')
+        self.assertFalse(RequestProfile.objects.exists())
+
+    def test_sampler_collects_collapsed_stacks(self):
+        sampler = Sampler(0.001)
+        sampler.enable()
+        time.sleep(0.05)
+        sampler.disable()
+        self.assertIn('test_sampler_collects_collapsed_stacks', sampler.collapsed())
+
+
+class EmailOutboxTestCase(TestCase):
+    def setUp(self):
+        for i in range(3):
+            user = User.objects.create_user('user%s' % i, 'user%s@example.com' % i)
+            EmailSending.objects.create(user=user, queue=Departments.PURCHASING_DEPARTMENT[0])
+
+    @mock.patch('core.notifications.send_email')
+    def test_delivery_and_retry(self, send_email):
+        send_email_by_queue(Departments.PURCHASING_DEPARTMENT[0])
+        self.assertEqual(EmailOutbox.objects.filter(status=EmailOutbox.PENDING).count(), 3)
+        send_email.side_effect = [None, requests.ConnectTimeout, requests.ReadTimeout]
+        self.assertEqual(deliver_pending_emails(workers=1), 3)
+        statuses = EmailOutbox.objects.order_by('id').values_list('status', flat=True)
+        self.assertEqual(list(statuses), [EmailOutbox.SENT, EmailOutbox.PENDING, EmailOutbox.FAILED])
+        send_email.side_effect = None
+        self.assertEqual(deliver_pending_emails(), 0)
+        retried = EmailOutbox.objects.filter(status=EmailOutbox.PENDING)
+        retried.update(next_attempt=retried[0].date_added)
+        self.assertEqual(deliver_pending_emails(), 1)
+        self.assertEqual(send_email.call_count, 4)
+        self.assertEqual(EmailOutbox.objects.filter(status=EmailOutbox.SENT).count(), 2)
+
+    def test_only_unsent_messages_are_retried(self):
+        refused = MaxRetryError(None, '/SendMail', NewConnectionError(None, 'Connection refused'))
+        self.assertFalse(may_have_been_sent(requests.ConnectionError(refused)))
+        self.assertFalse(may_have_been_sent(requests.HTTPError('503 Server Error')))
+        dropped = ProtocolError('Connection aborted.', http.client.RemoteDisconnected('closed'))
+        self.assertTrue(may_have_been_sent(requests.ConnectionError(dropped)))
+        self.assertTrue(may_have_been_sent(requests.ConnectionError(ConnectionResetError(104, 'reset'))))
+        self.assertTrue(may_have_been_sent(requests.ReadTimeout()))
+
+    def test_digest(self):
+        EmailSending.objects.update(digest=True, digest_window=10)
+        business_trips = [create_business_trip(), create_business_trip(second_name='Петров')]
+        for business_trip in business_trips:
+            send_email_by_queue(Departments.PURCHASING_DEPARTMENT[0], business_trip)
+        self.assertEqual(DigestEvent.objects.count(), 6)
+        self.assertEqual(flush_digests(), 0)
+        DigestEvent.objects.update(date_added=DigestEvent.objects.first().date_added - datetime.timedelta(minutes=11))
+        self.assertEqual(flush_digests(), 3)
+        self.assertFalse(DigestEvent.objects.exists())
+        body = EmailOutbox.objects.get(address='user0@example.com').body
+        self.assertIn('Петров', body)
+        self.assertIn('(2)', body)
+
+    @override_settings(DIGEST_MAX_EVENTS=1)
+    def test_digest_is_bounded(self):
+        EmailSending.objects.update(digest=True, digest_window=10)
+        EmailSending.objects.filter(user__username='user2').update(digest_window=30)
+        for business_trip in [create_business_trip(), create_business_trip(second_name='Петров')]:
+            send_email_by_queue(Departments.PURCHASING_DEPARTMENT[0], business_trip)
+        DigestEvent.objects.update(date_added=DigestEvent.objects.first().date_added - datetime.timedelta(minutes=11))
+        self.assertEqual(flush_digests(limit=1), 1)
+        self.assertEqual(flush_digests(), 2)
+        self.assertEqual(flush_digests(), 1)
+        self.assertEqual(flush_digests(), 0)
+        self.assertEqual(EmailOutbox.objects.filter(address='user0@example.com').count(), 2)
+        # The window of the third subscriber has not passed
+        self.assertEqual(DigestEvent.objects.filter(email_sending__user__username='user2').count(), 2)
+
+
+@override_settings(PERMISSIONS_SESSION_CACHE=True)
+class BusinessTripManagementTestCase(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('manager')
+        self.user.user_permissions.set(Permission.objects.filter(codename__in=Departments.get_departments()))
+        self.client.force_login(self.user)
+        for i in range(12):
+            business_trip = create_business_trip(second_name='Иванов%s' % i)
+            BusinessTripQueue.objects.create(business_trip=business_trip, queue=Departments.PURCHASING_DEPARTMENT[0],
+                                             status=BusinessTripQueue.COMPLETED)
+            BusinessTripQueue.objects.create(business_trip=business_trip, queue=Departments.HEAD_OF_DEPARTMENT[0])
+        business_trip = create_business_trip()
+        for department in (Departments.PURCHASING_DEPARTMENT, Departments.DEPUTY_GOVERNOR,
+                           Departments.PERSONNEL_DEPARTMENT, Departments.BOOKKEEPING):
+            BusinessTripQueue.objects.create(business_trip=business_trip, queue=department[0])
+        rebuild_business_trip_states(batch_size=5)
+
+    def test_query_count_per_tab(self):
+        # The first request stores the department permissions in the session
+        self.client.get('/business_trips/')
+        # session, user, page and limited count of trips
+        tabs = ['all'] + [department.lower() for department in Departments.get_departments()]
+        for tab in tabs:
+            with self.subTest(tab=tab), self.assertNumQueries(4):
+                response = self.client.get('/business_trips/', {'queue': tab, 'status': 'new'})
+                self.assertTrue(response.context['business_trip_content'])
+
+    def test_listing(self):
+        response = self.client.get('/business_trips/', {'queue': 'head_of_department', 'status': 'new'})
+        self.assertEqual(len(response.context['business_trip_content']), 5)
+        self.assertEqual(response.context['business_trip_objects'].total, 12)
+        response = self.client.get('/business_trips/', {'queue': 'purchasing_department', 'status': 'completed'})
+        self.assertEqual(response.context['business_trip_objects'].total, 12)
+        response = self.client.get('/business_trips/')
+        self.assertEqual(response.context['business_trip_objects'].total, 13)
+
+    def test_keyset_pages(self):
+        params = {'queue': 'head_of_department', 'status': 'new'}
+        ids = []
+        page = self.client.get('/business_trips/', params).context['business_trip_objects']
+        while True:
+            ids += [obj.id for obj in page]
+            if not page.has_next():
+                break
+            page = self.client.get('/business_trips/', dict(params, cursor=page.next_cursor))\
+                .context['business_trip_objects']
+        self.assertEqual(ids, sorted(ids, reverse=True))
+        self.assertEqual(len(set(ids)), 12)
+        previous = self.client.get('/business_trips/', dict(params, cursor=page.previous_cursor))\
+            .context['business_trip_objects']
+        self.assertEqual([obj.id for obj in previous], ids[5:10])
+        self.assertTrue(previous.has_previous())
+
+
+@override_settings(PERMISSIONS_SESSION_CACHE=True)
+class ExportTestCase(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('manager')
+        self.user.user_permissions.add(Permission.objects.get(codename=Departments.PURCHASING_DEPARTMENT[0]))
+        self.client.force_login(self.user)
+        generate_business_trips(30, seed=2)
+        self.client.get('/business_trips/')
+
+    def test_csv_follows_the_tab_filter(self):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get('/business_trips/export/?queue=purchasing_department&status=completed')
+            lines = b''.join(response.streaming_content).decode('utf-8-sig').splitlines()
+        # Session, user and one query for the rows
+        self.assertEqual(len(context.captured_queries), 3)
+        expected = BusinessTripQueue.objects.filter(queue=Departments.PURCHASING_DEPARTMENT[0],
+                                                    status=BusinessTripQueue.COMPLETED).count()
+        self.assertEqual(len(lines), expected + 1)
+        row = next(csv.reader(lines[1:]))
+        funding = ApplicationFunding.objects.get(business_trip_id=row[0])
+        self.assertEqual(row[12], funding.fare)
+
+    def test_formulas_are_escaped(self):
+        BusinessTrip.objects.filter(id=BusinessTrip.objects.latest('id').id).update(
+            location='=HYPERLINK("http://example.com")', purpose='-1+2', position='@SUM(A1)')
+        response = self.client.get('/business_trips/export/')
+        row = next(csv.reader(b''.join(response.streaming_content).decode('utf-8-sig').splitlines()[1:]))
+        self.assertEqual(row[4:7], ["'@SUM(A1)", '\'=HYPERLINK("http://example.com")', "'-1+2"])
+        response = self.client.get('/business_trips/export/?format=xlsx')
+        archive = zipfile.ZipFile(BytesIO(b''.join(response.streaming_content)))
+        sheet = archive.read('xl/worksheets/sheet1.xml').decode()
+        self.assertIn('<t xml:space="preserve">\'=HYPERLINK', sheet)
+        self.assertNotIn('<t xml:space="preserve">=', sheet)
+
+    def test_xlsx(self):
+        response = self.client.get('/business_trips/export/?queue=bookkeeping&format=xlsx')
+        archive = zipfile.ZipFile(BytesIO(b''.join(response.streaming_content)))
+        self.assertIsNone(archive.testzip())
+        sheet = archive.read('xl/worksheets/sheet1.xml').decode()
+        # The bookkeeping tab is not allowed, all trips are exported
+        self.assertEqual(sheet.count('<row>'), 31)
+
+
+@mock.patch('core.workflow.enqueue_render_job')
+class BusinessTripStateTestCase(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('manager')
+        self.user.user_permissions.set(Permission.objects.filter(codename__in=Departments.get_departments()))
+        self.client.force_login(self.user)
+        self.business_trip = create_business_trip()
+        self.queue = BusinessTripQueue.objects.create(business_trip=self.business_trip,
+                                                      queue=Departments.PURCHASING_DEPARTMENT[0])
+
+    def test_transitions(self, enqueue_render_job):
+        WorkFlow(self.business_trip, self.queue).compete_work()
+        state = BusinessTripState.objects.get(business_trip=self.business_trip)
+        self.assertEqual((state.get_queues(), state.status),
+                         ([Departments.HEAD_OF_DEPARTMENT[0]], BusinessTripQueue.NEW))
+        deputy_governor = DeputyGovernor.objects.create(full_name='Мамин', position='Заместитель')
+        self.client.post('/business_trips/head_of_department/%s/' % self.business_trip.id,
+                         {'action': 'reject', 'deputy_governor': deputy_governor.id})
+        state.refresh_from_db()
+        self.assertEqual((state.get_queues(), state.status), ([], BusinessTripQueue.REJECTED))
+
+    def test_rebuild(self, enqueue_render_job):
+        WorkFlow(self.business_trip, self.queue).compete_work()
+        expected = BusinessTripState.objects.values_list('business_trip', 'queues', 'status').get()
+        self.assertEqual(rebuild_business_trip_states(), 1)
+        self.assertEqual(BusinessTripState.objects.values_list('business_trip', 'queues', 'status').get(), expected)
+
+
+class GeneratorTestCase(TestCase):
+    def test_generated_trips_are_consistent(self):
+        self.assertEqual(generate_business_trips(60, batch_size=25, seed=1), 60)
+        self.assertEqual(PassportData.objects.count(), 60)
+        states = {state.business_trip_id: (state.queues, state.status) for state in BusinessTripState.objects.all()}
+        self.assertEqual(len(states), 60)
+        self.assertEqual(len({status for queues, status in states.values()}), 3)
+        for business_trip in BusinessTrip.objects.prefetch_related('businesstripqueue_set'):
+            queue_statuses = [(q.queue, q.status) for q in business_trip.businesstripqueue_set.all()]
+            self.assertEqual(states[business_trip.id], get_state(queue_statuses))
+            completed = {queue for queue, status in queue_statuses if status == BusinessTripQueue.COMPLETED}
+            self.assertEqual(business_trip.order_set.exists(), Departments.DEPUTY_GOVERNOR[0] in completed)
+
+
+class ImportTestCase(TestCase):
+    header = 'second_name,first_name,patronymic,position,location,purpose,start_date,end_date,' \
+             'departure_date_limit,arrival_date_limit,who_pays_the_trip,receiving_funds,transport_type,hotel_days,' \
+             'series,number,issued,date,code\n'
+    row = 'Иванов,Иван,Иванович,советник,г. Миасс,проведением совещания,2019-09-20,2019-09-22,10-00,14-00,' \
+          'GOVERNMENT,CASH,Поезд,2,1234,123456,Выдан,2012-07-12,700\n'
+
+    def test_command_imports_valid_rows_in_batches(self):
+        content = self.header + self.row * 3 + self.row.replace('2019-09-20', 'вчера') + self.row
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, 'trips.csv')
+            errors_path = os.path.join(tmp_dir, 'errors.csv')
+            with open(path, 'w', encoding='utf-8') as f:
+                f.write(content)
+            call_command('import_trips', path, batch=2, errors=errors_path, stdout=StringIO())
+            with open(errors_path, encoding='utf-8') as f:
+                errors = f.read().splitlines()
+        self.assertEqual(len(errors), 2)
+        self.assertTrue(errors[1].startswith('5,start_date,'))
+        self.assertEqual(BusinessTrip.objects.count(), 4)
+        self.assertEqual(PassportData.objects.filter(business_trip__location='г. Миасс').count(), 4)
+        self.assertEqual(BusinessTripQueue.objects.filter(queue=WorkFlow.INITIAL_DEPARTMENT).count(), 4)
+        self.assertEqual(BusinessTripState.objects.filter(queues=WorkFlow.INITIAL_DEPARTMENT).count(), 4)
+
+    def test_ids_read_back_after_the_insert(self):
+        create_business_trip()
+        create_business_trip().delete()
+        result = import_business_trips(read_rows(BytesIO((self.header + self.row * 2).encode()), 'csv'))
+        self.assertEqual(result.imported, 2)
+        imported = BusinessTrip.objects.filter(location='г. Миасс')
+        self.assertEqual(set(PassportData.objects.values_list('business_trip', flat=True)),
+                         set(imported.values_list('id', flat=True)))
+        self.assertEqual(BusinessTripState.objects.filter(business_trip__in=imported).count(), 2)
+
+    def test_digest_subscribers_get_the_imported_trips(self):
+        for username, digest in [('user0', False), ('user1', True)]:
+            user = User.objects.create_user(username, '%s@example.com' % username)
+            EmailSending.objects.create(user=user, queue=WorkFlow.INITIAL_DEPARTMENT, digest=digest)
+        import_business_trips(read_rows(BytesIO((self.header + self.row * 3).encode()), 'csv'), batch_size=2)
+        self.assertEqual(list(EmailOutbox.objects.values_list('address', flat=True)), ['user0@example.com'])
+        self.assertEqual(set(DigestEvent.objects.values_list('business_trip', flat=True)),
+                         set(BusinessTrip.objects.values_list('id', flat=True)))
+        self.assertFalse(DigestEvent.objects.exclude(email_sending__user__username='user1').exists())
+
+    def test_upload_is_staff_only(self):
+        user = User.objects.create_user('manager')
+        self.client.force_login(user)
+        upload = SimpleUploadedFile('trips.jsonl', b'{}')
+        self.assertEqual(self.client.post('/business_trips/import/', {'file': upload}).status_code, 403)
+        user.is_staff = True
+        user.save()
+        fields = dict(zip(self.header.strip().split(','), self.row.strip().split(',')))
+        content = '\n'.join([json.dumps(fields), '{"second_name": ', json.dumps(fields)]).encode()
+        upload = SimpleUploadedFile('trips.jsonl', content)
+        response = self.client.post('/business_trips/import/', {'file': upload})
+        self.assertEqual((response.context['result'].imported, response.context['result'].failed), (2, 1))
+        self.assertEqual(response.context['errors'][0][0], 2)
+
+
+class WorkFlowTestCase(TestCase):
+    def test_compiled_graph(self):
+        self.assertEqual(WorkFlow.SUCCESSORS[Departments.PURCHASING_DEPARTMENT[0]],
+                         (Departments.HEAD_OF_DEPARTMENT[0],))
+        self.assertEqual(WorkFlow.PREDECESSORS[Departments.BOOKKEEPING[0]],
+                         {Departments.PERSONNEL_DEPARTMENT[0]})
+        self.assertEqual(WorkFlow.PREDECESSORS[WorkFlow.INITIAL_DEPARTMENT], set())
+
+    def test_predecessor_check_is_one_query(self):
+        business_trip = create_business_trip()
+        queue = BusinessTripQueue.objects.create(business_trip=business_trip,
+                                                 queue=Departments.PERSONNEL_DEPARTMENT[0],
+                                                 status=BusinessTripQueue.COMPLETED)
+        with self.assertNumQueries(1):
+            self.assertTrue(WorkFlow(business_trip, queue)._all_previous_queues_completed(
+                Departments.BOOKKEEPING[0]))
+
+    def test_cycle_is_rejected(self):
+        config = {'INITIAL_DEPARTMENT': 'PURCHASING_DEPARTMENT',
+                  'TRANSITIONS': {'PURCHASING_DEPARTMENT': ['HEAD_OF_DEPARTMENT'],
+                                  'HEAD_OF_DEPARTMENT': ['DEPUTY_GOVERNOR'],
+                                  'DEPUTY_GOVERNOR': ['HEAD_OF_DEPARTMENT']}}
+        with self.assertRaisesMessage(ImproperlyConfigured, 'DEPUTY_GOVERNOR, HEAD_OF_DEPARTMENT'):
+            validate_workflow(config)
+        with self.assertRaises(ImproperlyConfigured):
+            validate_workflow({'INITIAL_DEPARTMENT': 'PURCHASING_DEPARTMENT',
+                               'TRANSITIONS': {'PURCHASING_DEPARTMENT': ['ACCOUNTING']}})
+
+    @mock.patch('core.workflow.enqueue_render_job')
+    def test_parallel_branches_join(self, enqueue_render_job):
+        class ParallelWorkFlow(WorkFlow):
+            pass
+        compile_workflow(ParallelWorkFlow, {
+            'INITIAL_DEPARTMENT': 'PURCHASING_DEPARTMENT',
+            'TRANSITIONS': {'PURCHASING_DEPARTMENT': ['PERSONNEL_DEPARTMENT', 'HEAD_OF_DEPARTMENT'],
+                            'PERSONNEL_DEPARTMENT': ['BOOKKEEPING'],
+                            'HEAD_OF_DEPARTMENT': ['BOOKKEEPING']}})
+        business_trip = create_business_trip()
+
+        def complete(queue):
+            business_trip_queue = BusinessTripQueue.objects.get(business_trip=business_trip, queue=queue)
+            ParallelWorkFlow(business_trip, business_trip_queue).compete_work()
+            return set(BusinessTripQueue.objects.filter(business_trip=business_trip, status=BusinessTripQueue.NEW)
+                       .values_list('queue', flat=True))
+
+        BusinessTripQueue.objects.create(business_trip=business_trip, queue='PURCHASING_DEPARTMENT')
+        self.assertEqual(complete('PURCHASING_DEPARTMENT'), {'PERSONNEL_DEPARTMENT', 'HEAD_OF_DEPARTMENT'})
+        self.assertEqual(complete('HEAD_OF_DEPARTMENT'), {'PERSONNEL_DEPARTMENT'})
+        self.assertEqual(complete('PERSONNEL_DEPARTMENT'), {'BOOKKEEPING'})
+        self.assertEqual(business_trip.state.status, BusinessTripQueue.NEW)
+
+
+@override_settings(PERMISSIONS_SESSION_CACHE=True)
+class PermissionsCacheTestCase(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('manager')
+        self.client.force_login(self.user)
+
+    def test_session_cache_is_invalidated(self):
+        url = '/business_trips/'
+        self.assertEqual(list(self.client.get(url).context['tabs'].values()), ['all'])
+        self.assertEqual(self.client.get('/business_trips/bookkeeping/1/').status_code, 403)
+        self.user.user_permissions.add(Permission.objects.get(codename=Departments.BOOKKEEPING[0]))
+        self.assertEqual(list(self.client.get(url).context['tabs'].values()), ['all', 'bookkeeping'])
+
+    @override_settings(PERMISSIONS_SESSION_CACHE=None)
+    def test_off_with_a_local_cache(self):
+        self.assertFalse(use_session_cache())
+        with override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+                                                   'LOCATION': 'cache'}}):
+            self.assertTrue(use_session_cache())
+
+
+@mock.patch('core.documents.get_morphed_word', lambda word, case: word)
+@mock.patch('core.views.get_morphed_word', lambda word, case: word)
+@override_settings(PERMISSIONS_SESSION_CACHE=True)
+class QueryBudgetTestCase(TestCase):
+    department_views = [
+        (views.PurchasingDepartmentView, Departments.PURCHASING_DEPARTMENT[0],
+         {'fare': '1000', 'daily_allowance': '200', 'hotel_cost': '400'}),
+        (views.HeadOfDepartmentView, Departments.HEAD_OF_DEPARTMENT[0], {}),
+        (views.DeputyGovernorView, Departments.DEPUTY_GOVERNOR[0],
+         {'full_name_genitive': 'Иванова И.И.', 'full_name': 'Иванова Ивана Ивановича', 'position': 'советника',
+          'period': 'с 20 по 22 сентября 2019 года', 'location': 'г. Магнитогорск',
+          'purpose': 'проведением совещания'}),
+        (views.PersonnelDepartmentView, Departments.PERSONNEL_DEPARTMENT[0], {}),
+        (views.BookkeepingView, Departments.BOOKKEEPING[0], {}),
+    ]
+
+    def setUp(self):
+        self.user = User.objects.create_user('manager')
+        self.user.user_permissions.set(Permission.objects.filter(codename__in=Departments.get_departments()))
+        self.client.force_login(self.user)
+        self.deputy_governor = DeputyGovernor.objects.create(full_name='Мамин', position='Заместитель')
+        self.business_trip = create_business_trip(deputy_governor=self.deputy_governor)
+        PassportData.objects.create(business_trip=self.business_trip, series='1234', number='123456',
+                                    issued='Выдан', date='2012-07-12', code='700')
+        ApplicationFunding.objects.create(business_trip=self.business_trip)
+        Order.objects.create(business_trip=self.business_trip, full_name_genitive='', full_name='', position='',
+                             period='', location='', purpose='')
+        # The first request stores the department permissions in the session
+        self.client.get('/business_trips/')
+        tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp_dir.cleanup)
+        media_root = override_settings(MEDIA_ROOT=tmp_dir.name)
+        media_root.enable()
+        self.addCleanup(media_root.disable)
+
+    def assertQueryBudget(self, budget, method, url, data=None):
+        with CaptureQueriesContext(connection) as context:
+            response = getattr(self.client, method)(url, data)
+        self.assertLess(response.status_code, 400)
+        # Savepoints come from the test transaction wrapping the atomic blocks
+        queries = [query['sql'] for query in context.captured_queries if 'SAVEPOINT' not in query['sql']]
+        # The budget is the measured count, so it has to be updated when a view gets cheaper as well
+        self.assertEqual(len(queries), budget, '\n'.join(queries))
+
+    @mock.patch('core.workflow.enqueue_render_job')
+    def test_department_views(self, enqueue_render_job):
+        BusinessTripQueue.objects.create(business_trip=self.business_trip, queue=WorkFlow.INITIAL_DEPARTMENT)
+        # Each view completes its queue, which opens the queue of the next view
+        for view, queue, data in self.department_views:
+            url = '/business_trips/%s/%s/' % (queue.lower(), self.business_trip.id)
+            with self.subTest(view=view.__name__):
+                self.assertQueryBudget(view.query_budget['get'], 'get', url)
+                if view is views.HeadOfDepartmentView:
+                    data = {'deputy_governor': self.deputy_governor.id}
+                if view is views.PersonnelDepartmentView:
+                    data = {'upload': SimpleUploadedFile('order.pdf', b'%PDF-1.4')}
+                self.assertQueryBudget(view.query_budget['post'], 'post', url, dict(data, action='complete'))
+
+
+class PrefixIndexTestCase(SimpleTestCase):
+    def test_word_prefixes_and_ranking(self):
+        index = PrefixIndex()
+        index.add('советник Губернатора Челябинской области', 3)
+        index.add('помощник Губернатора Челябинской области')
+        index.add('Губернатор Челябинской  области', 0)
+        index.add('помощник губернатора челябинской области', 1)
+        self.assertEqual(len(index), 3)
+        self.assertEqual(index.search('пом губ'), ['помощник Губернатора Челябинской области'])
+        self.assertEqual(index.search('ГУБЕРН'), ['Губернатор Челябинской области',
+                                                  'советник Губернатора Челябинской области',
+                                                  'помощник Губернатора Челябинской области'])
+        self.assertEqual(index.search('челяб', limit=1), ['советник Губернатора Челябинской области'])
+        self.assertEqual(index.search('убер'), [])
+        self.assertEqual(index.search(' '), [])
+
+    def test_lightest_entries_are_dropped(self):
+        index = PrefixIndex(max_entries=10)
+        for number in range(11):
+            index.add('г. Город%s' % number, number)
+        self.assertEqual(len(index), 11)
+        index.add('г. Челябинск', 0.5)
+        self.assertEqual(len(index), 10)
+        self.assertEqual(index.search('г', limit=3), ['г. Город10', 'г. Город9', 'г. Город8'])
+        self.assertEqual(index.search('город0'), [])
+        self.assertEqual(index.search('челяб'), [])
+        self.assertNotIn('город0', index._words)
+
+
+class PositionAutocompleteTestCase(TransactionTestCase):
+    fixtures = ['positions']
+
+    def setUp(self):
+        positions.clear()
+        listed_positions.clear()
+        self.addCleanup(positions.clear)
+        self.addCleanup(listed_positions.clear)
+
+    def test_endpoint(self):
+        self.assertContains(self.client.get('/'), 'data-autocomplete-url="/autocomplete/positions/"')
+        response = self.client.get('/autocomplete/positions/', {'q': 'советник губ', 'limit': 1})
+        self.assertEqual(response.json(), {'results': ['советник Губернатора Челябинской области']})
+        self.assertIn('max-age=', response['Cache-Control'])
+        create_business_trip(position='советник губернатора по особым поручениям')
+        Position.objects.create(name='советник губернатора по связям с общественностью')
+        response = self.client.get('/autocomplete/positions/', {'q': 'советник губернатора по'})
+        self.assertEqual(response.json(), {'results': ['советник губернатора по связям с общественностью']})
+        self.client.force_login(User.objects.create_user('manager'))
+        response = self.client.get('/autocomplete/positions/', {'q': 'советник губернатора по'})
+        self.assertEqual(response.json(), {'results': ['советник губернатора по особым поручениям',
+                                                       'советник губернатора по связям с общественностью']})
+
+    @override_settings(AUTOCOMPLETE_REFRESH_INTERVAL=0)
+    def test_positions_of_other_processes_are_added(self):
+        self.client.get('/autocomplete/positions/', {'q': 'референт'})
+        # bulk_create sends no post_save, like a save in another process
+        Position.objects.bulk_create([Position(name='референт губернатора')])
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get('/autocomplete/positions/', {'q': 'референт'})
+        self.assertEqual(response.json(), {'results': ['референт губернатора']})
+        self.assertIn('"core_position"."id" > ', '\n'.join(query['sql'] for query in context.captured_queries))
+
+
+class SuggestionAutocompleteTestCase(TransactionTestCase):
+    def setUp(self):
+        for index in suggestions.values():
+            index.clear()
+        self.addCleanup(lambda: [index.clear() for index in suggestions.values()])
+        self.client.force_login(User.objects.create_user('manager'))
+
+    def test_frequent_and_recent_first(self):
+        for location in ('г. Магнитогорск', 'г. Магнитогорск', 'г. Миасс', 'г. Миасс', 'г. Миасс', 'г. Москва'):
+            create_business_trip(location=location)
+        # Three uses half a year ago weigh less than two today
+        BusinessTrip.objects.filter(location='г. Миасс').update(
+            date_added=datetime.date.today() - datetime.timedelta(days=180))
+        response = self.client.get('/autocomplete/location/', {'q': 'г. м'})
+        self.assertEqual(response.json()['results'], ['г. Магнитогорск', 'г. Миасс', 'г. Москва'])
+        for _ in range(2):
+            create_business_trip(location='г. Москва')
+        response = self.client.get('/autocomplete/location/', {'q': 'г. м'})
+        self.assertEqual(response.json()['results'], ['г. Москва', 'г. Магнитогорск', 'г. Миасс'])
+        self.assertEqual(self.client.get('/autocomplete/second_name/', {'q': 'Ив'}).status_code, 404)
+        self.assertGreater(get_recency_weight(datetime.date.today()),
+                           2 * get_recency_weight(datetime.date.today() - datetime.timedelta(days=181)))
+
+    @override_settings(AUTOCOMPLETE_MAX_ENTRIES=2)
+    def test_index_is_bounded(self):
+        for location in ('г. Миасс', 'г. Москва', 'г. Магнитогорск', 'г. Магнитогорск', 'г. Миасс', 'г. Магнитогорск'):
+            create_business_trip(location=location)
+        index = suggestions['location'].get()
+        self.assertEqual(len(index), 2)
+        self.assertEqual(index.search('г'), ['г. Магнитогорск', 'г. Миасс'])
+
+    def test_saves_of_other_processes_are_added(self):
+        business_trip = create_business_trip(location='г. Миасс')
+        url = '/autocomplete/location/'
+        self.assertEqual(self.client.get(url, {'q': 'г. м'}).json()['results'], ['г. Миасс'])
+        # bulk_create sends no post_save, like a save in another process
+        business_trip.pk = None
+        business_trip.location = 'г. Москва'
+        BusinessTrip.objects.bulk_create([business_trip])
+        self.assertEqual(self.client.get(url, {'q': 'г. м'}).json()['results'], ['г. Миасс'])
+        with override_settings(AUTOCOMPLETE_REFRESH_INTERVAL=0), CaptureQueriesContext(connection) as context:
+            self.assertEqual(self.client.get(url, {'q': 'г. м'}).json()['results'], ['г. Миасс', 'г. Москва'])
+        # Only the trips after the indexed ones are read
+        self.assertIn('"core_businesstrip"."id" > ', context.captured_queries[-1]['sql'])
+        BusinessTrip.objects.filter(location='г. Миасс').update(location='г. Магнитогорск')
+        index = suggestions['location']
+        with override_settings(AUTOCOMPLETE_REBUILD_INTERVAL=0):
+            self.client.get(url, {'q': 'г. м'})
+            thread = index._thread
+        if thread is not None:
+            thread.join()
+        self.assertEqual(self.client.get(url, {'q': 'г. м'}).json()['results'], ['г. Магнитогорск', 'г. Москва'])
+
+    @mock.patch.object(views.settings, 'AUTOCOMPLETE_PUBLIC_MIN_TRIPS', 2)
+    def test_rare_values_hidden_from_anonymous_users(self):
+        for location in ('г. Магнитогорск', 'г. Миасс', 'г. Миасс'):
+            create_business_trip(location=location)
+        response = self.client.get('/autocomplete/location/', {'q': 'г. м'})
+        self.assertEqual(response.json()['results'], ['г. Миасс', 'г. Магнитогорск'])
+        self.assertIn('private', response['Cache-Control'])
+        self.client.logout()
+        self.assertEqual(self.client.get('/autocomplete/location/', {'q': 'г. м'}).json()['results'], ['г. Миасс'])
+        create_business_trip(location='г. Магнитогорск')
+        self.assertEqual(self.client.get('/autocomplete/location/', {'q': 'г. м'}).json()['results'],
+                         ['г. Магнитогорск', 'г. Миасс'])
@@ -0,0 +1,51 @@
+from itertools import groupby
+from operator import itemgetter
+
+from django.db import transaction
+
+from .models import BusinessTripQueue, BusinessTripState
+
+
+def get_state(queue_statuses):
+    """Return (current queues, status) for (queue, status) pairs of one trip.
+
+    The current queues are the ones with NEW requests. A trip with a rejected
+    request is REJECTED, with no NEW ones left it is COMPLETED.
+    """
+    queues = sorted(queue for queue, status in queue_statuses if status == BusinessTripQueue.NEW)
+    statuses = {status for queue, status in queue_statuses}
+    if BusinessTripQueue.REJECTED in statuses:
+        status = BusinessTripQueue.REJECTED
+    elif queues:
+        status = BusinessTripQueue.NEW
+    else:
+        status = BusinessTripQueue.COMPLETED
+    return ','.join(queues), status
+
+
+def update_business_trip_state(business_trip):
+    """Recalculate the state, call it in the transaction that changes the queues of the trip."""
+    queue_statuses = BusinessTripQueue.objects.filter(business_trip=business_trip).values_list('queue', 'status')
+    queues, status = get_state(list(queue_statuses))
+    state, created = BusinessTripState.objects.update_or_create(business_trip=business_trip,
+                                                                defaults={'queues': queues, 'status': status})
+    return state
+
+
+def rebuild_business_trip_states(batch_size=1000):
+    """Regenerate the state of every trip from the queue history, returns the number of states."""
+    rows = BusinessTripQueue.objects.order_by('business_trip', 'id')\
+        .values_list('business_trip', 'queue', 'status').iterator()
+    count = 0
+    states = []
+    with transaction.atomic():
+        BusinessTripState.objects.all().delete()
+        for business_trip_id, trip_rows in groupby(rows, key=itemgetter(0)):
+            queues, status = get_state([(queue, status) for _, queue, status in trip_rows])
+            states.append(BusinessTripState(business_trip_id=business_trip_id, queues=queues, status=status))
+            if len(states) >= batch_size:
+                BusinessTripState.objects.bulk_create(states)
+                count += len(states)
+                states = []
+        BusinessTripState.objects.bulk_create(states)
+    return count + len(states)
@@ -1,7 +1,10 @@
 from django.urls import path
 from core import views
+from core.models import Departments
+from core.permissions import department_required
+from core.profiling import profiled
 from django.contrib.staticfiles.urls import staticfiles_urlpatterns
-from django.contrib.auth.decorators import login_required, permission_required
+from django.contrib.auth.decorators import login_required
 from django.conf.urls.static import static
 from django.conf import settings
 
@@ -9,32 +12,31 @@ urlpatterns = [
     path('', views.BusinessTripView.as_view(), name='index'),
     path('login/', views.LoginView.as_view(), name='login'),
     path('logout/', views.logout_view, name='logout'),
-    path('business_trips/', login_required(views.BusinessTripManagementView.as_view(), login_url='/login/'),
+    path('business_trips/', profiled(login_required(views.BusinessTripManagementView.as_view(), login_url='/login/')),
          name='business_trip_management'),
-    path('business_trips/purchasing_department/<int:pk>/', views.PurchasingDepartmentView.as_view(),
+    path('business_trips/purchasing_department/<int:pk>/', profiled(views.PurchasingDepartmentView.as_view()),
          name='purchasing_department'),
     path('business_trips/head_of_department/<int:pk>/',
-         permission_required('core.HEAD_OF_DEPARTMENT',
-                             login_url='/login/',
-                             raise_exception=True)(views.HeadOfDepartmentView.as_view()),
+         profiled(department_required(Departments.HEAD_OF_DEPARTMENT[0])(views.HeadOfDepartmentView.as_view())),
          name='head_of_department'),
     path('business_trips/deputy_governor/<int:pk>/',
-         permission_required('core.DEPUTY_GOVERNOR',
-                             login_url='/login/',
-                             raise_exception=True)(views.DeputyGovernorView.as_view()),
+         profiled(department_required(Departments.DEPUTY_GOVERNOR[0])(views.DeputyGovernorView.as_view())),
          name='deputy_governor'),
     path('business_trips/personnel_department/<int:pk>/',
-         permission_required('core.PERSONNEL_DEPARTMENT',
-                             login_url='/login/',
-                             raise_exception=True)(views.PersonnelDepartmentView.as_view()),
+         profiled(department_required(Departments.PERSONNEL_DEPARTMENT[0])(views.PersonnelDepartmentView.as_view())),
          name='personnel_department'),
     path('business_trips/bookkeeping/<int:pk>/',
-         permission_required('core.BOOKKEEPING',
-                             login_url='/login/',
-                             raise_exception=True)(views.BookkeepingView.as_view()),
+         profiled(department_required(Departments.BOOKKEEPING[0])(views.BookkeepingView.as_view())),
          name='bookkeeping'),
+    path('business_trips/export/', login_required(views.export_view, login_url='/login/'),
+         name='business_trip_export'),
+    path('business_trips/import/', views.import_view, name='business_trip_import'),
     path('business_trips/<int:pk>/', views.BusinessTripDetailedView.as_view(), name='business_trip_detailed'),
-    path('download/<int:pk>/<str:document_type>/', views.download_link),
+    path('download/batch/', login_required(views.batch_download_view, login_url='/login/'), name='batch_download'),
+    path('download/<int:pk>/<str:document_type>/', profiled(views.download_link), name='download_link'),
+    path('autocomplete/positions/', views.position_autocomplete_view, name='position_autocomplete'),
+    path('autocomplete/<str:field>/', views.suggestion_autocomplete_view, name='suggestion_autocomplete'),
+    path('metrics/', views.metrics_view, name='metrics'),
 ]
 
 urlpatterns += staticfiles_urlpatterns()
@@ -1,21 +1,47 @@
-import requests
-import json
 import base64
 
+from django.conf import settings
+
+from .http_client import HttpClient, AsyncHttpClient
+
+
+datamart = HttpClient(settings.DATAMART_URL,
+                      connect_timeout=settings.DATAMART_CONNECT_TIMEOUT,
+                      read_timeout=settings.DATAMART_READ_TIMEOUT,
+                      retries=settings.DATAMART_RETRIES,
+                      backoff_factor=settings.DATAMART_RETRY_BACKOFF,
+                      pool_size=settings.DATAMART_POOL_SIZE,
+                      failure_threshold=settings.DATAMART_CIRCUIT_FAILURES,
+                      reset_timeout=settings.DATAMART_CIRCUIT_RESET)
+
+# Used by the ASGI download path, shares the circuit breaker with the synchronous client
+async_datamart = AsyncHttpClient(settings.DATAMART_URL,
+                                 connect_timeout=settings.DATAMART_CONNECT_TIMEOUT,
+                                 read_timeout=settings.DATAMART_READ_TIMEOUT,
+                                 retries=settings.DATAMART_RETRIES,
+                                 backoff_factor=settings.DATAMART_RETRY_BACKOFF,
+                                 pool_size=settings.ASYNC_RENDER_CONCURRENCY,
+                                 breaker=datamart.breaker,
+                                 metrics=datamart.metrics)
+
 
 def get_file_stream(data):
-    url = 'http://datamart.gov74.ru/api/doctemplate/postdb'
-    response = requests.post(url, json=data)
-    response_data = json.loads(response.text)
+    response = datamart.post('postdb', json=data)
+    response_data = response.json()
     return base64.b64decode(response_data['Data'])
 
 
+async def get_file_stream_async(data):
+    response = await async_datamart.post('postdb', json=data)
+    return base64.b64decode(response.json()['Data'])
+
+
 def send_email(address, sender_name, subject, body):
-    url = "http://datamart.gov74.ru/api/doctemplate/SendMail"
     data = {
          "AddressTo": address,
          "SenderName": sender_name,
          "Subject": subject,
          "Body": body
     }
-    requests.post(url, json=data)
+    # Sending is not idempotent, the request is repeated only if it never reached datamart
+    datamart.post('SendMail', json=data, idempotent=False)
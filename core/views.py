@@ -1,15 +1,18 @@
 from django.shortcuts import render, redirect, get_object_or_404
 from django.views.generic import View, DetailView, ListView
 from django.views.generic.edit import FormMixin, ModelFormMixin
-from django.http import HttpResponse, HttpResponseRedirect, JsonResponse, Http404
+from django.http import HttpResponse, HttpResponseRedirect, JsonResponse, Http404, FileResponse,\
+    StreamingHttpResponse, HttpResponseBadRequest
 from django.contrib.auth.forms import AuthenticationForm
 from django.contrib.auth import authenticate, login, logout
 from django.contrib.auth.decorators import permission_required, login_required
 from django.forms.models import model_to_dict, fields_for_model
 from django.contrib import messages
-from django.core.paginator import Paginator
-from django.db.models import Count, Max
-import pymorphy2
+from django.db import transaction
+from django.db.models import Count, Max, OuterRef, Subquery
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
+from django.utils.crypto import constant_time_compare
+from django.core.exceptions import ObjectDoesNotExist, PermissionDenied
 import datetime
 from business_trip import settings
 
@@ -18,20 +21,18 @@ from .forms import BusinessTripForm, HeadOfDepartmentForm, DeputyGovernorForm,\
 from .models import BusinessTrip, BusinessTripQueue, Departments,\
     Document, DeputyGovernor, ActiveSetting,\
     EmailSending, Order, ApplicationFunding, PassportData
-from .utilities import get_file_stream, send_email
-
-
-morph = pymorphy2.MorphAnalyzer()
-
-
-def get_morphed_word(word, case):
-    morphed = morph.parse(word)[0].inflect({case})
-    if morphed:
-        if word[0].isupper():
-            return morphed.word.capitalize()
-        else:
-            return morphed.word
-    return word
+from .notifications import send_email_by_queue
+from .morphology import get_morphed_word
+from .documents import get_period, fill_order_template, fill_funding_application_template,\
+    open_document, stream_documents_zip, get_document_key, get_document, get_document_rows, IncompleteDocumentError
+from .pagination import KeysetPaginator
+from .trip_state import update_business_trip_state
+from .workflow import WorkFlow
+from .permissions import get_request_permissions
+from .metrics import registry
+from .importer import get_format, read_rows, import_business_trips
+from .export import export_business_trips
+from .autocomplete import positions, listed_positions, suggestions
 
 
 class BusinessTripView(View):
@@ -52,15 +53,17 @@ class BusinessTripView(View):
         passport_data_form = PassportDataForm(request.POST, prefix='pd')
         if business_trip_form.is_valid() and passport_data_form.is_valid():
             request.session['request_created'] = True
-            instance = business_trip_form.save(commit=False)
-            instance.save()
-            passport_data = passport_data_form.save(commit=False)
-            passport_data.business_trip = instance
-            passport_data.save()
-            initial_department_queue = BusinessTripQueue(business_trip=instance,
-                                                         queue=WorkFlow.INITIAL_DEPARTMENT)
-            initial_department_queue.save()
-            send_email_by_queue(queue=WorkFlow.INITIAL_DEPARTMENT)
+            with transaction.atomic():
+                instance = business_trip_form.save(commit=False)
+                instance.save()
+                passport_data = passport_data_form.save(commit=False)
+                passport_data.business_trip = instance
+                passport_data.save()
+                initial_department_queue = BusinessTripQueue(business_trip=instance,
+                                                             queue=WorkFlow.INITIAL_DEPARTMENT)
+                initial_department_queue.save()
+                update_business_trip_state(instance)
+                send_email_by_queue(queue=WorkFlow.INITIAL_DEPARTMENT, business_trip=instance)
         else:
             context = {'form': business_trip_form,
                        'passport_data_form': passport_data_form,
@@ -98,12 +101,41 @@ def logout_view(request):
 
 def get_tabs(user_permissions):
     tabs = {'Все заявки': 'all'}
-    for d in Departments.get_departments():
-        if Departments().__getattribute__(d)[0] in user_permissions:
-            tabs.update({Departments().__getattribute__(d)[1]: Departments().__getattribute__(d)[0].lower()})
+    for department, name in Departments.get_choices():
+        if department in user_permissions:
+            tabs[name] = department.lower()
     return tabs
 
 
+def get_page_size(request):
+    try:
+        page_size = int(request.GET.get('page_size', settings.BUSINESS_TRIPS_PAGE_SIZE))
+    except ValueError:
+        page_size = settings.BUSINESS_TRIPS_PAGE_SIZE
+    return max(1, min(page_size, settings.BUSINESS_TRIPS_MAX_PAGE_SIZE))
+
+
+def get_queue_filter(request, allowed_tabs):
+    """Return the (queue, status) requested by the GET parameters, 'all' if the tab is not allowed."""
+    queue = request.GET.get('queue')
+    if queue not in allowed_tabs.values():
+        queue = 'all'
+    status = request.GET.get('status')
+    if not status:
+        status = BusinessTripQueue.NEW
+    elif True in [status.upper() in s for s in BusinessTripQueue.STATUS_CHOICES]:
+        status = status.upper()
+    return queue, status
+
+
+def get_business_trip_list(queue, status):
+    if queue == 'all':
+        return BusinessTrip.objects.filter(state__isnull=False)
+    business_trip_queues = BusinessTripQueue.objects.filter(queue=queue.upper(), status=status)
+    # The ids stay in a subquery, the list of trips is fetched with a single query
+    return BusinessTrip.objects.filter(id__in=business_trip_queues.values('business_trip'))
+
+
 class BusinessTripManagementView(ListView):
 
     model = BusinessTrip
@@ -111,32 +143,15 @@ class BusinessTripManagementView(ListView):
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        user_permissions = get_user_permissions(self.request.user)
+        user_permissions = get_request_permissions(self.request)
         allowed_tabs = get_tabs(user_permissions)
         business_trip_header = ['ФИО', 'Место командировки', 'Должность',
                                 'Дата начала командировки', 'Дата окончания командировки']
-        queue = self.request.GET.get('queue')
-        if queue not in allowed_tabs.values():
-            queue = 'all'
-        status = self.request.GET.get('status')
-        if not status:
-            status = BusinessTripQueue.NEW
-        elif True in [status.upper() in s for s in BusinessTripQueue.STATUS_CHOICES]:
-            status = status.upper()
-        if queue == 'all':
-            business_trips = BusinessTripQueue.objects.values("business_trip", "status").annotate(Max("date_added"))
-        else:
-            if status:
-                business_trips = BusinessTripQueue.objects.filter(queue=queue.upper(), status=status) \
-                    .values("business_trip", "status").annotate(Max("date_added"))
-            else:
-                business_trips = BusinessTripQueue.objects.filter(queue=queue.upper())\
-                    .values("business_trip", "status")
-        business_trip_ids = [_['business_trip'] for _ in business_trips]
-        business_trip_list = BusinessTrip.objects.filter(id__in=business_trip_ids)
-        paginator = Paginator(business_trip_list, 5)
-        page = self.request.GET.get('page')
-        business_trip_objects = paginator.get_page(page)
+        queue, status = get_queue_filter(self.request, allowed_tabs)
+        business_trip_list = get_business_trip_list(queue, status)
+        paginator = KeysetPaginator(business_trip_list, get_page_size(self.request),
+                                    count_limit=settings.BUSINESS_TRIPS_COUNT_LIMIT)
+        business_trip_objects = paginator.get_page(self.request.GET.get('cursor'))
         business_trip_content = []
         for obj in business_trip_objects:
             business_trip_content.append([
@@ -152,6 +167,8 @@ class BusinessTripManagementView(ListView):
             href_args = 'queue=' + queue + '&status=' + status
         elif queue:
             href_args = 'queue=' + queue
+        if 'page_size' in self.request.GET:
+            href_args += '&page_size=%s' % paginator.per_page
         context['href_args'] = href_args
         context['current_queue'] = queue
         context['tabs'] = allowed_tabs
@@ -167,56 +184,23 @@ class BusinessTripManagementView(ListView):
         return context
 
 
-def get_user_permissions(user):
-    permissions = []
-    for department in Departments.get_departments():
-        if user.has_perm('core.' + department):
-            permissions.append(department)
-    return permissions
-
-
-def send_email_by_queue(queue):
-    email_sending = EmailSending.objects.filter(queue=queue.upper(),
-                                                active=True)
-    for obj in email_sending:
-        body = 'В очереди "%s" новая заявка' % getattr(Departments, obj.queue)[1]
-        send_email(obj.user.email, "noreply", "Заявка на командировку", body)
-
-
-class WorkFlow:
-    INITIAL_DEPARTMENT = Departments.PURCHASING_DEPARTMENT[0]
-    HEAD_OF_DEPARTMENT = [Departments.DEPUTY_GOVERNOR[0]]
-    DEPUTY_GOVERNOR = [Departments.PERSONNEL_DEPARTMENT[0]]
-    PERSONNEL_DEPARTMENT = [Departments.BOOKKEEPING[0]]
-    PURCHASING_DEPARTMENT = [Departments.HEAD_OF_DEPARTMENT[0]]
-    BOOKKEEPING = []
-
-    def __init__(self, business_trip, current_queue):
-        self.business_trip = business_trip
-        self.current_queue = current_queue
-
-    def _all_previous_queues_completed(self, next_queue_name):
-        for dep in [d for d in Departments.get_departments() if d != self.current_queue.queue]:
-            if next_queue_name in getattr(self, dep):
-                queue = BusinessTripQueue.objects.filter(queue=dep, business_trip=self.business_trip)
-                if queue:
-                    if queue[0].status == BusinessTripQueue.COMPLETED:
-                        continue
-                return False
-        return True
-
-    def compete_work(self):
-        self.current_queue.status = BusinessTripQueue.COMPLETED
-        self.current_queue.save()
-        for next_queue_name in getattr(self, self.current_queue.queue):
-            if not self._all_previous_queues_completed(next_queue_name):
-                break
-            BusinessTripQueue.objects.get_or_create(queue=next_queue_name,
-                                                    business_trip=self.business_trip)
-            send_email_by_queue(queue=next_queue_name)
+def export_view(request):
+    """Stream the trips of the management tab given by queue and status as CSV or XLSX (format=xlsx)."""
+    queue, status = get_queue_filter(request, get_tabs(get_request_permissions(request)))
+    file_format = 'xlsx' if request.GET.get('format') == 'xlsx' else 'csv'
+    content_type, content = export_business_trips(get_business_trip_list(queue, status), file_format)
+    response = StreamingHttpResponse(content, content_type=content_type)
+    filename = 'business_trips_%s.%s' % (queue if queue == 'all' else '%s_%s' % (queue, status.lower()), file_format)
+    response['Content-Disposition'] = 'attachment; filename="%s"' % filename
+    return response
 
 
 class QueueView(View):
+    # Models related to the trip used by the view, loaded together with it by load_business_trip
+    related = (PassportData,)
+    # Number of SQL queries per request method, checked exactly by the tests
+    query_budget = {}
+
     def __init__(self, *args, **kwargs):
         self.business_trip = None
         self.business_trip_form = None
@@ -232,12 +216,55 @@ class QueueView(View):
     def post(self, *args, **kwargs):
         pass
 
+    def load_business_trip(self, pk, related=None):
+        """Fetch the trip with its deputy governor, the queue row of the view and the related rows in one query.
+
+        Each related model has a single current row per trip, its columns are selected as subqueries and the row
+        is rebuilt into business_trip.current_<model name>, a list holding the row or nothing.
+        """
+        rows = {'current_queue': BusinessTripQueue.objects.filter(queue=self.queue).order_by('id')}
+        for model in (self.related if related is None else related):
+            rows['current_' + model._meta.model_name] = get_document_rows(model)\
+                if model in (Order, ApplicationFunding) else model.objects.order_by('id')
+        annotations = {}
+        for name, queryset in rows.items():
+            queryset = queryset.filter(business_trip=OuterRef('pk'))
+            for field in queryset.model._meta.concrete_fields:
+                annotations['%s__%s' % (name, field.attname)] = Subquery(queryset.values(field.attname)[:1])
+        queryset = BusinessTrip.objects.select_related('deputy_governor').annotate(**annotations)
+        self.business_trip = get_object_or_404(queryset, id=pk)
+        for name, queryset in rows.items():
+            fields = queryset.model._meta.concrete_fields
+            values = [getattr(self.business_trip, '%s__%s' % (name, field.attname)) for field in fields]
+            current = [] if values[0] is None else [queryset.model.from_db(queryset.db, None, values)]
+            setattr(self.business_trip, name, current)
+
     def set_business_trip(self, pk):
-        self.business_trip = get_object_or_404(BusinessTrip, id=pk)
+        self.load_business_trip(pk)
 
     def set_business_trip_queue(self):
-        self.business_trip_queue = BusinessTripQueue.objects.get_or_create(business_trip=self.business_trip,
-                                                                           queue=self.queue)[0]
+        current_queue = getattr(self.business_trip, 'current_queue', None)
+        if current_queue:
+            self.business_trip_queue = current_queue[0]
+            return
+        self.business_trip_queue, created = BusinessTripQueue.objects.get_or_create(business_trip=self.business_trip,
+                                                                                    queue=self.queue)
+        if created:
+            update_business_trip_state(self.business_trip)
+        self.business_trip.current_queue = [self.business_trip_queue]
+
+    def get_order(self, **kwargs):
+        orders = self.business_trip.current_order
+        if orders:
+            return orders[0]
+        return Order.objects.create(business_trip=self.business_trip, **kwargs)
+
+    def get_application_funding(self):
+        application_fundings = self.business_trip.current_applicationfunding
+        if application_fundings:
+            return application_fundings[0]
+        return ApplicationFunding.objects.create(business_trip=self.business_trip,
+                                                 **get_funding_addressee(self.business_trip.deputy_governor))
 
     def update_context_status(self):
         if not self.business_trip_queue:
@@ -250,23 +277,36 @@ class QueueView(View):
         self.context.update({'business_trip_form': business_trip_form})
 
     def update_context_passport_data_form(self):
-        # print(PassportData.objects.all()[0].__dict__, '<<<<')
-        passport_data = PassportData.objects.get(business_trip=self.business_trip)
-        passport_data_form = PassportDataForm(prefix='pd', initial=model_to_dict(passport_data))
+        passport_data = self.business_trip.current_passportdata
+        initial = model_to_dict(passport_data[0]) if passport_data else {}
+        passport_data_form = PassportDataForm(prefix='pd', initial=initial)
         passport_data_form.disable_fields()
         self.context.update({'passport_data_form': passport_data_form})
 
-    def set_initial_data(self, pk):
-        self.set_business_trip(pk)
+    def set_data(self, pk, related=None):
+        """Load the trip and the queue row without building the context."""
+        self.load_business_trip(pk, related)
         self.set_business_trip_queue()
+
+    def set_initial_data(self, pk):
+        self.set_data(pk)
         self.update_context_status()
         self.update_context_business_trip_form()
         self.update_context_passport_data_form()
 
 
+def get_funding_addressee(deputy_governor):
+    """The funding application is addressed to the deputy governor, the names are in the dative case."""
+    if deputy_governor is None:
+        return {}
+    return {'deputy_governor': deputy_governor.full_name_document,
+            'deputy_governor_position': deputy_governor.position_document}
+
+
 class HeadOfDepartmentView(QueueView):
     form_class = HeadOfDepartmentForm
     template_name = 'queue.html'
+    query_budget = {'get': 6, 'post': 15}
 
     def get(self, request, pk, *args, **kwargs):
         self.queue = Departments.HEAD_OF_DEPARTMENT[0]
@@ -283,22 +323,28 @@ class HeadOfDepartmentView(QueueView):
         return render(request, self.template_name, self.context)
 
     def post(self, request, pk):
-        business_trip = get_object_or_404(BusinessTrip, id=pk)
-        business_trip_queue = get_object_or_404(BusinessTripQueue,
-                                                business_trip=business_trip,
-                                                queue=Departments.HEAD_OF_DEPARTMENT[0])
+        self.queue = Departments.HEAD_OF_DEPARTMENT[0]
+        self.load_business_trip(pk, related=())
+        business_trip = self.business_trip
+        if not business_trip.current_queue:
+            raise Http404
+        business_trip_queue = business_trip.current_queue[0]
         form = self.form_class(request.POST)
         if form.is_valid():
             action = request.POST.get('action', None)
             if action == 'complete':
                 business_trip.deputy_governor = form.cleaned_data['deputy_governor']
                 business_trip.save()
+                ApplicationFunding.objects.filter(business_trip=business_trip)\
+                    .update(**get_funding_addressee(business_trip.deputy_governor))
                 wf = WorkFlow(business_trip, business_trip_queue)
                 wf.compete_work()
                 messages.add_message(request, messages.INFO, 'Заявка согласована')
             elif action == 'reject':
-                business_trip_queue.status = BusinessTripQueue.REJECTED
-                business_trip_queue.save()
+                with transaction.atomic():
+                    business_trip_queue.status = BusinessTripQueue.REJECTED
+                    business_trip_queue.save()
+                    update_business_trip_state(business_trip)
             return HttpResponseRedirect('/business_trips/head_of_department/' + str(business_trip.id) + '/')
 
 
@@ -326,6 +372,7 @@ def get_order_initial_data(business_trip, field):
 
 class BookkeepingView(QueueView):
     template_name = 'queue.html'
+    query_budget = {'get': 4, 'post': 8}
 
     def get(self, request, pk, *args, **kwargs):
         self.queue = Departments.BOOKKEEPING[0]
@@ -338,8 +385,7 @@ class BookkeepingView(QueueView):
 
     def post(self, request, pk):
         self.queue = Departments.BOOKKEEPING[0]
-        self.set_initial_data(pk)
-        self.set_business_trip_queue()
+        self.set_data(pk, related=())
         action = request.POST.get('action', None)
         if action == 'complete':
             wf = WorkFlow(self.business_trip, self.business_trip_queue)
@@ -351,15 +397,15 @@ class BookkeepingView(QueueView):
 class DeputyGovernorView(QueueView):
     form_class = DeputyGovernorForm
     template_name = 'queue.html'
+    related = (PassportData, Order)
+    query_budget = {'get': 4, 'post': 13}
 
     def get(self, request, pk, *args, **kwargs):
         self.queue = Departments.DEPUTY_GOVERNOR[0]
         self.set_initial_data(pk)
         form = self.form_class()
-        order = Order.objects.get_or_create(
-            business_trip=self.business_trip,
-            deputy_governor=self.business_trip.deputy_governor.full_name,
-            deputy_governor_position=self.business_trip.deputy_governor.position)[0]
+        order = self.get_order(deputy_governor=self.business_trip.deputy_governor.full_name,
+                               deputy_governor_position=self.business_trip.deputy_governor.position)
         for field in form.fields:
             if getattr(order, field):
                 form.fields[field].initial = getattr(order, field)
@@ -375,9 +421,7 @@ class DeputyGovernorView(QueueView):
 
     def post(self, request, pk):
         self.queue = Departments.DEPUTY_GOVERNOR[0]
-        self.set_initial_data(pk)
-        # self.set_business_trip(pk)
-        self.set_business_trip_queue()
+        self.set_data(pk, related=(Order,))
         form = self.form_class(request.POST)
         if form.is_valid():
             self.update_order(form)
@@ -391,7 +435,7 @@ class DeputyGovernorView(QueueView):
                 return HttpResponseRedirect('/download/' + str(pk) + '/order/')
 
     def update_order(self, form):
-        order = Order.objects.get_or_create(business_trip=self.business_trip)[0]
+        order = self.get_order()
         for field in form.fields:
             setattr(order, field, form.cleaned_data[field])
         order.save()
@@ -400,12 +444,14 @@ class DeputyGovernorView(QueueView):
 class PersonnelDepartmentView(QueueView):
     form_class = PersonnelDepartmentForm
     template_name = 'queue.html'
+    related = (PassportData, Order)
+    query_budget = {'get': 4, 'post': 13}
 
     def get(self, request, pk, *args, **kwargs):
         self.queue = Departments.PERSONNEL_DEPARTMENT[0]
         self.set_initial_data(pk)
         form = self.form_class()
-        order = Order.objects.get_or_create(business_trip=self.business_trip)[0]
+        order = self.get_order()
         for field in form.fields:
             if getattr(order, field):
                 form.fields[field].initial = getattr(order, field)
@@ -418,11 +464,13 @@ class PersonnelDepartmentView(QueueView):
         return render(request, self.template_name, self.context)
 
     def post(self, request, pk):
-        business_trip = get_object_or_404(BusinessTrip, id=pk)
-        business_trip_queue = get_object_or_404(BusinessTripQueue,
-                                                business_trip=business_trip,
-                                                queue=Departments.PERSONNEL_DEPARTMENT[0])
-        order = Order.objects.get_or_create(business_trip=business_trip)[0]
+        self.queue = Departments.PERSONNEL_DEPARTMENT[0]
+        self.load_business_trip(pk, related=(Order,))
+        business_trip = self.business_trip
+        if not business_trip.current_queue:
+            raise Http404
+        business_trip_queue = business_trip.current_queue[0]
+        order = self.get_order()
         form = self.form_class(request.POST, request.FILES, instance=order)
         if form.is_valid():
             action = request.POST.get('action', None)
@@ -437,12 +485,14 @@ class PersonnelDepartmentView(QueueView):
 class PurchasingDepartmentView(QueueView):
     form_class = PurchasingDepartmentForm
     template_name = 'queue.html'
+    related = (PassportData, ApplicationFunding)
+    query_budget = {'get': 3, 'post': 12}
 
     def get(self, request, pk, *args, **kwargs):
         self.queue = Departments.PURCHASING_DEPARTMENT[0]
         self.set_initial_data(pk)
         form = self.form_class()
-        application_funding = ApplicationFunding.objects.get_or_create(business_trip=self.business_trip)[0]
+        application_funding = self.get_application_funding()
         for field in form.fields:
             if getattr(application_funding, field):
                 form.fields[field].initial = getattr(application_funding, field)
@@ -455,13 +505,16 @@ class PurchasingDepartmentView(QueueView):
         return render(request, self.template_name, self.context)
 
     def post(self, request, pk):
-        business_trip = get_object_or_404(BusinessTrip, id=pk)
-        business_trip_queue = get_object_or_404(BusinessTripQueue,
-                                                business_trip=business_trip,
-                                                queue=Departments.PURCHASING_DEPARTMENT[0])
-        application_funding = ApplicationFunding.objects.get_or_create(business_trip=business_trip)[0]
+        self.queue = Departments.PURCHASING_DEPARTMENT[0]
+        self.load_business_trip(pk, related=(ApplicationFunding,))
+        business_trip = self.business_trip
+        if not business_trip.current_queue:
+            raise Http404
+        business_trip_queue = business_trip.current_queue[0]
+        application_funding = self.get_application_funding()
         form = self.form_class(request.POST, request.FILES, instance=application_funding)
         if form.is_valid():
+            form.save()
             action = request.POST.get('action', None)
             if action == 'complete':
                 wf = WorkFlow(business_trip, business_trip_queue)
@@ -469,129 +522,135 @@ class PurchasingDepartmentView(QueueView):
                 messages.add_message(request, messages.INFO, 'Заявка отправлена на согласование')
             else:
                 messages.add_message(request, messages.INFO, 'Информация обновлена')
-            form.save()
             return HttpResponseRedirect('/business_trips/purchasing_department/' + str(business_trip.id) + '/')
 
 
-def convert_month(month):
-    months = {'01': 'январь',
-              '02': 'февраль',
-              '03': 'март',
-              '04': 'апрель',
-              '05': 'май',
-              '06': 'июнь',
-              '07': 'июль',
-              '08': 'август',
-              '09': 'сентябрь',
-              '10': 'октябрь',
-              '11': 'ноябрь',
-              '12': 'декабрь'}
-    return months[month]
-
-
-def get_cleaned_day(day):
-    if day.startswith('0'):
-        return day.strip('0')
-    return day
-
-
-# TODO : Add decorator for date conversion
-def get_period(start_date, end_date):
-    start_date = start_date.strftime("%Y-%m-%d")
-    end_date = end_date.strftime("%Y-%m-%d")
-    start_day = get_cleaned_day(start_date.split('-')[2])
-    end_day = get_cleaned_day(end_date.split('-')[2])
-    if start_date == end_date:
-        period = start_day \
-                 + ' ' + convert_month(start_date.split('-')[1]) + ' ' \
-                 + start_date.split('-')[0] \
-                 + ' года'
-        return period
-    if start_date.split('-')[0] == end_date.split('-')[0]:
-        if start_date.split('-')[1] == end_date.split('-')[1]:
-            period = 'с ' + start_day \
-                     + ' по ' \
-                     + end_day \
-                     + ' ' + convert_month(end_date.split('-')[1]) + ' ' \
-                     + end_date.split('-')[0] \
-                     + ' года'
-            return period
-        period = 'с ' + start_day \
-                 + ' ' + convert_month(start_date.split('-')[1]) + ' ' \
-                 + ' по ' \
-                 + end_day \
-                 + ' ' + convert_month(end_date.split('-')[1]) + ' ' \
-                 + end_date.split('-')[0] \
-                 + ' года'
-        return period
-    period = 'с ' + start_day \
-             + ' ' + convert_month(start_date.split('-')[1]) + ' ' \
-             + start_date.split('-')[0] \
-             + ' года по ' \
-             + end_day \
-             + ' ' + convert_month(end_date.split('-')[1]) + ' ' \
-             + end_date.split('-')[0] \
-             + ' года'
-    return period
-
-
-def fill_funding_application_template(funding_application):
-    data = {"BlankTarget": "", "Adresat": "", "Theme": "",
-            "DocContent": "", "AuthorPost": "", "Author": ""}
-    hotel_days_total = int(funding_application.business_trip.hotel_days) * 200
-    data['BlankTarget'] = "Заявка"
-    data['Adresat'] = funding_application.deputy_governor_position + '<br/>' + funding_application.deputy_governor
-    data['Theme'] = "Заявка на финансирование командировки"
-    data['DocContent'] = "Для командировки в {0}".format(funding_application.business_trip.location)
-    period = get_period(funding_application.business_trip.start_date, funding_application.business_trip.end_date)
-    morphed_period = ' '.join([get_morphed_word(word, 'gent') for word in period.split()])
-    data['DocContent'] += " {0} ".format(morphed_period)
-    data['DocContent'] += "прошу выдать денежные средства" \
-                          " в размере:\n 1. Транспортные расходы - {0} руб.\n" \
-                          "2. Проживание в гостинице - {1} руб.\n" \
-                          "3. Суточные - {2} суток - {3} руб.\n".format(funding_application.fare,
-                                                                        funding_application.hotel_cost,
-                                                                        funding_application.business_trip.hotel_days,
-                                                                        hotel_days_total)
-    data['Author'] = funding_application.business_trip.full_name_short()
-    data['AuthorPost'] = funding_application.business_trip.position
-    return data
-
-
-def fill_order_template(order):
-    data = dict(BlankTarget="", Adresat="", Theme="", DocContent="", AuthorPost="", Author="")
-    data['BlankTarget'] = "Распоряжение"
-    data['Theme'] = "О командировании %s" % order.full_name_genitive
-    data['DocContent'] = "Командировать {0}, {1},".format(order.full_name, order.position)
-    morphed_period = ' '.join([get_morphed_word(word, 'gent') for word in order.period.split()])
-    data['DocContent'] += " {0} ".format(morphed_period)
-    data['DocContent'] += "в {0} в связи ".format(order.location)
-    if order.purpose.lower().startswith('с'):
-        data['DocContent'] += "со {0}".format(order.purpose)
-    else:
-        data['DocContent'] += "с {0}".format(order.purpose)
-    data['Author'] = order.deputy_governor
-    data['AuthorPost'] = order.deputy_governor_position
-    return data
+def get_download_data(pk, document_type):
+    """Return the template data of the document of the trip, raises Http404."""
+    business_trip = get_object_or_404(BusinessTrip, id=pk)
+    if document_type.lower() not in list(map(lambda x: x[0].lower(), Document.DOCUMENT_CHOICES)):
+        raise Http404
+    try:
+        obj = get_document(business_trip, document_type)
+    except ObjectDoesNotExist:
+        raise Http404
+    if document_type.lower() == Document.ORDER.lower():
+        return fill_order_template(obj)
+    try:
+        return fill_funding_application_template(obj)
+    except IncompleteDocumentError:
+        raise Http404
+
+
+# Also sent by core.asgi.DownloadApplication, which serves this view on the event loop
+DOWNLOAD_HEADERS = {'Content-Type': 'application/pdf',
+                    'Content-disposition': 'attachment ; filename = {}'.format('test.pdf')}
 
 
 def download_link(request, pk, document_type):
-    business_trip = get_object_or_404(BusinessTrip, id=pk)
-    if document_type.lower() not in list(map(lambda x: x[0].lower(), Document.DOCUMENT_CHOICES)):
-        raise HttpResponse(status=404)
-    elif document_type.lower() == Document.ORDER.lower():
-        obj = get_object_or_404(Order, business_trip=business_trip)
-        data = fill_order_template(obj)
+    data = get_download_data(pk, document_type)
+    key = get_document_key(data)
+    etag = '"%s"' % key
+    response = get_conditional_response(request, etag=etag)
+    if response is None:
+        response = FileResponse(open_document(data)[1])
+    response['ETag'] = etag
+    for header, value in DOWNLOAD_HEADERS.items():
+        response[header] = value
+    return response
+
+
+def batch_download_view(request):
+    """Stream the documents of the trips given by ids=1,2,3 or by the queue and status of a tab as a ZIP archive.
+
+    document_type limits the archive to orders or funding applications.
+    """
+    document_types = [document_type for document_type, name in Document.DOCUMENT_CHOICES
+                      if document_type.lower() in request.GET.getlist('document_type')]
+    if 'ids' in request.GET:
+        try:
+            ids = sorted({int(pk) for pk in request.GET['ids'].split(',') if pk})
+        except ValueError:
+            return HttpResponseBadRequest('Неверный список заявок')
     else:
-        obj = get_object_or_404(ApplicationFunding, business_trip=business_trip)
-        data = fill_funding_application_template(obj)
-    stream = get_file_stream(data)
-    response = HttpResponse(stream)
-    response['Content-Type'] = 'application/pdf'
-    response['Content-disposition'] = 'attachment ; filename = {}'.format('test.pdf')
+        queue, status = get_queue_filter(request, get_tabs(get_request_permissions(request)))
+        business_trip_list = get_business_trip_list(queue, status).order_by('id')
+        ids = list(business_trip_list.values_list('id', flat=True)[:settings.BATCH_DOWNLOAD_MAX_TRIPS + 1])
+    if len(ids) > settings.BATCH_DOWNLOAD_MAX_TRIPS:
+        return HttpResponseBadRequest('Можно выгрузить не более %s заявок' % settings.BATCH_DOWNLOAD_MAX_TRIPS)
+    document_types = document_types or [Document.ORDER, Document.FUNDING_APPLICATION]
+    response = StreamingHttpResponse(stream_documents_zip(ids, document_types), content_type='application/zip')
+    response['Content-Disposition'] = 'attachment; filename="documents.zip"'
     return response
 
 
+def get_autocomplete_limit(request):
+    try:
+        limit = int(request.GET.get('limit', settings.AUTOCOMPLETE_LIMIT))
+    except ValueError:
+        limit = settings.AUTOCOMPLETE_LIMIT
+    return max(1, min(limit, settings.AUTOCOMPLETE_MAX_LIMIT))
+
+
+def autocomplete_response(request, index, min_count=0):
+    """Matches of q in the index. The results depend on the user, so they are cached privately."""
+    results = index.get().search(request.GET.get('q', ''), get_autocomplete_limit(request), min_count)
+    response = JsonResponse({'results': results})
+    patch_cache_control(response, private=True, max_age=settings.AUTOCOMPLETE_MAX_AGE)
+    patch_vary_headers(response, ['Cookie'])
+    return response
+
+
+def position_autocomplete_view(request):
+    """Positions having a word starting with each word of q, the most used first.
+
+    The anonymous form gets the positions of the table only, not the ones typed in the trips.
+    """
+    if not request.user.is_authenticated:
+        return autocomplete_response(request, listed_positions)
+    return autocomplete_response(request, positions)
+
+
+def suggestion_autocomplete_view(request, field):
+    """Past locations, purposes or transport types matching q like the positions, frequent and recent first.
+
+    The values come from the trips of other people, so the anonymous form only
+    gets the ones of at least AUTOCOMPLETE_PUBLIC_MIN_TRIPS trips.
+    """
+    if field not in suggestions:
+        raise Http404
+    if not request.user.is_authenticated:
+        return autocomplete_response(request, suggestions[field], settings.AUTOCOMPLETE_PUBLIC_MIN_TRIPS)
+    return autocomplete_response(request, suggestions[field])
+
+
+def metrics_view(request):
+    token = settings.METRICS_TOKEN
+    authorization = request.META.get('HTTP_AUTHORIZATION', '')
+    if not request.user.is_staff and not (token and constant_time_compare(authorization, 'Bearer ' + token)):
+        raise PermissionDenied
+    return HttpResponse(registry.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+def import_view(request):
+    if not request.user.is_staff:
+        raise PermissionDenied
+    context = {'is_authenticated': True}
+    upload = request.FILES.get('file')
+    if request.method == 'POST' and upload:
+        errors = []
+
+        def on_error(line_number, field, message):
+            if len(errors) < settings.IMPORT_REPORTED_ERRORS:
+                errors.append((line_number, field, message))
+
+        # Uploads above FILE_UPLOAD_MAX_MEMORY_SIZE are read from a temporary file line by line
+        result = import_business_trips(read_rows(upload, get_format(upload.name)), settings.IMPORT_BATCH_SIZE,
+                                       on_error=on_error)
+        context.update({'result': result, 'errors': errors})
+    return render(request, 'business_trip_import.html', context)
+
+
 class BusinessTripDetailedView(FormMixin, DetailView):
 
     model = BusinessTrip
@@ -0,0 +1,100 @@
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db import transaction
+
+from .documents import enqueue_render_job
+from .models import BusinessTripQueue, Departments
+from .notifications import send_email_by_queue
+from .trip_state import update_business_trip_state
+
+
+class WorkFlow:
+    """Moves a trip through the department graph defined by settings.WORKFLOW.
+
+    compile_workflow() sets INITIAL_DEPARTMENT, the list of next departments as
+    an attribute named after each department, and the SUCCESSORS and
+    PREDECESSORS maps. A department is entered once all its predecessors are
+    completed.
+    """
+    INITIAL_DEPARTMENT = None
+    SUCCESSORS = {}
+    PREDECESSORS = {}
+
+    def __init__(self, business_trip, current_queue):
+        self.business_trip = business_trip
+        self.current_queue = current_queue
+
+    def _get_completed_queues(self, queues):
+        return set(BusinessTripQueue.objects.filter(business_trip=self.business_trip,
+                                                    queue__in=queues,
+                                                    status=BusinessTripQueue.COMPLETED)
+                   .values_list('queue', flat=True))
+
+    def _all_previous_queues_completed(self, next_queue_name, completed_queues=None):
+        predecessors = self.PREDECESSORS[next_queue_name]
+        if completed_queues is None:
+            completed_queues = self._get_completed_queues(predecessors)
+        return predecessors <= completed_queues
+
+    @transaction.atomic
+    def compete_work(self):
+        self.current_queue.status = BusinessTripQueue.COMPLETED
+        self.current_queue.save()
+        next_queues = self.SUCCESSORS[self.current_queue.queue]
+        # One query covers the predecessors of every next queue
+        completed_queues = self._get_completed_queues(set().union(*[self.PREDECESSORS[q] for q in next_queues]))
+        for next_queue_name in next_queues:
+            if not self._all_previous_queues_completed(next_queue_name, completed_queues):
+                continue
+            BusinessTripQueue.objects.get_or_create(queue=next_queue_name,
+                                                    business_trip=self.business_trip)
+            send_email_by_queue(queue=next_queue_name, business_trip=self.business_trip)
+        update_business_trip_state(self.business_trip)
+        enqueue_render_job(self.business_trip, self.current_queue.queue)
+
+
+def validate_workflow(config):
+    """Raise ImproperlyConfigured unless the config is an acyclic graph of known departments."""
+    departments = Departments.get_departments()
+    transitions = config.get('TRANSITIONS', {})
+    initial = config.get('INITIAL_DEPARTMENT')
+    if initial not in departments:
+        raise ImproperlyConfigured('WORKFLOW: unknown initial department %r' % initial)
+    for department, next_departments in transitions.items():
+        unknown = [d for d in [department] + list(next_departments) if d not in departments]
+        if unknown:
+            raise ImproperlyConfigured('WORKFLOW: unknown departments %s' % ', '.join(map(repr, unknown)))
+    in_degree = {department: 0 for department in departments}
+    for next_departments in transitions.values():
+        for department in next_departments:
+            in_degree[department] += 1
+    if in_degree[initial]:
+        raise ImproperlyConfigured('WORKFLOW: the initial department %s has predecessors' % initial)
+    # Kahn's algorithm, the departments left unsorted are on a cycle
+    ready = [department for department, degree in in_degree.items() if not degree]
+    while ready:
+        department = ready.pop()
+        for next_department in transitions.get(department, []):
+            in_degree[next_department] -= 1
+            if not in_degree[next_department]:
+                ready.append(next_department)
+    cycle = sorted(department for department, degree in in_degree.items() if degree)
+    if cycle:
+        raise ImproperlyConfigured('WORKFLOW: cycle between %s' % ', '.join(cycle))
+
+
+def compile_workflow(workflow, config):
+    """Validate the config and build the successor and predecessor maps of the workflow once."""
+    validate_workflow(config)
+    departments = Departments.get_departments()
+    transitions = config['TRANSITIONS']
+    workflow.INITIAL_DEPARTMENT = config['INITIAL_DEPARTMENT']
+    workflow.SUCCESSORS = {department: tuple(transitions.get(department, [])) for department in departments}
+    workflow.PREDECESSORS = {department: frozenset(d for d in departments if department in workflow.SUCCESSORS[d])
+                             for department in departments}
+    for department in departments:
+        setattr(workflow, department, list(workflow.SUCCESSORS[department]))
+    return workflow
+
+
+compile_workflow(WorkFlow, settings.WORKFLOW)
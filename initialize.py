@@ -18,6 +18,10 @@ def add_initial_settings():
     ActiveSetting.objects.get_or_create(hotel_cost=400, daily_allowance=200)
 
 
+def add_initial_positions():
+    call_command('loaddata', 'positions')
+
+
 def clear_database():
     BusinessTrip.objects.all().delete()
 
@@ -28,6 +32,8 @@ if __name__ == '__main__':
 
     django.setup()
 
+    from django.core.management import call_command
     from core.models import BusinessTrip, ActiveSetting, DeputyGovernor
     clear_database()
     add_initial_deputy_governors()
+    add_initial_positions()
@@ -1,4 +1,5 @@
 import os
+import sys
 
 
 def populate():
@@ -53,6 +54,7 @@ def add_business_trip(second_name, first_name, patronymic, position, location, p
     initial_department_queue = BusinessTripQueue(business_trip=business_trip,
                                                  queue=WorkFlow.INITIAL_DEPARTMENT)
     initial_department_queue.save()
+    update_business_trip_state(business_trip)
 
 
 if __name__ == '__main__':
@@ -63,4 +65,10 @@ if __name__ == '__main__':
 
     from core.models import BusinessTrip, DeputyGovernor, BusinessTripQueue, PassportData
     from core.views import WorkFlow
-    populate()
+    from core.trip_state import update_business_trip_state
+    # python populate.py 10000 generates random trips in every state, see the generate_trips command
+    if len(sys.argv) > 1:
+        from core.generator import generate_business_trips
+        generate_business_trips(int(sys.argv[1]))
+    else:
+        populate()
@@ -6,192 +6,29 @@ $(document).ready(function(){
     $('.sidenav').sidenav({
         edge: 'right'
     });
-    $('input.autocomplete').autocomplete({
-        data: {
-            "заместитель руководителя Аппарата Губернатора и Правительства Челябинской области": null,
-            "помощник Губернатора Челябинской области": null,
-            "советник Губернатора Челябинской области": null,
-            "первый помощник первого заместителя Губернатора Челябинской области": null,
-            "первый помощник заместителя Губернатора Челябинской области": null,
-            "первый помощник заместителя Губернатора – руководителя Аппарата Губернатора и Правительства Челябинской области": null,
-            "первый помощник заместителя Губернатора Челябинской области – министра":null,
-            "помощник первого заместителя Губернатора Челябинской области": null,
-            "помощник заместителя Губернатора Челябинской области ": null,
-            "помощник заместителя Губернатора – руководителя Аппарата Губернатора и Правительства Челябинской области": null,
-            "помощник заместителя Губернатора Челябинской области – министра": null,
-            "заместитель руководителя Аппарата Губернатора и Правительства Челябинской области – начальник Управления государственной службы и противодействия коррупции Правительства Челябинской области": null,
-            "первый заместитель начальника Управления государственной службы и противодействия коррупции Правительства Челябинской области": null,
-            "главный специалист Управления государственной службы и противодействия коррупции Правительства Челябинской области": null,
-            "начальник отдела государственного управления и административной реформы Управления государственной службы и противодействия коррупции Правительства Челябинской области": null,
-            "консультант отдела государственного управления и административной реформы Управления государственной службы и противодействия коррупции Правительства Челябинской области": null,
-            "главный специалист отдела государственного управления и административной реформы Управления государственной службы и противодействия коррупции Правительства Челябинской области": null,
-            "заместитель начальника управления - начальник отдела по развитию персонала и проведению конкурсов Управления государственной службы и противодействия коррупции Правительства Челябинской области": null,
-            "заместитель начальника отдела по развитию персонала и проведению конкурсов Управления государственной службы и противодействия коррупции Правительства Челябинской области": null,
-            "консультант отдела по развитию персонала и проведению конкурсов Управления государственной службы и противодействия коррупции Правительства Челябинской области": null,
-            "заместитель начальника управления - начальник отдела по противодействию коррупции Управления государственной службы и противодействия коррупции Правительства Челябинской области": null,
-            "консультант отдела по противодействию коррупции Управления государственной службы и противодействия коррупции Правительства Челябинской области": null,
-            "главный специалист отдела по противодействию коррупции Управления государственной службы и противодействия коррупции Правительства Челябинской области": null,
-            "начальник отдела профилактики коррупционных правонарушений в органах местного самоуправления Челябинской области Управления государственной службы и противодействия коррупции Правительства Челябинской области": null,
-            "консультант отдела профилактики коррупционных правонарушений в органах местного самоуправления Челябинской области Управления государственной службы и противодействия коррупции Правительства Челябинской области": null,
-            "главный специалист отдела профилактики коррупционных правонарушений в органах местного самоуправления Челябинской области Управления государственной службы и противодействия коррупции Правительства Челябинской области": null,
-            "начальник отдела реализации социальных гарантий государственных гражданских служащих Управления государственной службы и противодействия коррупции Правительства Челябинской области": null,
-            "консультант отдела реализации социальных гарантий государственных гражданских служащих Управления государственной службы и противодействия коррупции Правительства Челябинской области": null,
-            "начальник отдела государственной гражданской службы и кадров Аппарата Губернатора и Правительства Челябинской области Управления государственной службы и противодействия коррупции Правительства Челябинской области": null,
-            "консультант отдела государственной гражданской службы и кадров Аппарата Губернатора и Правительства Челябинской области Управления государственной службы и противодействия коррупции Правительства Челябинской области": null,
-            "специалист по охране труда отдела государственной гражданской службы и кадров Аппарата Губернатора и Правительства Челябинской области Управления государственной службы и противодействия коррупции Правительства Челябинской области": null,
-            "начальник отдела наград Управления государственной службы и противодействия коррупции Правительства Челябинской области": null,
-            "консультант отдела наград Управления государственной службы и противодействия коррупции Правительства Челябинской области": null,
-            "документовед отдела наград Управления государственной службы и противодействия коррупции Правительства Челябинской области": null,
-            "начальник отдела организации муниципальной службы Управления государственной службы и противодействия коррупции Правительства Челябинской области": null,
-            "консультант отдела организации муниципальной службы Управления государственной службы и противодействия коррупции Правительства Челябинской области": null,
-            "начальник отдела методологии управления персоналом и оценки эффективности деятельности государственных гражданских служащих Управления государственной службы и противодействия коррупции Правительства Челябинской области": null,
-            "консультант отдела методологии управления персоналом и оценки эффективности деятельности государственных гражданских служащих Управления государственной службы и противодействия коррупции Правительства Челябинской области": null,
-            "главный специалист отдела методологии управления персоналом и оценки эффективности деятельности государственных гражданских служащих Управления государственной службы и противодействия коррупции Правительства Челябинской области": null,
-            "начальник Управления организационной и контрольной работы Правительства Челябинской области": null,
-            "первый заместитель начальника Управления организационной и контрольной работы Правительства Челябинской области": null,
-            "заместитель начальника Управления организационной и контрольной работы Правительства Челябинской области": null,
-            "заместитель начальника управления - начальник отдела организационной и плановой работы Управления организационной и контрольной работы Правительства Челябинской области": null,
-            "консультант отдела организационной и плановой работы Управления организационной и контрольной работы Правительства Челябинской области": null,
-            "главный специалист отдела организационной и плановой работы Управления организационной и контрольной работы Правительства Челябинской области": null,
-            "начальник отдела контрольно – аналитической работы Управления организационной и контрольной работы Правительства Челябинской области": null,
-            "консультант отдела контрольно – аналитической работы Управления организационной и контрольной работы Правительства Челябинской области": null,
-            "главный специалист отдела контрольно – аналитической работы Управления организационной и контрольной работы Правительства Челябинской области": null,
-            "начальник отдела проведения контрольных мероприятий Управления организационной и контрольной работы Правительства Челябинской области": null,
-            "консультант отдела проведения контрольных мероприятий Управления организационной и контрольной работы Правительства Челябинской области": null,
-            "главный специалист отдела проведения контрольных мероприятий Управления организационной и контрольной работы Правительства Челябинской области": null,
-            "начальник отдела организации документооборота Управления организационной и контрольной работы Правительства Челябинской области": null,
-            "консультант отдела организации документооборота Управления организационной и контрольной работы Правительства Челябинской области": null,
-            "главный специалист отдела организации документооборота Управления организационной и контрольной работы Правительства Челябинской области": null,
-            "ведущий специалист отдела организации документооборота Управления организационной и контрольной работы Правительства Челябинской области": null,
-            "специалист 1 разряда отдела организации документооборота Управления организационной и контрольной работы Правительства Челябинской области": null,
-            "документовед отдела организации документооборота Управления организационной и контрольной работы Правительства Челябинской области": null,
-            "начальник отдела по взаимодействию с федеральными и государственными органами Управления организационной и контрольной работы Правительства Челябинской области": null,
-            "консультант отдела по взаимодействию с федеральными и государственными органами Управления организационной и контрольной работы Правительства Челябинской области": null,
-            "главный специалист отдела по взаимодействию с федеральными и государственными органами Управления организационной и контрольной работы Правительства Челябинской области": null,
-            "ведущий специалист отдела по взаимодействию с федеральными и государственными органами Управления организационной и контрольной работы Правительства Челябинской области": null,
-            "документовед отдела по взаимодействию с федеральными и государственными органами Управления организационной и контрольной работы Правительства Челябинской области": null,
-            "заместитель руководителя Аппарата Губернатора и Правительства Челябинской области – начальник Государственно-правового управления Правительства Челябинской области": null,
-            "первый заместитель начальника Государственно-правового управления Правительства Челябинской области": null,
-            "главный специалист Государственно-правового управления Правительства Челябинской области": null,
-            "ведущий специалист Государственно-правового управления Правительства Челябинской области": null,
-            "начальник отдела правовой и антикоррупционной экспертизы, контроля за изменением норм федерального законодательства Государственно-правового управления Правительства Челябинской области": null,
-            "консультант отдела правовой и антикоррупционной экспертизы, контроля за изменением норм федерального законодательства Государственно-правового управления Правительства Челябинской области": null,
-            "главный специалист отдела правовой и антикоррупционной экспертизы, контроля за изменением норм федерального законодательства Государственно-правового управления Правительства Челябинской области": null,
-            "начальник отдела законотворческой работы Государственно-правового управления Правительства Челябинской области": null,
-            "консультант отдела законотворческой работы Государственно-правового управления Правительства Челябинской области": null,
-            "главный специалист отдела законотворческой работы Государственно-правового управления Правительства Челябинской области": null,
-            "начальник отдела договорной и судебной практики Государственно-правового управления Правительства Челябинской области": null,
-            "консультант отдела договорной и судебной практики Государственно-правового управления Правительства Челябинской области": null,
-            "заместитель начальника управления - начальник отдела экспертизы проектов административных регламентов органов исполнительной власти Челябинской области Государственно-правового управления Правительства Челябинской области": null,
-            "консультант отдела экспертизы проектов административных регламентов органов исполнительной власти Челябинской области Государственно-правового управления Правительства Челябинской области": null,
-            "главный специалист отдела экспертизы проектов административных регламентов органов исполнительной власти Челябинской области Государственно-правового управления Правительства Челябинской области": null,
-            "начальник отдела лингвистической экспертизы Государственно-правового управления Правительства Челябинской области": null,
-            "консультант отдела лингвистической экспертизы Государственно-правового управления Правительства Челябинской области": null,
-            "главный специалист отдела лингвистической экспертизы Государственно-правового управления Правительства Челябинской области": null,
-            "начальник отдела электронной регистрации документов и сопровождения полнотекстовой базы данных Государственно-правового управления Правительства Челябинской области": null,
-            "главный специалист электронной регистрации документов и сопровождения полнотекстовой базы данных Государственно-правового управления Правительства Челябинской области": null,
-            "ведущий специалист электронной регистрации документов и сопровождения полнотекстовой базы данных Государственно-правового управления Правительства Челябинской области": null,
-            "начальник отдела организационно-документационного обеспечения заседаний Правительства Челябинской области Государственно-правового управления Правительства Челябинской области": null,
-            "консультант отдела организационно-документационного обеспечения заседаний Правительства Челябинской области Государственно-правового управления Правительства Челябинской области": null,
-            "главный специалист отдела организационно-документационного обеспечения заседаний Правительства Челябинской области Государственно-правового управления Правительства Челябинской области": null,
-            "ведущий специалист отдела организационно-документационного обеспечения заседаний Правительства Челябинской области Государственно-правового управления Правительства Челябинской области": null,
-            "председатель комитета - главный бухгалтер бухгалтерской службы (комитета) Правительства Челябинской области": null,
-            "заместитель председателя комитета – заместитель главного бухгалтера бухгалтерской службы (комитета) Правительства Челябинской области": null,
-            "консультант бухгалтерской службы (комитета) Правительства Челябинской области": null,
-            "начальник Управления по работе с обращениями граждан Правительства Челябинской области": null,
-            "первый заместитель начальника Управления по работе с обращениями граждан Правительства Челябинской области": null,
-            "консультант Управления по работе с обращениями граждан Правительства Челябинской области": null,
-            "главный специалист Управления по работе с обращениями граждан Правительства Челябинской области": null,
-            "документовед Управления по работе с обращениями граждан Правительства Челябинской области": null,
-            "начальник отдела организации личного приема Управления по работе с обращениями граждан Правительства Челябинской области": null,
-            "консультант отдела организации личного приема Управления по работе с обращениями граждан Правительства Челябинской области": null,
-            "начальник отдела по работе с письменными обращениями Управления по работе с обращениями граждан Правительства Челябинской области": null,
-            "главный специалист отдела по работе с письменными обращениями Управления по работе с обращениями граждан Правительства Челябинской области": null,
-            "начальник Службы по защите государственной тайны Правительства Челябинской области": null,
-            "консультант Службы по защите государственной тайны Правительства Челябинской области": null,
-            "главный специалист Службы по защите государственной тайны Правительства Челябинской области": null,
-            "начальник Отдела государственных закупок Правительства Челябинской области": null,
-            "консультант Отдела государственных закупок Правительства Челябинской области": null,
-            "главный специалист Отдела государственных закупок Правительства Челябинской области": null,
-            "руководитель Секретариата Губернатора Челябинской области": null,
-            "заместитель руководителя Секретариата Губернатора Челябинской области": null,
-            "консультант Секретариата Губернатора Челябинской области": null,
-            "председатель Комитета мобилизационной работы Челябинской области": null,
-            "заместитель председателя Комитета мобилизационной работы Челябинской области": null,
-            "консультант Комитета мобилизационной работы Челябинской области": null,
-            "начальник отдела мобилизационной подготовки органов государственной власти и органов местного самоуправления Комитета мобилизационной работы Челябинской области": null,
-            "главный специалист отдела мобилизационной подготовки органов государственной власти и органов местного самоуправления Комитета мобилизационной работы Челябинской области": null,
-            "начальник отдела бронирования Комитета мобилизационной работы Челябинской области": null,
-            "главный специалист отдела бронирования Комитета мобилизационной работы Челябинской области": null,
-            "начальник отдела мобилизационной подготовки экономики Комитета мобилизационной работы Челябинской области": null,
-            "главный специалист отдела мобилизационной подготовки экономики Комитета мобилизационной работы Челябинской области": null,
-            "начальник отдела по взаимодействию с федеральными органами исполнительной власти Комитета мобилизационной работы Челябинской области": null,
-            "главный специалист отдела по взаимодействию с федеральными органами исполнительной власти Комитета мобилизационной работы Челябинской области": null,
-            "начальник Управления по внутренней политике Правительства Челябинской области": null,
-            "заместитель начальника Управления по внутренней политике Правительства Челябинской области": null,
-            "начальник отдела территориального развития Управления по внутренней политике Правительства Челябинской области": null,
-            "заместитель начальника отдела территориального развития Управления по внутренней политике Правительства Челябинской области": null,
-            "консультант отдела территориального развития Управления по внутренней политике Правительства Челябинской области": null,
-            "главный специалист отдела территориального развития Управления по внутренней политике Правительства Челябинской области": null,
-            "начальник отдела социально-политического мониторинга Управления по внутренней политике Правительства Челябинской области": null,
-            "консультант отдела социально-политического мониторинга Управления по внутренней политике Правительства Челябинской области": null,
-            "главный специалист отдела социально-политического мониторинга Управления по внутренней политике Правительства Челябинской области": null,
-            "начальник отдела информационно-аналитического обеспечения Управления по внутренней политике Правительства Челябинской области": null,
-            "главный специалист отдела информационно-аналитического обеспечения Управления по внутренней политике Правительства Челябинской области": null,
-            "начальник отдела по взаимодействию с политическими партиями и избирательными комиссиями Управления по внутренней политике Правительства Челябинской области": null,
-            "консультант отдела по взаимодействию с политическими партиями и избирательными комиссиями Управления по внутренней политике Правительства Челябинской области": null,
-            "главный специалист отдела по взаимодействию с политическими партиями и избирательными комиссиями Управления по внутренней политике Правительства Челябинской области": null,
-            "начальник Управления общественных связей Правительства Челябинской области": null,
-            "первый заместитель начальника Управления общественных связей Правительства Челябинской области": null,
-            "начальник отдела экспертно-аналитической работы Управления общественных связей Правительства Челябинской области": null,
-            "консультант отдела экспертно-аналитической работы Управления общественных связей Правительства Челябинской области": null,
-            "начальник отдела общественных коммуникаций Управления общественных связей Правительства Челябинской области": null,
-            "консультант отдела общественных коммуникаций Управления общественных связей Правительства Челябинской области": null,
-            "главный специалист отдела общественных коммуникаций Управления общественных связей Правительства Челябинской области": null,
-            "начальник отдела развития институтов гражданского общества Управления общественных связей Правительства Челябинской области": null,
-            "консультант отдела развития институтов гражданского общества Управления общественных связей Правительства Челябинской области": null,
-            "главный специалист отдела развития институтов гражданского общества Управления общественных связей Правительства Челябинской области": null,
-            "заместитель начальника управления - начальник отдела по реализации национальной политики Управления общественных связей Правительства Челябинской области": null,
-            "главный специалист управления - начальник отдела по реализации национальной политики Управления общественных связей Правительства Челябинской области": null,
-            "ведущий специалист управления - начальник отдела по реализации национальной политики Управления общественных связей Правительства Челябинской области": null,
-            "начальник отдела интерактивных проектов Управления общественных связей Правительства Челябинской области": null,
-            "консультант отдела интерактивных проектов Управления общественных связей Правительства Челябинской области": null,
-            "главный специалист отдела интерактивных проектов Управления общественных связей Правительства Челябинской области": null,
-            "ведущий специалист - эксперт отдела интерактивных проектов Управления общественных связей Правительства Челябинской области": null,
-            "начальник отдела медиадизайна Управления общественных связей Правительства Челябинской области": null,
-            "главный специалист отдела медиадизайна Управления общественных связей Правительства Челябинской области": null,
-            "специалист-эксперт отдела медиадизайна Управления общественных связей Правительства Челябинской области": null,
-            "начальник Управления пресс-службы и информации Правительства Челябинской области": null,
-            "пресс-секретарь Губернатора Челябинской области Управления пресс-службы и информации Правительства Челябинской области": null,
-            "заместитель начальника Управления пресс-службы и информации Правительства Челябинской области": null,
-            "начальник отдела информационного сопровождения Управления пресс-службы и информации Правительства Челябинской области": null,
-            "консультант отдела информационного сопровождения Управления пресс-службы и информации Правительства Челябинской области": null,
-            "главный специалист отдела информационного сопровождения Управления пресс-службы и информации Правительства Челябинской области": null,
-            "начальник отдела технического обеспечения Управления пресс-службы и информации Правительства Челябинской области": null,
-            "старший инженер отдела технического обеспечения Управления пресс-службы и информации Правительства Челябинской области": null,
-            "начальник отдела перспективного планирования Управления пресс-службы и информации Правительства Челябинской области": null,
-            "консультант отдела перспективного планирования Управления пресс-службы и информации Правительства Челябинской области": null,
-            "главный специалист отдела перспективного планирования Управления пресс-службы и информации Правительства Челябинской области": null,
-            "документовед отдела перспективного планирования Управления пресс-службы и информации Правительства Челябинской области": null,
-            "начальник отдела аналитики Управления пресс-службы и информации Правительства Челябинской области": null,
-            "консультант отдела аналитики Управления пресс-службы и информации Правительства Челябинской области": null,
-            "главный специалист отдела аналитики Управления пресс-службы и информации Правительства Челябинской области": null,
-            "начальник отдела оперативной информации Управления пресс-службы и информации Правительства Челябинской области": null,
-            "консультант отдела оперативной информации Управления пресс-службы и информации Правительства Челябинской области": null,
-            "главный специалист отдела оперативной информации Управления пресс-службы и информации Правительства Челябинской области": null,
-            "начальник Управления протокола Правительства Челябинской области": null,
-            "начальник отдела проведения официальных мероприятий Управления протокола Правительства Челябинской области": null,
-            "консультант отдела проведения официальных мероприятий Управления протокола Правительства Челябинской области": null,
-            "главный специалист отдела проведения официальных мероприятий Управления протокола Правительства Челябинской области": null,
-            "начальник отдела организации Управления протокола Правительства Челябинской области": null,
-            "консультант отдела организации Управления протокола Правительства Челябинской области": null,
-            "главный специалист отдела организации Управления протокола Правительства Челябинской области": null,
-            "начальник Отдела внутреннего финансового контроля и аудита Правительства Челябинской области": null,
-            "консультант Отдела внутреннего финансового контроля и аудита Правительства Челябинской области": null,
-            "начальник Отдела по обеспечению деятельности межведомственной комиссии по делам несовершеннолетних и защите их прав при Правительстве Челябинской области": null,
-            "консультант Отдела по обеспечению деятельности межведомственной комиссии по делам несовершеннолетних и защите их прав при Правительстве Челябинской области": null,
-            "главный специалист Отдела по обеспечению деятельности межведомственной комиссии по делам несовершеннолетних и защите их прав при Правительстве Челябинской области": null,
-          },
+    // Suggestions come from the server as the user types, data-autocomplete-url names the endpoint
+    $('input.autocomplete').each(function() {
+        var input = $(this);
+        var timer = null;
+        input.autocomplete({data: {}, limit: 10, sortFunction: false});
+        var instance = M.Autocomplete.getInstance(this);
+        input.on('input', function() {
+            clearTimeout(timer);
+            var query = input.val().trim();
+            if (!query) {
+                return;
+            }
+            timer = setTimeout(function() {
+                $.getJSON(input.data('autocomplete-url'), {q: query}, function(response) {
+                    var data = {};
+                    $.each(response.results, function(i, value) {
+                        data[value] = null;
+                    });
+                    instance.updateData(data);
+                    instance.open();
+                });
+            }, 150);
+        });
     });
     $('.collapsible').collapsible();
     $('select').formSelect();